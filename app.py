@@ -264,27 +264,28 @@ _Ví dụ: "Tôi bị sốt 39 độ từ 2 ngày nay, ho nhiều và đau đầ
             'timestamp': timestamp
         })
         
-        # Get AI response
-        with st.spinner("🔍 AI Doctor đang phân tích..."):
-            try:
-                ai_response = st.session_state.ai_handler.diagnose(user_input)
-                
-                st.session_state.messages.append({
-                    'role': 'assistant',
-                    'content': ai_response,
-                    'timestamp': timestamp
-                })
-                
-                logger.info("Successfully processed user input")
-                
-            except Exception as e:
-                logger.error(f"Error: {e}")
-                error_msg = f"❌ Lỗi: {str(e)}\n\n💡 Vui lòng thử lại sau."
-                st.session_state.messages.append({
-                    'role': 'assistant',
-                    'content': error_msg,
-                    'timestamp': timestamp
-                })
+        # Show the message now and stream the AI response below it
+        display_message('user', user_input, timestamp)
+        st.markdown("**🏥 AI Doctor:**")
+        try:
+            ai_response = st.write_stream(st.session_state.ai_handler.diagnose_stream(user_input))
+            
+            st.session_state.messages.append({
+                'role': 'assistant',
+                'content': ai_response,
+                'timestamp': timestamp
+            })
+            
+            logger.info("Successfully processed user input")
+            
+        except Exception as e:
+            logger.error(f"Error: {e}")
+            error_msg = f"❌ Lỗi: {str(e)}\n\n💡 Vui lòng thử lại sau."
+            st.session_state.messages.append({
+                'role': 'assistant',
+                'content': error_msg,
+                'timestamp': timestamp
+            })
         
         st.rerun()
     
@@ -13,9 +13,10 @@ from config import (
     APP_TITLE,
     APP_ICON,
     SIDEBAR_TITLE,
-    WARNING_MESSAGE
+    WARNING_MESSAGE,
+    KNOWLEDGE_HOT_RELOAD
 )
-from knowledge_manager import KnowledgeManager
+from knowledge_store import create_knowledge_manager
 from medical_llm_handler import MedicalLLMHandler
 from diagnosis_engine import DiagnosisEngine
 from utils import SessionManager, setup_logging, sanitize_user_input, format_timestamp
@@ -137,7 +138,10 @@ def initialize_system():
         logger.info("Initializing system components")
         
         # Initialize knowledge manager
-        knowledge_manager = KnowledgeManager()
+        knowledge_manager = create_knowledge_manager()
+        if KNOWLEDGE_HOT_RELOAD:
+            # Edits to the knowledge base go live without a restart
+            knowledge_manager.start_watching()
         
         # Initialize LLM handler
         llm_handler = MedicalLLMHandler()
@@ -162,6 +166,8 @@ def main():
     
     # Initialize session state
     SessionManager.initialize_session(st.session_state)
+    if 'ranking_state' not in st.session_state:
+        st.session_state.ranking_state = diagnosis_engine.create_ranking_state()
     
     # Header
     st.markdown(f"""
@@ -238,6 +244,7 @@ def main():
             st.session_state.messages = []
             st.session_state.chat_history = []
             st.session_state.user_symptoms = []
+            st.session_state.ranking_state = diagnosis_engine.create_ranking_state()
             st.rerun()
     
     # Main chat area
@@ -295,37 +302,45 @@ def main():
         # Get chat history
         chat_history = SessionManager.get_chat_history_text(st.session_state)
         
-        # Show processing
-        with st.spinner("🔍 Đang phân tích triệu chứng..."):
-            try:
-                # Analyze symptoms
+        # Show the message now, the diagnosis is streamed below it
+        st.markdown(f"""
+        <div class="user-message">
+            <b>👤 Bạn:</b><br>{user_input}
+        </div>
+        """, unsafe_allow_html=True)
+        
+        try:
+            # Analyze symptoms
+            with st.spinner("🔍 Đang phân tích triệu chứng..."):
                 analysis_result = diagnosis_engine.analyze_symptoms(
                     user_input=user_input,
                     chat_history=chat_history,
-                    accumulated_symptoms=st.session_state.user_symptoms
-                )
-                
-                # Update accumulated symptoms
-                st.session_state.user_symptoms = analysis_result['symptoms']
-                
-                # Generate diagnosis
-                diagnosis_text = diagnosis_engine.generate_diagnosis(
-                    user_input=user_input,
-                    analysis_result=analysis_result,
-                    chat_history=chat_history
+                    accumulated_symptoms=st.session_state.user_symptoms,
+                    ranking_state=st.session_state.ranking_state
                 )
-                
-                # Add AI response
-                SessionManager.add_message(st.session_state, 'assistant', diagnosis_text)
-                
-                logger.info("Successfully processed user input")
-                
-            except Exception as e:
-                logger.error(f"Error processing user input: {e}")
-                error_message = f"❌ Lỗi: {str(e)}\n\n💡 Vui lòng thử lại sau."
-                SessionManager.add_message(st.session_state, 'assistant', error_message)
+            
+            # Update accumulated symptoms
+            st.session_state.user_symptoms = analysis_result['symptoms']
+            
+            # Stream diagnosis
+            st.markdown("**🏥 AI Doctor:**")
+            diagnosis_text = st.write_stream(diagnosis_engine.generate_diagnosis_stream(
+                user_input=user_input,
+                analysis_result=analysis_result,
+                chat_history=chat_history
+            ))
+            
+            # Add AI response
+            SessionManager.add_message(st.session_state, 'assistant', diagnosis_text)
+            
+            logger.info("Successfully processed user input")
+            
+        except Exception as e:
+            logger.error(f"Error processing user input: {e}")
+            error_message = f"❌ Lỗi: {str(e)}\n\n💡 Vui lòng thử lại sau."
+            SessionManager.add_message(st.session_state, 'assistant', error_message)
         
-        # Rerun to show new messages
+        # Rerun to show new messages in the chat history
         st.rerun()
     
     # Footer
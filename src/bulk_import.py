@@ -0,0 +1,204 @@
+"""
+Bulk Import for AI Medical Diagnosis System
+Stream diseases or symptoms from JSONL/CSV into the knowledge base in batches
+
+Usage:
+    python src/bulk_import.py diseases catalogue.jsonl
+    python src/bulk_import.py symptoms formulary.csv --rejects rejects.jsonl
+"""
+import argparse
+import csv
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Iterable, Iterator, List, Dict, Optional, Tuple
+
+from config import (
+    KNOWLEDGE_BASE_PATH,
+    BULK_IMPORT_BATCH_SIZE,
+    BULK_IMPORT_LIST_SEPARATOR
+)
+from knowledge_manager import KnowledgeManager
+from utils import setup_logging, validate_disease_record, validate_symptom_record
+
+logger = setup_logging(__name__)
+
+# CSV columns holding lists, split on BULK_IMPORT_LIST_SEPARATOR
+LIST_FIELDS = ('symptoms', 'aliases')
+
+RECORD_KINDS = {
+    'diseases': validate_disease_record,
+    'symptoms': validate_symptom_record
+}
+
+
+def read_jsonl(path: Path) -> Iterator[Tuple[int, Optional[Dict], Optional[str]]]:
+    """Yield (line number, record, parse error) for each non-blank line"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                yield line_no, json.loads(line), None
+            except ValueError as e:
+                yield line_no, None, f"Invalid JSON: {e}"
+
+
+def read_csv(path: Path,
+             separator: str = BULK_IMPORT_LIST_SEPARATOR) -> Iterator[Tuple[int, Optional[Dict], Optional[str]]]:
+    """Yield (line number, record, None) for each CSV row
+
+    Empty cells are left out so optional fields stay absent, and list
+    columns are split on separator.
+    """
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            record = {}
+            for field, value in row.items():
+                if field is None or value is None or not value.strip():
+                    continue
+                value = value.strip()
+                if field in LIST_FIELDS:
+                    value = [item.strip() for item in value.split(separator) if item.strip()]
+                record[field] = value
+            yield reader.line_num, record, None
+
+
+def read_records(path: Path, file_format: Optional[str] = None):
+    """Stream records from a JSONL or CSV file (format from the extension by default)"""
+    path = Path(path)
+    file_format = file_format or ('csv' if path.suffix.lower() == '.csv' else 'jsonl')
+    if file_format == 'csv':
+        return read_csv(path)
+    if file_format == 'jsonl':
+        return read_jsonl(path)
+    raise ValueError(f"Unsupported import format: {file_format}")
+
+
+class BulkImporter:
+    """Validate, deduplicate and commit records to a knowledge base in batches"""
+
+    def __init__(self,
+                 knowledge_manager: KnowledgeManager,
+                 kind: str,
+                 batch_size: int = BULK_IMPORT_BATCH_SIZE):
+        """Import records of kind 'diseases' or 'symptoms'"""
+        if kind not in RECORD_KINDS:
+            raise ValueError(f"Unknown record kind: {kind}")
+        self.knowledge_manager = knowledge_manager
+        self.kind = kind
+        self.batch_size = batch_size
+        self.validate = RECORD_KINDS[kind]
+
+    def _exists(self, record_id: str) -> bool:
+        if self.kind == 'diseases':
+            return self.knowledge_manager.get_disease_by_id(record_id) is not None
+        return self.knowledge_manager.get_symptom_by_id(record_id) is not None
+
+    def _commit(self, batch: List[Dict]) -> int:
+        if self.kind == 'diseases':
+            return self.knowledge_manager.add_diseases(batch)
+        return self.knowledge_manager.add_symptoms(batch)
+
+    def import_records(self, rows: Iterable[Tuple[int, Optional[Dict], Optional[str]]]) -> Dict:
+        """Import (line number, record, parse error) rows, committing once per batch
+
+        Returns a summary with counts, the batches committed, elapsed seconds
+        and a list of rejects ({'line', 'id', 'reason'}).
+        """
+        started = time.perf_counter()
+        summary = {'kind': self.kind, 'read': 0, 'imported': 0, 'batches': 0, 'rejects': []}
+        seen = set()
+        batch = []
+
+        def reject(line_no: int, record: Optional[Dict], reason: str) -> None:
+            record_id = record.get('id') if isinstance(record, dict) else None
+            summary['rejects'].append({'line': line_no, 'id': record_id, 'reason': reason})
+
+        def flush() -> None:
+            added = self._commit(batch)
+            summary['imported'] += added
+            summary['batches'] += 1
+            if added != len(batch):
+                # Only possible if the base changed concurrently
+                logger.warning(f"Batch committed {added} of {len(batch)} records")
+            batch.clear()
+
+        for line_no, record, error in rows:
+            summary['read'] += 1
+            error = error or self.validate(record)
+            if error:
+                reject(line_no, record, error)
+                continue
+
+            record_id = record['id']
+            if record_id in seen:
+                reject(line_no, record, "Duplicate id in input")
+                continue
+            if self._exists(record_id):
+                reject(line_no, record, "Id already in knowledge base")
+                continue
+
+            seen.add(record_id)
+            batch.append(record)
+            if len(batch) >= self.batch_size:
+                flush()
+
+        if batch:
+            flush()
+
+        summary['rejected'] = len(summary['rejects'])
+        summary['seconds'] = time.perf_counter() - started
+        logger.info(
+            f"Imported {summary['imported']} of {summary['read']} {self.kind} "
+            f"in {summary['batches']} batches ({summary['rejected']} rejected, "
+            f"{summary['seconds']:.2f}s)"
+        )
+        return summary
+
+    def import_file(self, path: Path, file_format: Optional[str] = None) -> Dict:
+        """Import a JSONL or CSV file"""
+        return self.import_records(read_records(path, file_format))
+
+
+def main(argv: List[str] = None) -> int:
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Bulk import diseases or symptoms into the knowledge base")
+    parser.add_argument('kind', choices=sorted(RECORD_KINDS))
+    parser.add_argument('path', type=Path, help="JSONL or CSV file")
+    parser.add_argument('--format', choices=['jsonl', 'csv'], help="default: from the file extension")
+    parser.add_argument('--knowledge-base', type=Path, default=KNOWLEDGE_BASE_PATH)
+    parser.add_argument('--batch-size', type=int, default=BULK_IMPORT_BATCH_SIZE)
+    parser.add_argument('--rejects', type=Path, help="write rejected rows to this JSONL file")
+    parser.add_argument('--no-compact', action='store_true', help="leave the imported records in the journal")
+    args = parser.parse_args(argv)
+
+    knowledge_manager = KnowledgeManager(args.knowledge_base)
+    importer = BulkImporter(knowledge_manager, args.kind, args.batch_size)
+    summary = importer.import_file(args.path, args.format)
+
+    if not args.no_compact:
+        knowledge_manager.wait_for_compaction()
+        knowledge_manager.compact()
+    knowledge_manager.close()
+
+    if args.rejects:
+        with open(args.rejects, 'w', encoding='utf-8') as f:
+            for row in summary['rejects']:
+                f.write(json.dumps(row, ensure_ascii=False) + '\n')
+
+    print(
+        f"{summary['imported']} imported, {summary['rejected']} rejected "
+        f"of {summary['read']} read in {summary['seconds']:.2f}s"
+    )
+    return 0 if not summary['rejected'] else 1
+
+
+# Export
+__all__ = ['BulkImporter', 'read_records', 'read_jsonl', 'read_csv', 'main']
+
+
+if __name__ == "__main__":
+    sys.exit(main())
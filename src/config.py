@@ -6,6 +6,10 @@ from pathlib import Path
 
 # Project paths
 PROJECT_ROOT = Path(__file__).parent.parent
+DATA_DIR = PROJECT_ROOT / "data"
+KNOWLEDGE_BASE_PATH = DATA_DIR / "knowledge_base.json"
+KNOWLEDGE_DB_PATH = DATA_DIR / "knowledge_base.sqlite3"
+KNOWLEDGE_SNAPSHOT_PATH = DATA_DIR / "knowledge_base.snapshot"
 OUTPUTS_DIR = PROJECT_ROOT / "outputs"
 LOGS_DIR = OUTPUTS_DIR / "logs"
 
@@ -18,6 +22,80 @@ LLM_MODEL = "gemini-2.0-flash"
 LLM_TEMPERATURE = 0.7
 LLM_MAX_TOKENS = 2048
 
+# Upper bound on model requests in flight at once from the async handlers,
+# shared by all handlers running on the same event loop
+LLM_MAX_CONCURRENT_REQUESTS = 64
+
+# Diagnosis report: independent LLM stages (severity, treatment) run at the
+# same time on a thread pool shared by all engines, each with its own deadline
+# in seconds; a stage that fails or runs late is left out of the report
+REPORT_MAX_WORKERS = 8
+REPORT_STAGE_TIMEOUT = 30.0
+
+# Cache of model responses for deterministic prompts (follow-up questions,
+# severity, treatment): in-memory LRU of this many entries in front of a
+# SQLite file shared by worker processes; entries expire after the TTL
+LLM_CACHE_ENABLED = True
+LLM_CACHE_MAX_ENTRIES = 1024
+LLM_CACHE_TTL = 7 * 24 * 3600
+LLM_CACHE_PATH = OUTPUTS_DIR / "cache" / "llm_responses.sqlite3"
+
+# Opt-in reuse of first-turn diagnoses for near-duplicate messages: same set
+# of extracted symptoms and hashed n-gram text vectors with cosine similarity
+# of at least the threshold (numpy, in memory, oldest entries replaced).
+# Only messages made of symptom mentions and filler words are reused; the
+# similarity cannot tell "tôi không bị sốt" or "con tôi 2 tuổi" apart
+SEMANTIC_CACHE_ENABLED = False
+SEMANTIC_CACHE_THRESHOLD = 0.6
+SEMANTIC_CACHE_MAX_ENTRIES = 2048
+SEMANTIC_CACHE_DIM = 1024
+
+# Diagnosis Engine Configuration
+TOP_K_DISEASES = 5
+CONFIDENCE_THRESHOLD = 0.6
+MIN_SYMPTOMS_FOR_DIAGNOSIS = 3
+
+# Disease scoring backend: 'index' (inverted index) or 'matrix' (numpy)
+SCORING_BACKEND = 'index'
+
+# Typo-tolerant symptom matching (opt-in: may confuse close words)
+SYMPTOM_FUZZY_MATCHING = False
+FUZZY_MAX_EDIT_DISTANCE = 2
+FUZZY_MIN_CONFIDENCE = 0.8
+FUZZY_MIN_LENGTH = 4
+
+# Knowledge base write-ahead journal: fsync after this many appends or on
+# the first append after this many seconds; compact into the JSON file in
+# the background once this many entries have accumulated
+JOURNAL_FSYNC_EVERY = 64
+JOURNAL_FSYNC_INTERVAL = 1.0
+JOURNAL_COMPACT_THRESHOLD = 1000
+
+# Knowledge base storage backend: 'json' (file + journal), 'sqlite'
+# (KNOWLEDGE_DB_PATH, migrated from the JSON file on first use) or 'snapshot'
+# (read-only KNOWLEDGE_SNAPSHOT_PATH, recompiled when the JSON file changes)
+KNOWLEDGE_BACKEND = 'json'
+# Reload the knowledge base in the background when its file changes on disk
+KNOWLEDGE_HOT_RELOAD = True
+KNOWLEDGE_RELOAD_INTERVAL = 2.0
+# Check the payload checksum when mapping a snapshot. This reads the whole
+# file on every load, so it is off by default; `kb_snapshot.py verify`
+# checks a snapshot on demand (the header checksum is always checked)
+KNOWLEDGE_SNAPSHOT_VERIFY = False
+
+# Bulk import (src/bulk_import.py): records committed per journal batch and
+# the separator for list columns (symptoms, aliases) in CSV files
+BULK_IMPORT_BATCH_SIZE = 1000
+BULK_IMPORT_LIST_SEPARATOR = ';'
+
+# Knowledge context sent with each diagnosis prompt: 'relevant' (candidate
+# diseases only, compact table under a token budget) or 'full' (whole base)
+KNOWLEDGE_CONTEXT_MODE = 'relevant'
+CONTEXT_TOP_DISEASES = 5
+CONTEXT_TOKEN_BUDGET = 1200
+# Rough characters per token for Vietnamese text, used for budgeting
+CHARS_PER_TOKEN = 3
+
 # System Prompts
 SYSTEM_PROMPT = """Bạn là AI Doctor, một bác sĩ AI chuyên nghiệp được hỗ trợ bởi Google Gemini AI.
 
@@ -77,6 +155,23 @@ Lưu ý đặc biệt:
 - Luôn cân nhắc chẩn đoán phân biệt
 """
 
+# Prompt used by MedicalLLMHandler.generate_diagnosis
+DIAGNOSIS_PROMPT_TEMPLATE = """=== KIẾN THỨC Y KHOA THAM KHẢO ===
+{knowledge_context}
+
+=== LỊCH SỬ HỘI THOẠI ===
+{chat_history}
+
+=== THÔNG TIN TRIỆU CHỨNG ===
+{symptoms_info}
+
+=== TIN NHẮN CỦA NGƯỜI DÙNG ===
+{user_input}
+
+Hãy phân tích triệu chứng, đưa ra chẩn đoán sơ bộ (kèm độ tin cậy), khuyến nghị
+điều trị và cảnh báo nếu cần, theo đúng cấu trúc đã quy định.
+"""
+
 # UI Configuration
 APP_TITLE = "🏥 AI Medical Diagnosis System"
 APP_ICON = "🏥"
@@ -103,10 +198,31 @@ LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 LOG_LEVEL = 'INFO'
 LOG_FILE = LOGS_DIR / 'medical_diagnosis.log'
 
-# Emergency keywords for quick detection
+# Emergency keywords for quick detection, grouped by triage tier
+# critical/urgent trigger an emergency warning, watch is only reported
+TRIAGE_LEVELS = ['critical', 'urgent', 'watch']
+EMERGENCY_LEVELS = ['critical', 'urgent']
+
+EMERGENCY_KEYWORD_TIERS = {
+    'critical': [
+        'khó thở', 'đau ngực', 'bất tỉnh', 'co giật',
+        'chảy máu nhiều', 'mất ý thức', 'sốc', 'ngộ độc',
+        'đột quỵ', 'nhồi máu'
+    ],
+    'urgent': [
+        'đau đầu dữ dội', 'liệt', 'tê bì',
+        'đau bụng dữ dội'
+    ],
+    # Not emergencies: 'sốt cao' is also the name of the ordinary fever
+    # symptoms of the knowledge base, which must still get a diagnosis
+    'watch': [
+        'sốt cao', 'sốt kéo dài', 'nôn liên tục', 'tiêu chảy kéo dài',
+        'mất nước', 'sụt cân nhanh'
+    ]
+}
+
 EMERGENCY_KEYWORDS = [
-    'khó thở', 'đau ngực', 'bất tỉnh', 'co giật', 
-    'chảy máu nhiều', 'đau đầu dữ dội', 'liệt',
-    'mất ý thức', 'sốc', 'ngộ độc', 'tê bì',
-    'đột quỵ', 'nhồi máu', 'sốt cao', 'đau bụng dữ dội'
+    keyword
+    for level in EMERGENCY_LEVELS
+    for keyword in EMERGENCY_KEYWORD_TIERS[level]
 ]
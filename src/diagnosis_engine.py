@@ -2,61 +2,100 @@
 Diagnosis Engine for AI Medical Diagnosis System
 Core logic for analyzing symptoms and generating diagnosis
 """
+import asyncio
 import logging
-from typing import List, Dict, Tuple, Optional
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, Callable, List, Dict, Iterator, Tuple, Optional
 
-from config import TOP_K_DISEASES, CONFIDENCE_THRESHOLD, MIN_SYMPTOMS_FOR_DIAGNOSIS
+from config import (
+    TOP_K_DISEASES,
+    CONFIDENCE_THRESHOLD,
+    KNOWLEDGE_CONTEXT_MODE,
+    CONTEXT_TOP_DISEASES,
+    MIN_SYMPTOMS_FOR_DIAGNOSIS,
+    SCORING_BACKEND,
+    REPORT_MAX_WORKERS,
+    REPORT_STAGE_TIMEOUT,
+    SYMPTOM_FUZZY_MATCHING
+)
+from disease_index import RankingState
 from knowledge_manager import KnowledgeManager
 from medical_llm_handler import MedicalLLMHandler
+from records import AnalysisResult
+from semantic_cache import reusable_message
+from triage import format_emergency_warning
 from utils import (
     setup_logging,
-    extract_symptoms_from_text,
-    rank_diseases_by_symptoms,
     format_disease_info
 )
 
 logger = setup_logging(__name__)
 
+# Runs the LLM stages of diagnosis reports; threads start on first use
+_REPORT_EXECUTOR = ThreadPoolExecutor(max_workers=REPORT_MAX_WORKERS, thread_name_prefix='diagnosis-report')
+
+
+def _record_finish(finished: Dict, stage: str, function: Callable, *args, **kwargs) -> Any:
+    """Result of function(*args, **kwargs), noting in finished when it returned or raised"""
+    try:
+        return function(*args, **kwargs)
+    finally:
+        finished[stage] = time.perf_counter()
+
 
 class DiagnosisEngine:
     """Core diagnosis engine"""
     
     def __init__(self,
                  knowledge_manager: KnowledgeManager,
-                 llm_handler: MedicalLLMHandler):
-        """Initialize diagnosis engine"""
+                 llm_handler: MedicalLLMHandler,
+                 scoring_backend: str = SCORING_BACKEND,
+                 executor: Optional[Executor] = None):
+        """Initialize diagnosis engine (report stages use the shared pool by default)"""
+        if scoring_backend not in ('index', 'matrix'):
+            raise ValueError(f"Unknown scoring backend: {scoring_backend}")
         self.knowledge_manager = knowledge_manager
         self.llm_handler = llm_handler
+        self.scoring_backend = scoring_backend
+        self.executor = _REPORT_EXECUTOR if executor is None else executor
         logger.info("Diagnosis engine initialized")
     
-    def extract_symptoms_from_input(self, user_input: str) -> List[str]:
-        """Extract symptoms from user input"""
+    def extract_symptom_ids(self, user_input: str) -> List[int]:
+        """Extract symptoms from user input as interned symptom ids"""
         try:
-            # Get all known symptom names
-            all_symptoms = [s['name'] for s in self.knowledge_manager.get_all_symptoms()]
+            # Extractor is compiled once per knowledge base version
+            extractor = self.knowledge_manager.get_symptom_extractor()
+            matches = extractor.extract(user_input, fuzzy=SYMPTOM_FUZZY_MATCHING)
+            symptom_ids = self.knowledge_manager.encode_symptoms([m['symptom_id'] for m in matches])
             
-            # Extract mentioned symptoms
-            found_symptoms = extract_symptoms_from_text(user_input, all_symptoms)
-            
-            logger.info(f"Extracted {len(found_symptoms)} symptoms from input")
-            return found_symptoms
+            logger.info(f"Extracted {len(symptom_ids)} symptoms from input")
+            return symptom_ids
             
         except Exception as e:
             logger.error(f"Error extracting symptoms: {e}")
             return []
     
+    def extract_symptoms_from_input(self, user_input: str) -> List[str]:
+        """Extract symptoms from user input"""
+        return self.knowledge_manager.symptom_names(self.extract_symptom_ids(user_input))
+    
     def match_diseases(self, symptoms: List[str], top_k: int = TOP_K_DISEASES) -> List[Dict]:
-        """Match diseases based on symptoms"""
+        """Match diseases based on symptoms (ids, names or aliases)"""
+        return self.match_symptom_ids(self.knowledge_manager.encode_symptoms(symptoms), top_k)
+    
+    def match_symptom_ids(self, symptom_ids: List[int], top_k: int = TOP_K_DISEASES) -> List[Dict]:
+        """Match diseases based on interned symptom ids"""
         try:
-            if not symptoms:
+            if not symptom_ids:
                 logger.warning("No symptoms provided for matching")
                 return []
             
-            # Get all diseases
-            diseases = self.knowledge_manager.get_all_diseases()
-            
-            # Rank diseases by symptom matching
-            ranked_diseases = rank_diseases_by_symptoms(symptoms, diseases, top_k)
+            if self.scoring_backend == 'matrix':
+                ranked_diseases = self.knowledge_manager.rank_diseases_batch_by_ids([symptom_ids], top_k)[0]
+            else:
+                # Rank only candidate diseases through the symptom index
+                ranked_diseases = self.knowledge_manager.rank_diseases_by_ids(symptom_ids, top_k)
             
             logger.info(f"Matched {len(ranked_diseases)} diseases")
             return ranked_diseases
@@ -65,6 +104,16 @@ class DiagnosisEngine:
             logger.error(f"Error matching diseases: {e}")
             return []
     
+    def rank_batch(self,
+                   symptom_sets: List[List[str]],
+                   top_k: int = TOP_K_DISEASES) -> List[List[Dict]]:
+        """Rank diseases for many cases at once (e.g. re-scoring history)"""
+        try:
+            return self.knowledge_manager.rank_diseases_batch(symptom_sets, top_k)
+        except Exception as e:
+            logger.error(f"Error ranking batch: {e}")
+            return [[] for _ in symptom_sets]
+    
     def calculate_confidence(self, matched_disease: Dict) -> float:
         """Calculate confidence score for a diagnosis"""
         try:
@@ -85,30 +134,57 @@ class DiagnosisEngine:
             logger.error(f"Error calculating confidence: {e}")
             return 0.0
     
+    def create_ranking_state(self, symptoms: List[str] = None) -> RankingState:
+        """Create a per-session ranking state to pass to analyze_symptoms
+        
+        Under the 'matrix' backend the state keeps no per-disease counts,
+        since turns are ranked on the incidence matrix.
+        """
+        return self.knowledge_manager.new_ranking_state(symptoms, track_counts=self.scoring_backend != 'matrix')
+    
     def analyze_symptoms(self, 
                         user_input: str,
                         chat_history: str = "",
-                        accumulated_symptoms: List[str] = None) -> Dict:
-        """Analyze symptoms and provide diagnosis"""
+                        accumulated_symptoms: List[str] = None,
+                        ranking_state: RankingState = None) -> Dict:
+        """Analyze symptoms and provide diagnosis
+        
+        With a ranking_state (see create_ranking_state) the session's disease
+        scores are updated incrementally with only the newly found symptoms;
+        the state is rebuilt if the knowledge base changed since its creation.
+        With the 'matrix' scoring backend every turn is ranked on the incidence
+        matrix from the session's accumulated symptoms.
+        """
         try:
             logger.info("Starting symptom analysis")
-            
-            # Extract symptoms from current input
-            new_symptoms = self.extract_symptoms_from_input(user_input)
-            
-            # Combine with accumulated symptoms
-            if accumulated_symptoms:
-                all_symptoms = list(set(accumulated_symptoms + new_symptoms))
+            km = self.knowledge_manager
+            
+            # Extract symptoms from current input; matching runs on interned ids
+            new_ids = self.extract_symptom_ids(user_input)
+            accumulated_ids = km.encode_symptoms(accumulated_symptoms or [])
+            
+            if ranking_state is not None:
+                km.refresh_ranking_state(ranking_state)
+                if not len(ranking_state) and accumulated_ids:
+                    ranking_state.add_symptom_ids(accumulated_ids)
+                
+                ranking_state.add_symptom_ids(new_ids)
+                all_ids = list(ranking_state.symptom_ids)
+                if self.scoring_backend == 'matrix' or not ranking_state.track_counts:
+                    matched_diseases = self.match_symptom_ids(all_ids)
+                else:
+                    matched_diseases = ranking_state.rank(TOP_K_DISEASES)
             else:
-                all_symptoms = new_symptoms
+                # Combine with accumulated symptoms, keeping first-mention order
+                all_ids = list(dict.fromkeys(accumulated_ids + new_ids))
+                matched_diseases = self.match_symptom_ids(all_ids)
             
+            all_symptoms = km.symptom_names(all_ids)
+            new_symptoms = km.symptom_names(new_ids)
             logger.info(f"Total symptoms: {len(all_symptoms)}")
             
-            # Check for emergency symptoms
-            emergency_warning = self.llm_handler.check_emergency_symptoms(all_symptoms)
-            
-            # Match diseases
-            matched_diseases = self.match_diseases(all_symptoms)
+            # Check for emergency symptoms from per-symptom precomputed tiers
+            emergency_warning = format_emergency_warning(km.triage_symptom_ids(all_ids))
             
             # Calculate confidence for top disease
             top_confidence = 0.0
@@ -122,25 +198,78 @@ class DiagnosisEngine:
                 top_confidence >= CONFIDENCE_THRESHOLD
             )
             
-            return {
-                'symptoms': all_symptoms,
-                'new_symptoms': new_symptoms,
-                'matched_diseases': matched_diseases,
-                'top_confidence': top_confidence,
-                'has_enough_info': has_enough_info,
-                'emergency_warning': emergency_warning
-            }
+            return AnalysisResult(
+                symptoms=all_symptoms,
+                symptom_ids=km.decode_symptoms(all_ids),
+                new_symptoms=new_symptoms,
+                matched_diseases=matched_diseases,
+                top_confidence=top_confidence,
+                has_enough_info=bool(has_enough_info),
+                emergency_warning=emergency_warning
+            )
             
         except Exception as e:
             logger.error(f"Error analyzing symptoms: {e}")
-            return {
-                'symptoms': [],
-                'new_symptoms': [],
-                'matched_diseases': [],
-                'top_confidence': 0.0,
-                'has_enough_info': False,
-                'emergency_warning': None
-            }
+            return AnalysisResult()
+    
+    def _cache_symptom_ids(self, user_input: str, analysis_result: Dict, chat_history: str) -> List[str]:
+        """Symptom ids keying the LLM handler's semantic cache, empty if the answer must not be reused
+        
+        Only an opening message made of symptom mentions and filler words
+        qualifies; anything else could qualify the symptoms.
+        """
+        if chat_history or getattr(self.llm_handler, 'semantic_cache', None) is None:
+            return []
+        try:
+            extractor = self.knowledge_manager.get_symptom_extractor()
+            if not reusable_message(user_input, extractor.extract(user_input, fuzzy=SYMPTOM_FUZZY_MATCHING)):
+                return []
+        except Exception as e:
+            logger.error(f"Error checking message for the semantic cache: {e}")
+            return []
+        return analysis_result.get('symptom_ids', [])
+    
+    def _diagnosis_request(self,
+                           user_input: str,
+                           analysis_result: Dict,
+                           chat_history: str = "") -> Dict:
+        """Keyword arguments for the LLM handler's generate_diagnosis"""
+        # Build symptoms info
+        symptoms = analysis_result.get('symptoms', [])
+        symptoms_info = "**Triệu chứng đã xác định:**\n"
+        if symptoms:
+            symptoms_info += "\n".join([f"- {s}" for s in symptoms])
+        else:
+            symptoms_info += "Chưa xác định được triệu chứng cụ thể"
+        
+        # Add matched diseases info
+        matched_diseases = analysis_result.get('matched_diseases', [])
+        if matched_diseases:
+            symptoms_info += "\n\n**Các bệnh có khả năng cao:**\n"
+            for i, disease_info in enumerate(matched_diseases[:3], 1):
+                disease = disease_info['disease']
+                score = disease_info.get('score', 0)
+                confidence = self.calculate_confidence(disease_info)
+                symptoms_info += f"{i}. {disease['name']} (Độ khớp: {score*100:.0f}%, Độ tin cậy: {confidence*100:.0f}%)\n"
+                symptoms_info += self.knowledge_manager.get_disease_description(disease)
+        
+        # Get knowledge context, pruned to the candidate diseases
+        if KNOWLEDGE_CONTEXT_MODE == 'relevant':
+            knowledge_context = self.knowledge_manager.build_relevant_context(
+                [d['disease'] for d in matched_diseases[:CONTEXT_TOP_DISEASES]],
+                analysis_result.get('symptom_ids', [])
+            )
+        else:
+            knowledge_context = self.knowledge_manager.build_knowledge_context()
+        
+        return {
+            'user_input': user_input,
+            'knowledge_context': knowledge_context,
+            'chat_history': chat_history,
+            'symptoms_info': symptoms_info,
+            'symptom_ids': self._cache_symptom_ids(user_input, analysis_result, chat_history),
+            'knowledge_version': self.knowledge_manager.revision
+        }
     
     def generate_diagnosis(self,
                           user_input: str,
@@ -150,28 +279,6 @@ class DiagnosisEngine:
         try:
             logger.info("Generating diagnosis")
             
-            # Build symptoms info
-            symptoms = analysis_result.get('symptoms', [])
-            symptoms_info = "**Triệu chứng đã xác định:**\n"
-            if symptoms:
-                symptoms_info += "\n".join([f"- {s}" for s in symptoms])
-            else:
-                symptoms_info += "Chưa xác định được triệu chứng cụ thể"
-            
-            # Add matched diseases info
-            matched_diseases = analysis_result.get('matched_diseases', [])
-            if matched_diseases:
-                symptoms_info += "\n\n**Các bệnh có khả năng cao:**\n"
-                for i, disease_info in enumerate(matched_diseases[:3], 1):
-                    disease = disease_info['disease']
-                    score = disease_info.get('score', 0)
-                    confidence = self.calculate_confidence(disease_info)
-                    symptoms_info += f"{i}. {disease['name']} (Độ khớp: {score*100:.0f}%, Độ tin cậy: {confidence*100:.0f}%)\n"
-                    symptoms_info += f"   - Mô tả: {disease.get('description', 'N/A')}\n"
-            
-            # Get knowledge context
-            knowledge_context = self.knowledge_manager.build_knowledge_context()
-            
             # Check for emergency
             emergency_warning = analysis_result.get('emergency_warning')
             if emergency_warning:
@@ -179,17 +286,76 @@ class DiagnosisEngine:
             
             # Generate diagnosis response
             diagnosis_text = self.llm_handler.generate_diagnosis(
-                user_input=user_input,
-                knowledge_context=knowledge_context,
-                chat_history=chat_history,
-                symptoms_info=symptoms_info
+                **self._diagnosis_request(user_input, analysis_result, chat_history)
             )
             
             # Format response
             formatted_response = self.llm_handler.format_medical_response(
                 diagnosis_text=diagnosis_text,
                 confidence=analysis_result.get('top_confidence'),
-                matched_diseases=matched_diseases
+                matched_diseases=analysis_result.get('matched_diseases', [])
+            )
+            
+            logger.info("Successfully generated diagnosis")
+            return formatted_response
+            
+        except Exception as e:
+            logger.error(f"Error generating diagnosis: {e}")
+            return f"❌ Lỗi khi tạo chẩn đoán: {str(e)}"
+    
+    def generate_diagnosis_stream(self,
+                                  user_input: str,
+                                  analysis_result: Dict,
+                                  chat_history: str = "") -> Iterator[str]:
+        """Streaming variant of generate_diagnosis
+        
+        Yields the LLM text as it arrives, then the confidence and matched
+        diseases section added by format_medical_response.
+        """
+        try:
+            logger.info("Generating streamed diagnosis")
+            
+            # Check for emergency
+            emergency_warning = analysis_result.get('emergency_warning')
+            if emergency_warning:
+                yield emergency_warning
+                return
+            
+            request = self._diagnosis_request(user_input, analysis_result, chat_history)
+        except Exception as e:
+            logger.error(f"Error generating diagnosis: {e}")
+            yield f"❌ Lỗi khi tạo chẩn đoán: {str(e)}"
+            return
+        
+        yield from self.llm_handler.generate_diagnosis_stream(**request)
+        yield self.llm_handler.format_medical_response(
+            diagnosis_text="",
+            confidence=analysis_result.get('top_confidence'),
+            matched_diseases=analysis_result.get('matched_diseases', [])
+        )
+        logger.info("Successfully streamed diagnosis")
+    
+    async def generate_diagnosis_async(self,
+                                       user_input: str,
+                                       analysis_result: Dict,
+                                       chat_history: str = "") -> str:
+        """Async variant of generate_diagnosis"""
+        try:
+            logger.info("Generating diagnosis")
+            
+            # Check for emergency
+            emergency_warning = analysis_result.get('emergency_warning')
+            if emergency_warning:
+                return emergency_warning
+            
+            diagnosis_text = await self.llm_handler.generate_diagnosis_async(
+                **self._diagnosis_request(user_input, analysis_result, chat_history)
+            )
+            
+            formatted_response = self.llm_handler.format_medical_response(
+                diagnosis_text=diagnosis_text,
+                confidence=analysis_result.get('top_confidence'),
+                matched_diseases=analysis_result.get('matched_diseases', [])
             )
             
             logger.info("Successfully generated diagnosis")
@@ -216,7 +382,8 @@ class DiagnosisEngine:
             # Generate questions
             questions = self.llm_handler.generate_follow_up_questions(
                 current_symptoms=symptoms,
-                possible_diseases=top_diseases
+                possible_diseases=top_diseases,
+                knowledge_version=self.knowledge_manager.revision
             )
             
             return questions if questions else None
@@ -225,12 +392,59 @@ class DiagnosisEngine:
             logger.error(f"Error generating follow-up questions: {e}")
             return None
     
-    def assess_severity(self, symptoms: List[str]) -> Dict:
-        """Assess severity of condition"""
+    async def generate_follow_up_questions_async(self, analysis_result: Dict) -> Optional[str]:
+        """Async variant of generate_follow_up_questions"""
+        try:
+            matched_diseases = analysis_result.get('matched_diseases', [])
+            if analysis_result.get('has_enough_info', False) or not matched_diseases:
+                return None
+            
+            questions = await self.llm_handler.generate_follow_up_questions_async(
+                current_symptoms=analysis_result.get('symptoms', []),
+                possible_diseases=[d['disease'] for d in matched_diseases[:3]],
+                knowledge_version=self.knowledge_manager.revision
+            )
+            
+            return questions if questions else None
+            
+        except Exception as e:
+            logger.error(f"Error generating follow-up questions: {e}")
+            return None
+    
+    def assess_severity(self,
+                        symptoms: List[str],
+                        raise_errors: bool = False,
+                        request_timeout: Optional[float] = None) -> Dict:
+        """Assess severity of condition (errors are raised with raise_errors)"""
+        try:
+            return self.llm_handler.assess_severity(
+                symptoms, knowledge_version=self.knowledge_manager.revision, raise_errors=raise_errors,
+                request_timeout=request_timeout
+            )
+        except Exception as e:
+            logger.error(f"Error assessing severity: {e}")
+            if raise_errors:
+                raise
+            return {
+                "severity_level": "unknown",
+                "urgency": "should_see_doctor_soon",
+                "explanation": str(e)
+            }
+    
+    async def assess_severity_async(self,
+                                    symptoms: List[str],
+                                    raise_errors: bool = False,
+                                    request_timeout: Optional[float] = None) -> Dict:
+        """Async variant of assess_severity"""
         try:
-            return self.llm_handler.assess_severity(symptoms)
+            return await self.llm_handler.assess_severity_async(
+                symptoms, knowledge_version=self.knowledge_manager.revision, raise_errors=raise_errors,
+                request_timeout=request_timeout
+            )
         except Exception as e:
             logger.error(f"Error assessing severity: {e}")
+            if raise_errors:
+                raise
             return {
                 "severity_level": "unknown",
                 "urgency": "should_see_doctor_soon",
@@ -239,49 +453,168 @@ class DiagnosisEngine:
     
     def get_treatment_recommendations(self,
                                      diagnosis: str,
-                                     symptoms: List[str]) -> str:
-        """Get treatment recommendations"""
+                                     symptoms: List[str],
+                                     raise_errors: bool = False,
+                                     request_timeout: Optional[float] = None) -> str:
+        """Get treatment recommendations (errors are raised with raise_errors)"""
         try:
             return self.llm_handler.generate_treatment_recommendations(
                 diagnosis=diagnosis,
-                symptoms=symptoms
+                symptoms=symptoms,
+                knowledge_version=self.knowledge_manager.revision,
+                raise_errors=raise_errors,
+                request_timeout=request_timeout
+            )
+        except Exception as e:
+            logger.error(f"Error getting treatment recommendations: {e}")
+            if raise_errors:
+                raise
+            return ""
+    
+    async def get_treatment_recommendations_async(self,
+                                                  diagnosis: str,
+                                                  symptoms: List[str],
+                                                  raise_errors: bool = False,
+                                                  request_timeout: Optional[float] = None) -> str:
+        """Async variant of get_treatment_recommendations"""
+        try:
+            return await self.llm_handler.generate_treatment_recommendations_async(
+                diagnosis=diagnosis,
+                symptoms=symptoms,
+                knowledge_version=self.knowledge_manager.revision,
+                raise_errors=raise_errors,
+                request_timeout=request_timeout
             )
         except Exception as e:
             logger.error(f"Error getting treatment recommendations: {e}")
+            if raise_errors:
+                raise
             return ""
     
+    @staticmethod
+    def _top_diagnosis(analysis_result: Dict) -> str:
+        matched_diseases = analysis_result.get('matched_diseases', [])
+        return matched_diseases[0]['disease']['name'] if matched_diseases else "Chưa xác định"
+    
+    @classmethod
+    def _build_report(cls, analysis_result: Dict, diagnosis_text: str, severity: Dict, treatment: str) -> Dict:
+        """Report dict shared by the sync and async report builders"""
+        matched_diseases = analysis_result.get('matched_diseases', [])
+        return {
+            'timestamp': None,  # Will be set by caller
+            'symptoms': analysis_result.get('symptoms', []),
+            'matched_diseases': [d['disease']['name'] for d in matched_diseases[:3]],
+            'top_diagnosis': cls._top_diagnosis(analysis_result),
+            'confidence': analysis_result.get('top_confidence', 0.0),
+            'severity': severity,
+            'diagnosis_text': diagnosis_text,
+            'treatment_recommendations': treatment,
+            'emergency_warning': analysis_result.get('emergency_warning')
+        }
+    
+    def _finish_report(self,
+                       analysis_result: Dict,
+                       diagnosis_text: str,
+                       results: Dict,
+                       timings: Dict,
+                       started: float) -> Dict:
+        """Report from the stages that completed, with timings and missing stages"""
+        severity = results.get('severity', {
+            "severity_level": "unknown",
+            "urgency": "should_see_doctor_soon",
+            "explanation": "Không thể đánh giá"
+        })
+        report = self._build_report(analysis_result, diagnosis_text, severity, results.get('treatment', ""))
+        timings['total'] = time.perf_counter() - started
+        report['timings'] = timings
+        report['incomplete_stages'] = [stage for stage in ('severity', 'treatment') if stage not in results]
+        
+        logger.info(f"Generated diagnosis report in {timings['total']:.2f}s")
+        return report
+    
     def generate_diagnosis_report(self, 
                                  user_input: str,
                                  analysis_result: Dict,
-                                 diagnosis_text: str) -> Dict:
-        """Generate comprehensive diagnosis report"""
+                                 diagnosis_text: str,
+                                 timeout: float = REPORT_STAGE_TIMEOUT) -> Dict:
+        """Generate comprehensive diagnosis report
+        
+        Severity and treatment requests are independent, so they run at the
+        same time on the executor and the report costs the slower of the
+        two. Stages run with raise_errors, so a failed LLM request is not
+        mistaken for an answer: a stage that raises or is not done timeout
+        seconds after the start gets a placeholder and is listed under
+        'incomplete_stages'. Each model request is also given timeout as its
+        own request timeout, so an abandoned stage does not hold a worker of
+        the shared pool for longer than that.
+        'timings' holds the seconds from the start until each stage finished,
+        failed or was given up, and of the whole report.
+        """
         try:
+            started = time.perf_counter()
+            deadline = started + timeout
             symptoms = analysis_result.get('symptoms', [])
-            matched_diseases = analysis_result.get('matched_diseases', [])
             
-            # Assess severity
-            severity = self.assess_severity(symptoms)
-            
-            # Get top diagnosis
-            top_diagnosis = matched_diseases[0]['disease']['name'] if matched_diseases else "Chưa xác định"
-            
-            # Get treatment recommendations
-            treatment = self.get_treatment_recommendations(top_diagnosis, symptoms)
-            
-            report = {
-                'timestamp': None,  # Will be set by caller
-                'symptoms': symptoms,
-                'matched_diseases': [d['disease']['name'] for d in matched_diseases[:3]],
-                'top_diagnosis': top_diagnosis,
-                'confidence': analysis_result.get('top_confidence', 0.0),
-                'severity': severity,
-                'diagnosis_text': diagnosis_text,
-                'treatment_recommendations': treatment,
-                'emergency_warning': analysis_result.get('emergency_warning')
+            finished = {}
+            futures = {
+                'severity': self.executor.submit(
+                    _record_finish, finished, 'severity', self.assess_severity, symptoms,
+                    raise_errors=True, request_timeout=timeout
+                ),
+                'treatment': self.executor.submit(
+                    _record_finish, finished, 'treatment', self.get_treatment_recommendations,
+                    self._top_diagnosis(analysis_result), symptoms, raise_errors=True, request_timeout=timeout
+                )
             }
             
-            logger.info("Generated diagnosis report")
-            return report
+            results, timings = {}, {}
+            for stage, future in futures.items():
+                try:
+                    results[stage] = future.result(timeout=max(0.0, deadline - time.perf_counter()))
+                except Exception as e:
+                    # Still queued stages are dropped, running ones end at their request timeout
+                    future.cancel()
+                    logger.warning(f"Report stage '{stage}' incomplete: {type(e).__name__} {e}")
+                timings[stage] = finished.get(stage, time.perf_counter()) - started
+            
+            return self._finish_report(analysis_result, diagnosis_text, results, timings, started)
+            
+        except Exception as e:
+            logger.error(f"Error generating diagnosis report: {e}")
+            return {}
+    
+    async def generate_diagnosis_report_async(self,
+                                              user_input: str,
+                                              analysis_result: Dict,
+                                              diagnosis_text: str,
+                                              timeout: float = REPORT_STAGE_TIMEOUT) -> Dict:
+        """Async variant of generate_diagnosis_report
+        
+        Both requests are awaited together; a stage past its deadline is
+        cancelled. Timings are measured as in generate_diagnosis_report.
+        """
+        try:
+            started = time.perf_counter()
+            symptoms = analysis_result.get('symptoms', [])
+            results, timings = {}, {}
+            
+            async def run_stage(stage: str, request) -> None:
+                try:
+                    results[stage] = await asyncio.wait_for(request, timeout)
+                except Exception as e:
+                    logger.warning(f"Report stage '{stage}' incomplete: {type(e).__name__} {e}")
+                timings[stage] = time.perf_counter() - started
+            
+            await asyncio.gather(
+                run_stage('severity', self.assess_severity_async(
+                    symptoms, raise_errors=True, request_timeout=timeout
+                )),
+                run_stage('treatment', self.get_treatment_recommendations_async(
+                    self._top_diagnosis(analysis_result), symptoms, raise_errors=True, request_timeout=timeout
+                ))
+            )
+            
+            return self._finish_report(analysis_result, diagnosis_text, results, timings, started)
             
         except Exception as e:
             logger.error(f"Error generating diagnosis report: {e}")
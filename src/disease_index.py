@@ -0,0 +1,299 @@
+"""
+Disease Index for AI Medical Diagnosis System
+Inverted index from symptom id to diseases for candidate-only ranking
+"""
+import bisect
+import heapq
+from typing import List, Dict, Iterable, Optional, Sequence, Set, Tuple
+
+from id_space import IdSpace
+from records import DiseaseMatch
+
+
+class DiseaseIndex:
+    """Posting lists from interned symptom ids to disease positions
+
+    Symptom keys are interned into a (possibly shared) IdSpace, so posting
+    lists are plain lists indexed by int and the patient's symptom set is a
+    set of ints. Ranking only visits diseases sharing at least one symptom with
+    the patient, reuses the precomputed size of each disease's symptom set for
+    Jaccard and match-ratio scores, and selects the top results with a heap.
+    Symptom keys are compared case-insensitively. Updated diseases keep their
+    position; removed ones leave an empty slot, so positions never shift.
+    """
+
+    def __init__(self, diseases: Iterable[Dict] = (), symptom_space: Optional[IdSpace] = None):
+        """Build posting lists for the given diseases"""
+        self.symptom_space = IdSpace() if symptom_space is None else symptom_space
+        self.diseases = []
+        self.postings = []
+        self.disease_symptom_ids = []
+        self.symptom_counts = []
+        # Position of each disease id (first one wins) and number of removed slots
+        self.positions = {}
+        self.removed = 0
+        # Posting lists still shared with the index this one was copied from
+        self._shared = set()
+        for disease in diseases:
+            self.add_disease(disease)
+
+    @classmethod
+    def from_arrays(cls,
+                    diseases: Sequence[Dict],
+                    postings: Sequence[Sequence[int]],
+                    disease_symptom_ids: Sequence[Sequence[int]],
+                    symptom_counts: Sequence[int],
+                    symptom_space: IdSpace) -> 'DiseaseIndex':
+        """Wrap prebuilt posting lists (e.g. from a snapshot) without re-indexing"""
+        index = cls(symptom_space=symptom_space)
+        index.diseases = diseases
+        index.postings = postings
+        index.disease_symptom_ids = disease_symptom_ids
+        index.symptom_counts = symptom_counts
+        return index
+
+    def __len__(self) -> int:
+        return len(self.diseases) - self.removed
+
+    def copy(self, symptom_space: Optional[IdSpace] = None) -> 'DiseaseIndex':
+        """Index to add diseases to while this one keeps serving reads
+
+        Only the outer lists are copied; posting lists are shared and copied
+        the first time a new disease is added to them.
+        """
+        index = DiseaseIndex(symptom_space=self.symptom_space if symptom_space is None else symptom_space)
+        index.diseases = list(self.diseases)
+        index.postings = list(self.postings)
+        index.disease_symptom_ids = list(self.disease_symptom_ids)
+        index.symptom_counts = list(self.symptom_counts)
+        index.positions = dict(self.positions)
+        index.removed = self.removed
+        index._shared = set(range(len(self.postings)))
+        return index
+
+    def _posting(self, id_: int) -> List[int]:
+        """Posting list of a symptom id, owned by this index"""
+        if id_ in self._shared:
+            self._shared.discard(id_)
+            self.postings[id_] = list(self.postings[id_])
+        return self.postings[id_]
+
+    def _symptom_ids(self, disease: Dict) -> List[int]:
+        # Aligned with disease['symptoms'] for reporting matched symptoms
+        ids = [self.symptom_space.intern(s.lower()) for s in disease.get('symptoms', [])]
+        missing = len(self.symptom_space) - len(self.postings)
+        if missing > 0:
+            self.postings.extend([] for _ in range(missing))
+        return ids
+
+    def add_disease(self, disease: Dict) -> None:
+        """Index one disease (O(number of its symptoms))"""
+        position = len(self.diseases)
+        ids = self._symptom_ids(disease)
+        self.diseases.append(disease)
+        self.disease_symptom_ids.append(ids)
+        self.symptom_counts.append(len(set(ids)))
+        self.positions.setdefault(disease['id'], position)
+        for id_ in dict.fromkeys(ids):
+            self._posting(id_).append(position)
+
+    def update_disease(self, position: int, disease: Dict) -> None:
+        """Re-index the disease at position (O(number of old and new symptoms))"""
+        old_ids = set(self.disease_symptom_ids[position])
+        ids = self._symptom_ids(disease)
+        for id_ in old_ids.difference(ids):
+            self._posting(id_).remove(position)
+        for id_ in dict.fromkeys(ids):
+            if id_ not in old_ids:
+                bisect.insort(self._posting(id_), position)
+        self.diseases[position] = disease
+        self.disease_symptom_ids[position] = ids
+        self.symptom_counts[position] = len(set(ids))
+
+    def remove_disease(self, position: int) -> None:
+        """Drop the disease at position from every posting list"""
+        for id_ in set(self.disease_symptom_ids[position]):
+            self._posting(id_).remove(position)
+        disease = self.diseases[position]
+        if self.positions.get(disease['id']) == position:
+            del self.positions[disease['id']]
+        self.diseases[position] = None
+        self.disease_symptom_ids[position] = []
+        self.symptom_counts[position] = 0
+        self.removed += 1
+
+    def encode(self, symptoms: Iterable[str]) -> Tuple[List[int], int]:
+        """Known symptom ids plus the size of the whole (lowercased) symptom set"""
+        keys = {s.lower() for s in symptoms}
+        return self.symptom_space.encode(keys), len(keys)
+
+    def count(self, symptom_ids: Iterable[int]) -> Dict[int, int]:
+        """Count shared symptoms for every candidate disease (ids must be unique)"""
+        postings = self.postings
+        counts = {}
+        for id_ in symptom_ids:
+            if id_ < len(postings):
+                for position in postings[id_]:
+                    counts[position] = counts.get(position, 0) + 1
+        return counts
+
+    def _matched_symptoms(self, position: int, query: Set[int]) -> List[str]:
+        return [
+            symptom
+            for symptom, id_ in zip(self.diseases[position].get('symptoms', []),
+                                    self.disease_symptom_ids[position])
+            if id_ in query
+        ]
+
+    def rank(self, user_symptoms: List[str], top_k: int = 5) -> List[Dict]:
+        """Rank diseases by Jaccard similarity with the user's symptoms
+
+        Same result shape as utils.rank_diseases_by_symptoms.
+        """
+        ids, size = self.encode(user_symptoms)
+        return self.rank_ids(ids, top_k, size)
+
+    def rank_ids(self, symptom_ids: Iterable[int], top_k: int = 5, size: Optional[int] = None) -> List[Dict]:
+        """Rank diseases for interned symptom ids
+
+        size is the patient's symptom count when it includes symptoms outside
+        the id space; it defaults to the number of distinct ids.
+        """
+        ids = list(dict.fromkeys(symptom_ids))
+        return self.rank_counts(set(ids), len(ids) if size is None else size, self.count(ids), top_k)
+
+    def rank_counts(self, query: Set[int], size: int, counts: Dict[int, int], top_k: int = 5) -> List[Dict]:
+        """Rank candidates from precomputed intersection counts for the query's id set"""
+        if not counts:
+            return []
+
+        def jaccard(position: int) -> float:
+            intersection = counts[position]
+            return intersection / (size + self.symptom_counts[position] - intersection)
+
+        # Ties go to the earlier disease in the catalogue
+        best = heapq.nlargest(top_k, counts, key=lambda position: (jaccard(position), -position))
+        return [
+            DiseaseMatch(
+                disease=self.diseases[position],
+                score=jaccard(position),
+                matched_symptoms=self._matched_symptoms(position, query)
+            )
+            for position in best
+        ]
+
+    def search(self, symptom_ids: List[str], top_k: Optional[int] = None) -> List[Dict]:
+        """Find diseases sharing symptoms, by match ratio then match count
+
+        Same result shape as KnowledgeManager.search_diseases_by_symptoms.
+        """
+        ids, _ = self.encode(symptom_ids)
+        return self.search_ids(ids, top_k)
+
+    def search_ids(self, symptom_ids: Iterable[int], top_k: Optional[int] = None) -> List[Dict]:
+        """Search diseases for interned symptom ids"""
+        ids = list(dict.fromkeys(symptom_ids))
+        query = set(ids)
+        counts = self.count(ids)
+
+        def sort_key(position: int) -> Tuple[float, int, int]:
+            # Ties go to the earlier disease in the catalogue
+            return counts[position] / self.symptom_counts[position], counts[position], -position
+
+        if top_k is None:
+            ordered = sorted(counts, key=sort_key, reverse=True)
+        else:
+            ordered = heapq.nlargest(top_k, counts, key=sort_key)
+
+        return [
+            DiseaseMatch(
+                disease=self.diseases[position],
+                match_count=counts[position],
+                match_ratio=counts[position] / self.symptom_counts[position],
+                matched_symptoms=self._matched_symptoms(position, query)
+            )
+            for position in ordered
+        ]
+
+
+class RankingState:
+    """Incremental ranking state for one consultation
+
+    Keeps the session's symptoms as a set of interned ids and the
+    intersection count of every disease touched so far. Adding symptoms only
+    walks the posting lists of the new ones, and ranking only scores touched
+    diseases, so a turn costs in proportion to what changed rather than to
+    the catalogue size. Symptoms unknown to the index still count towards
+    the Jaccard union, as with DiseaseIndex.rank.
+
+    With track_counts=False only the symptoms are kept, for sessions ranked
+    elsewhere (the incidence matrix); rank() is then unavailable.
+    """
+
+    def __init__(self, index: DiseaseIndex, version: int = 0, track_counts: bool = True):
+        """Start an empty session on the given index"""
+        self.index = index
+        self.version = version
+        self.track_counts = track_counts
+        self.symptom_ids = []
+        self.symptom_id_set = set()
+        self.unknown = []
+        self.counts = {}
+
+    def __len__(self) -> int:
+        return len(self.symptom_ids) + len(self.unknown)
+
+    @property
+    def symptoms(self) -> List[str]:
+        """Lowercased symptom keys of the session, known ones first"""
+        return self.index.symptom_space.decode(self.symptom_ids) + self.unknown
+
+    def rebind(self, index: DiseaseIndex, version: int) -> None:
+        """Move the session to a new index, replaying its symptoms"""
+        symptoms = self.symptoms
+        self.index = index
+        self.version = version
+        self.symptom_ids = []
+        self.symptom_id_set = set()
+        self.unknown = []
+        self.counts = {}
+        self.add_symptoms(symptoms)
+
+    def add_symptom_ids(self, symptom_ids: Iterable[int]) -> List[int]:
+        """Add interned symptom ids, returning the ones that were new"""
+        added = []
+        for id_ in symptom_ids:
+            if id_ in self.symptom_id_set:
+                continue
+            self.symptom_id_set.add(id_)
+            self.symptom_ids.append(id_)
+            added.append(id_)
+
+        if self.track_counts:
+            for position, count in self.index.count(added).items():
+                self.counts[position] = self.counts.get(position, 0) + count
+        return added
+
+    def add_symptoms(self, symptoms: Iterable[str]) -> List[str]:
+        """Add symptoms by key, returning the ones that were new"""
+        added = []
+        for symptom in symptoms:
+            key = symptom.lower()
+            id_ = self.index.symptom_space.get(key)
+            if id_ is None:
+                if key not in self.unknown:
+                    self.unknown.append(key)
+                    added.append(symptom)
+            elif self.add_symptom_ids([id_]):
+                added.append(symptom)
+        return added
+
+    def rank(self, top_k: int = 5) -> List[Dict]:
+        """Rank touched diseases for the session's symptoms"""
+        if not self.track_counts:
+            raise ValueError("Ranking state does not track disease counts")
+        return self.index.rank_counts(self.symptom_id_set, len(self), self.counts, top_k)
+
+
+# Export
+__all__ = ['DiseaseIndex', 'RankingState']
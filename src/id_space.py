@@ -0,0 +1,83 @@
+"""
+Id Space for AI Medical Diagnosis System
+Interning of string keys into dense integer ids, with bitset helpers
+"""
+from typing import List, Iterable, Optional
+
+
+class IdSpace:
+    """Two-way translation table between string keys and dense ints
+
+    Ids are assigned in first-seen order starting at 0 and never change for
+    the lifetime of the space, so they can index plain lists and serve as bit
+    positions in Python int bitsets.
+    """
+
+    def __init__(self, keys: Iterable[str] = ()):
+        """Intern the given keys in order"""
+        self.keys = []
+        self.ids = {}
+        for key in keys:
+            self.intern(key)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.ids
+
+    def copy(self) -> 'IdSpace':
+        """Independent space with the same ids, for interning without touching this one"""
+        space = IdSpace()
+        space.keys = list(self.keys)
+        space.ids = dict(self.ids)
+        return space
+
+    def intern(self, key: str) -> int:
+        """Get the id of a key, assigning the next one if it is new"""
+        id_ = self.ids.get(key)
+        if id_ is None:
+            id_ = len(self.keys)
+            self.ids[key] = id_
+            self.keys.append(key)
+        return id_
+
+    def get(self, key: str) -> Optional[int]:
+        """Get the id of a key, None if it was never interned"""
+        return self.ids.get(key)
+
+    def key(self, id_: int) -> str:
+        """Get the key of an id"""
+        return self.keys[id_]
+
+    def encode(self, keys: Iterable[str]) -> List[int]:
+        """Ids of the known keys, unknown ones are skipped"""
+        ids = self.ids
+        return [ids[key] for key in keys if key in ids]
+
+    def decode(self, ids: Iterable[int]) -> List[str]:
+        """Keys of the given ids"""
+        keys = self.keys
+        return [keys[id_] for id_ in ids]
+
+
+def to_bits(ids: Iterable[int]) -> int:
+    """Pack ids into an int bitset"""
+    bits = 0
+    for id_ in ids:
+        bits |= 1 << id_
+    return bits
+
+
+def from_bits(bits: int) -> List[int]:
+    """Unpack an int bitset into ascending ids"""
+    ids = []
+    while bits:
+        low = bits & -bits
+        ids.append(low.bit_length() - 1)
+        bits ^= low
+    return ids
+
+
+# Export
+__all__ = ['IdSpace', 'to_bits', 'from_bits']
@@ -0,0 +1,193 @@
+"""
+Incidence Matrix Scorer for AI Medical Diagnosis System
+Vectorised disease ranking on a bit-packed disease x symptom matrix
+"""
+from typing import List, Dict, Iterable, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # numpy is only needed for this backend
+    np = None
+
+from id_space import IdSpace
+from records import DiseaseMatch
+
+# Upper bound on the temporary (diseases x gathered columns) array per chunk
+_CHUNK_BYTES = 1 << 24
+
+
+class IncidenceMatrixScorer:
+    """Score all diseases at once against one or many symptom sets
+
+    Each disease is a row of bits (one per known symptom) packed eight to a
+    byte. The intersection sizes for a batch of patients are the popcounts of
+    the AND of their packed rows with the matrix, i.e. a boolean matrix
+    product, from which Jaccard, match ratio and match count follow with
+    array arithmetic. Only the columns of the queried symptoms are read, so
+    the cost grows with the symptoms per patient, not with the vocabulary.
+    Symptom ids are compared case-insensitively.
+    """
+
+    def __init__(self, diseases: Iterable[Dict], symptom_space: Optional[IdSpace] = None):
+        """Build the packed incidence matrix, one column per interned symptom"""
+        if np is None:
+            raise ImportError("numpy is required for the incidence matrix scoring backend")
+
+        self.diseases = list(diseases)
+        self.symptom_space = IdSpace() if symptom_space is None else symptom_space
+        # Aligned with disease['symptoms'] for reporting matched symptoms
+        self.disease_symptom_ids = [
+            [self.symptom_space.intern(s.lower()) for s in disease.get('symptoms', [])]
+            for disease in self.diseases
+        ]
+        self.n_columns = len(self.symptom_space)
+
+        incidence = np.zeros((len(self.diseases), max(self.n_columns, 1)), dtype=bool)
+        for row, ids in enumerate(self.disease_symptom_ids):
+            incidence[row, ids] = True
+
+        self.matrix = np.packbits(incidence, axis=1)
+        self.symptom_counts = incidence.sum(axis=1).astype(np.int64)
+
+    @classmethod
+    def from_arrays(cls,
+                    diseases: Sequence[Dict],
+                    disease_symptom_ids: Sequence[Sequence[int]],
+                    matrix,
+                    symptom_counts,
+                    symptom_space: IdSpace,
+                    n_columns: int) -> 'IncidenceMatrixScorer':
+        """Wrap a prebuilt packed matrix (e.g. a view on a snapshot) without copying"""
+        if np is None:
+            raise ImportError("numpy is required for the incidence matrix scoring backend")
+        scorer = cls.__new__(cls)
+        scorer.diseases = diseases
+        scorer.symptom_space = symptom_space
+        scorer.disease_symptom_ids = disease_symptom_ids
+        scorer.n_columns = n_columns
+        scorer.matrix = matrix
+        scorer.symptom_counts = symptom_counts
+        return scorer
+
+    def __len__(self) -> int:
+        return len(self.diseases)
+
+    def _encode(self, symptom_sets: List[Iterable[str]]) -> Tuple[List[List[int]], List[int]]:
+        """Known symptom ids of each set plus the size of each (lowercased) set"""
+        id_sets, sizes = [], []
+        for symptoms in symptom_sets:
+            keys = {s.lower() for s in symptoms}
+            id_sets.append(self.symptom_space.encode(keys))
+            sizes.append(len(keys))
+        return id_sets, sizes
+
+    def _query_columns(self, id_sets: List[List[int]]) -> List:
+        """Column ids of each query; ids interned after the matrix was built are ignored"""
+        return [np.asarray([id_ for id_ in ids if id_ < self.n_columns], dtype=np.int64) for ids in id_sets]
+
+    def score_batch(self, symptom_sets: List[Iterable[str]]) -> Dict:
+        """Compute match count, Jaccard and match ratio for every disease
+
+        Returns arrays of shape (len(symptom_sets), number of diseases) under
+        'match_count', 'jaccard' and 'match_ratio'.
+        """
+        id_sets, sizes = self._encode(symptom_sets)
+        return self.score_batch_ids(id_sets, sizes)
+
+    def score_batch_ids(self, id_sets: List[List[int]], sizes: Optional[List[int]] = None) -> Dict:
+        """Score interned symptom id sets, sizes default to the distinct id counts"""
+        id_sets = [list(dict.fromkeys(ids)) for ids in id_sets]
+        if sizes is None:
+            sizes = [len(ids) for ids in id_sets]
+        columns = self._query_columns(id_sets)
+        sizes = np.asarray(sizes, dtype=np.int64)
+        n_queries, n_diseases = len(id_sets), len(self.diseases)
+
+        counts = np.zeros((n_queries, n_diseases), dtype=np.int64)
+        # Columns gathered per chunk, so the temporary stays under _CHUNK_BYTES
+        budget = max(1, _CHUNK_BYTES // max(n_diseases, 1))
+        start = 0
+        while start < n_queries:
+            stop, width = start + 1, len(columns[start])
+            while stop < n_queries and width + len(columns[stop]) <= budget:
+                width += len(columns[stop])
+                stop += 1
+            self._count_chunk(columns[start:stop], counts[start:stop])
+            start = stop
+
+        union = sizes[:, None] + self.symptom_counts[None, :] - counts
+        with np.errstate(divide='ignore', invalid='ignore'):
+            jaccard = np.where(union > 0, counts / np.maximum(union, 1), 0.0)
+            match_ratio = np.where(
+                self.symptom_counts > 0,
+                counts / np.maximum(self.symptom_counts, 1),
+                0.0
+            )
+
+        return {'match_count': counts, 'jaccard': jaccard, 'match_ratio': match_ratio}
+
+    def _count_chunk(self, columns: List, counts) -> None:
+        """Fill counts (queries x diseases) by testing each query's bits in every row"""
+        lengths = np.array([len(ids) for ids in columns], dtype=np.int64)
+        if not lengths.sum():
+            return
+        ids = np.concatenate(columns)
+        # packbits is big-endian: column c is bit 7 - c % 8 of byte c // 8
+        masks = (np.uint8(0x80) >> (ids & 7).astype(np.uint8))
+        hits = (self.matrix[:, ids >> 3] & masks) != 0
+        # Sum each query's run of columns; empty queries keep zero counts
+        rows = np.flatnonzero(lengths)
+        offsets = (np.cumsum(lengths) - lengths)[rows]
+        counts[rows] = np.add.reduceat(hits, offsets, axis=1, dtype=np.int64).T
+
+    def _top_k(self, scores, top_k: int):
+        """Positions of the top_k positive scores, ties in catalogue order"""
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > top_k:
+            kth = np.partition(scores[candidates], len(candidates) - top_k)[len(candidates) - top_k]
+            candidates = candidates[scores[candidates] >= kth]
+        return candidates[np.argsort(-scores[candidates], kind='stable')][:top_k]
+
+    def rank_batch(self, symptom_sets: List[Iterable[str]], top_k: int = 5) -> List[List[Dict]]:
+        """Rank diseases by Jaccard similarity for many patients in one pass
+
+        Each inner list has the same shape as DiseaseIndex.rank.
+        """
+        id_sets, sizes = self._encode(symptom_sets)
+        return self.rank_batch_ids(id_sets, top_k, sizes)
+
+    def rank_batch_ids(self,
+                       id_sets: List[List[int]],
+                       top_k: int = 5,
+                       sizes: Optional[List[int]] = None) -> List[List[Dict]]:
+        """Rank diseases for many interned symptom id sets in one pass"""
+        if not id_sets:
+            return []
+
+        scores = self.score_batch_ids(id_sets, sizes)
+        results = []
+        for row, ids in enumerate(id_sets):
+            query = set(ids)
+            ranked = []
+            for position in self._top_k(scores['jaccard'][row], top_k):
+                disease = self.diseases[position]
+                ranked.append(DiseaseMatch(
+                    disease=disease,
+                    score=float(scores['jaccard'][row, position]),
+                    matched_symptoms=[
+                        symptom
+                        for symptom, id_ in zip(disease.get('symptoms', []),
+                                                self.disease_symptom_ids[position])
+                        if id_ in query
+                    ]
+                ))
+            results.append(ranked)
+        return results
+
+    def rank(self, user_symptoms: List[str], top_k: int = 5) -> List[Dict]:
+        """Rank diseases for a single patient"""
+        return self.rank_batch([user_symptoms], top_k)[0]
+
+
+# Export
+__all__ = ['IncidenceMatrixScorer']
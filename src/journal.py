@@ -0,0 +1,183 @@
+"""
+Knowledge Journal for AI Medical Diagnosis System
+Append-only JSONL write-ahead log of knowledge base mutations
+"""
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import List, Dict
+
+from config import JOURNAL_FSYNC_EVERY, JOURNAL_FSYNC_INTERVAL
+from utils import setup_logging
+
+logger = setup_logging(__name__)
+
+
+def journal_path(knowledge_base_path: Path) -> Path:
+    """Journal file kept next to a knowledge base file"""
+    knowledge_base_path = Path(knowledge_base_path)
+    return knowledge_base_path.with_name(knowledge_base_path.stem + '.journal.jsonl')
+
+
+class KnowledgeJournal:
+    """Append-only log of mutations, one JSON object per line
+
+    Each append is written and flushed to the OS immediately. fsync is
+    batched: it runs once fsync_every appends are pending, and a timer syncs
+    whatever is still pending fsync_interval seconds after the last sync, so
+    the tail of a burst reaches the disk without waiting for another append.
+
+    Compaction rotates the journal aside while the snapshot is written, so
+    new appends never wait on it. Entries must be idempotent when replayed,
+    because a crash between the snapshot and the removal of the rotated file
+    replays them on top of a snapshot that already contains them.
+    """
+
+    def __init__(self,
+                 path: Path,
+                 fsync_every: int = JOURNAL_FSYNC_EVERY,
+                 fsync_interval: float = JOURNAL_FSYNC_INTERVAL):
+        """Open (lazily) the journal at path"""
+        self.path = Path(path)
+        self.rotated_path = self.path.with_name(self.path.name + '.compacting')
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        # Entries not yet folded into the snapshot
+        self.entries = 0
+        self._file = None
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self.entries
+
+    def append(self, op: str, data: Dict) -> None:
+        """Append one mutation"""
+        line = json.dumps({'op': op, 'data': data}, ensure_ascii=False) + '\n'
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, 'a', encoding='utf-8')
+            self._file.write(line)
+            self._file.flush()
+            self.entries += 1
+            self._unsynced += 1
+            delay = self.fsync_interval - (time.monotonic() - self._last_sync)
+            if self._unsynced >= self.fsync_every or delay <= 0:
+                self._sync()
+            elif self._timer is None:
+                self._timer = threading.Timer(delay, self._deadline_sync)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def append_many(self, op: str, records: List[Dict]) -> None:
+        """Append a batch of mutations with a single write and fsync"""
+        self.append_entries([{'op': op, 'data': data} for data in records])
+
+    def append_entries(self, entries: List[Dict]) -> None:
+        """Append {'op', 'data'} entries of any operations with a single write and fsync"""
+        if not entries:
+            return
+        lines = ''.join(json.dumps(entry, ensure_ascii=False) + '\n' for entry in entries)
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, 'a', encoding='utf-8')
+            self._file.write(lines)
+            self._file.flush()
+            self.entries += len(entries)
+            self._unsynced += len(entries)
+            self._sync()
+
+    def _sync(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._file is not None and self._unsynced:
+            os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def _deadline_sync(self) -> None:
+        """Timer callback: sync appends left pending after a burst"""
+        with self._lock:
+            if self._timer is threading.current_thread():
+                self._timer = None
+                self._sync()
+
+    def sync(self) -> None:
+        """Force pending appends to disk"""
+        with self._lock:
+            self._sync()
+
+    def close(self) -> None:
+        """Sync and close the journal file"""
+        with self._lock:
+            self._sync()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def replay(self) -> List[Dict]:
+        """Read all entries not yet compacted, oldest first"""
+        with self._lock:
+            entries = self._read(self.rotated_path) + self._read(self.path)
+            self.entries = len(entries)
+            return entries
+
+    def _read(self, path: Path) -> List[Dict]:
+        """Read one journal file, cutting off a torn last line"""
+        if not path.exists():
+            return []
+
+        with open(path, 'rb') as f:
+            data = f.read()
+
+        entries = []
+        end = 0
+        for line in data.splitlines(keepends=True):
+            if not line.endswith(b'\n'):
+                logger.warning(f"Dropping incomplete last entry of {path}")
+                break
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                logger.error(f"Skipping corrupt entry at byte {end} of {path}")
+            end += len(line)
+
+        if end < len(data):
+            # Later appends must start on a fresh line
+            with open(path, 'r+b') as f:
+                f.truncate(end)
+        return entries
+
+    def rotate(self) -> None:
+        """Move current entries aside for compaction and start a new file"""
+        with self._lock:
+            self._sync()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if self.path.exists():
+                if self.rotated_path.exists():
+                    # An earlier compaction did not finish: keep its entries too
+                    with open(self.rotated_path, 'ab') as rotated, open(self.path, 'rb') as current:
+                        rotated.write(current.read())
+                        rotated.flush()
+                        os.fsync(rotated.fileno())
+                    self.path.unlink()
+                else:
+                    os.replace(self.path, self.rotated_path)
+            self.entries = 0
+
+    def discard_rotated(self) -> None:
+        """Drop rotated entries once the snapshot containing them is on disk"""
+        with self._lock:
+            if self.rotated_path.exists():
+                self.rotated_path.unlink()
+
+
+# Export
+__all__ = ['KnowledgeJournal', 'journal_path']
@@ -0,0 +1,710 @@
+"""
+Knowledge Base Snapshot for AI Medical Diagnosis System
+Precompiled binary snapshot of the knowledge base, memory-mapped at load
+
+Usage:
+    python src/kb_snapshot.py compile [--knowledge-base PATH] [--output PATH]
+    python src/kb_snapshot.py verify [PATH]
+"""
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import zlib
+from array import array
+from collections.abc import Mapping, Sequence
+from pathlib import Path
+from typing import List, Dict, Iterable, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # the incidence matrix view is skipped without numpy
+    np = None
+
+from config import KNOWLEDGE_BASE_PATH, KNOWLEDGE_SNAPSHOT_PATH, KNOWLEDGE_SNAPSHOT_VERIFY
+from disease_index import DiseaseIndex
+from id_space import IdSpace
+from incidence_matrix import IncidenceMatrixScorer
+from journal import KnowledgeJournal, journal_path
+from knowledge_manager import KnowledgeManager, KnowledgeState
+from records import Disease, Symptom, to_plain
+from utils import setup_logging
+
+logger = setup_logging(__name__)
+
+MAGIC = b'MDKBSNAP'
+FORMAT_VERSION = 1
+# magic, format version, header length, header crc32, payload crc32
+_PREAMBLE = struct.Struct('<8sIIII')
+# Sections start on 8-byte boundaries so they can be cast in place
+_ALIGN = 8
+
+
+def _align(size: int) -> int:
+    return (size + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+def _hash(key: str) -> int:
+    return zlib.crc32(key.encode('utf-8'))
+
+
+def _first_positions(keys: Iterable[str]):
+    """Unique keys in first-seen order and the position each was first seen at"""
+    positions = {}
+    for position, key in enumerate(keys):
+        positions.setdefault(key, position)
+    return list(positions), list(positions.values())
+
+
+class _SnapshotWriter:
+    """Collect the aligned sections of a snapshot payload"""
+
+    def __init__(self):
+        self.sections = {}
+        self.chunks = []
+        self.size = 0
+
+    def add(self, name: str, data: bytes, typecode: str = 'B') -> None:
+        """Add raw bytes, read back as a memoryview of typecode"""
+        padding = _align(len(data)) - len(data)
+        self.sections[name] = [self.size, len(data), typecode]
+        self.chunks.append(data)
+        if padding:
+            self.chunks.append(bytes(padding))
+        self.size += len(data) + padding
+
+    def add_array(self, name: str, values: Iterable[int]) -> None:
+        """Add unsigned 32-bit ints"""
+        self.add(name, array('I', values).tobytes(), 'I')
+
+    def add_csr(self, name: str, rows: Iterable[Iterable[int]]) -> None:
+        """Add a list of int lists as offsets + concatenated values"""
+        offsets = array('I', [0])
+        values = array('I')
+        for row in rows:
+            values.extend(row)
+            offsets.append(len(values))
+        self.add(name + '.offsets', offsets.tobytes(), 'I')
+        self.add(name + '.values', values.tobytes(), 'I')
+
+    def add_strings(self, name: str, strings: Iterable[str]) -> None:
+        """Add strings as offsets + concatenated UTF-8"""
+        offsets = array('I', [0])
+        data = bytearray()
+        for string in strings:
+            data += string.encode('utf-8')
+            offsets.append(len(data))
+        self.add(name + '.offsets', offsets.tobytes(), 'I')
+        self.add(name + '.data', bytes(data))
+
+    def add_lookup(self, name: str, keys: List[str], values: Optional[List[int]] = None) -> None:
+        """Add unique string keys with an open-addressing hash table
+
+        Table slots hold key index + 1 (0 is empty) and are probed linearly
+        from crc32(key); the table is kept at most half full.
+        """
+        self.add_strings(name, keys)
+        size = 1
+        while size < 2 * len(keys):
+            size <<= 1
+        mask = size - 1
+        table = array('I', bytes(4 * size))
+        for index, key in enumerate(keys):
+            slot = _hash(key) & mask
+            while table[slot]:
+                slot = (slot + 1) & mask
+            table[slot] = index + 1
+        self.add(name + '.table', table.tobytes(), 'I')
+        if values is not None:
+            self.add_array(name + '.values', values)
+
+
+def _pack_rows(disease_symptom_ids: List[List[int]], row_bytes: int) -> bytes:
+    """Bit-packed incidence rows, same layout as numpy.packbits(axis=1)"""
+    matrix = bytearray(len(disease_symptom_ids) * row_bytes)
+    for row, ids in enumerate(disease_symptom_ids):
+        base = row * row_bytes
+        for id_ in ids:
+            matrix[base + (id_ >> 3)] |= 0x80 >> (id_ & 7)
+    return bytes(matrix)
+
+
+def compile_snapshot(knowledge_manager: KnowledgeManager,
+                     output_path: Path = KNOWLEDGE_SNAPSHOT_PATH) -> Dict:
+    """Write a snapshot of a loaded knowledge base, returning its header
+
+    The file is written to a temporary name and renamed into place, so
+    processes mapping the previous snapshot keep a consistent view.
+    """
+    # One consistent version, even if the manager reloads meanwhile
+    state = knowledge_manager.state
+    output_path = Path(output_path)
+    diseases = state.diseases
+    symptoms = state.symptoms
+    space = state.symptom_space
+    index = state.disease_index
+    if index.removed:
+        # Removed diseases leave empty slots in the live index
+        index = DiseaseIndex(diseases, space.copy())
+    writer = _SnapshotWriter()
+
+    writer.add_strings('disease_records', (json.dumps(to_plain(d), ensure_ascii=False) for d in diseases))
+    writer.add_strings('symptom_records', (json.dumps(to_plain(s), ensure_ascii=False) for s in symptoms))
+
+    # Symptom ids in the same order as the live IdSpace
+    writer.add_lookup('symptom_keys', list(space.keys))
+    key_records = [0] * len(space)
+    for position, symptom in enumerate(symptoms):
+        symptom_int = space.get(symptom['id'].lower())
+        if not key_records[symptom_int]:
+            key_records[symptom_int] = position + 1
+    writer.add_array('key_records', key_records)
+
+    # First record wins, as with the in-memory indexes
+    writer.add_lookup('disease_ids', *_first_positions(d['id'] for d in diseases))
+    writer.add_lookup('disease_names', *_first_positions(d['name'].lower() for d in diseases))
+    writer.add_lookup('symptom_ids', *_first_positions(s['id'] for s in symptoms))
+
+    postings = list(index.postings) + [[]] * (len(space) - len(index.postings))
+    writer.add_csr('postings', postings)
+    writer.add_csr('disease_symptoms', index.disease_symptom_ids)
+    writer.add_array('symptom_counts', index.symptom_counts)
+
+    categories = list(state.categories)
+    by_category = {category: [] for category in categories}
+    for position, symptom in enumerate(symptoms):
+        if 'category' in symptom:
+            by_category[symptom['category']].append(position)
+    writer.add_csr('categories', (by_category[category] for category in categories))
+
+    n_columns = len(space)
+    row_bytes = (max(n_columns, 1) + 7) // 8
+    writer.add('incidence', _pack_rows(index.disease_symptom_ids, row_bytes))
+
+    header = {
+        'format': FORMAT_VERSION,
+        'byteorder': sys.byteorder,
+        'meta': {k: v for k, v in state.knowledge_base.items() if k not in ('diseases', 'symptoms')},
+        'statistics': {
+            'total_diseases': len(diseases),
+            'total_symptoms': len(symptoms),
+            'symptom_categories': len(categories),
+            'avg_symptoms_per_disease': state.total_disease_symptoms / len(diseases) if diseases else 0
+        },
+        'total_disease_symptoms': state.total_disease_symptoms,
+        'categories': categories,
+        'symptom_triage': {str(k): v for k, v in state.symptom_triage.items()},
+        'n_columns': n_columns,
+        'row_bytes': row_bytes,
+        'revision': state.revision,
+        'sections': writer.sections
+    }
+    header_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8')
+    payload_crc = 0
+    for chunk in writer.chunks:
+        payload_crc = zlib.crc32(chunk, payload_crc)
+    head = _PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header_bytes), zlib.crc32(header_bytes), payload_crc)
+    head += header_bytes
+    head += bytes(_align(len(head)) - len(head))
+
+    tmp_path = None
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=output_path.parent, prefix=f".{output_path.name}.", suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(head)
+            for chunk in writer.chunks:
+                f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, output_path)
+    except Exception as e:
+        if tmp_path and os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise IOError(f"Failed to write snapshot to {output_path}: {e}")
+
+    logger.info(
+        f"Compiled snapshot of {len(diseases)} diseases and {len(symptoms)} symptoms "
+        f"to {output_path} ({len(head) + writer.size} bytes)"
+    )
+    return header
+
+
+def _position(index: int, size: int) -> int:
+    if index < 0:
+        index += size
+    if not 0 <= index < size:
+        raise IndexError("snapshot index out of range")
+    return index
+
+
+class _Strings(Sequence):
+    """Strings decoded on access from offsets + UTF-8 data views"""
+
+    def __init__(self, offsets, data):
+        self.offsets = offsets
+        self.data = data
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        index = _position(index, len(self))
+        return str(self.data[self.offsets[index]:self.offsets[index + 1]], 'utf-8')
+
+
+class _Records(Sequence):
+    """JSON records decoded on first access and kept for later ones"""
+
+    def __init__(self, strings: _Strings, record_type):
+        self.strings = strings
+        self.record_type = record_type
+        self._decoded = {}
+
+    def __len__(self) -> int:
+        return len(self.strings)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        index = _position(index, len(self))
+        record = self._decoded.get(index)
+        if record is None:
+            record = self._decoded.setdefault(
+                index, self.record_type.from_dict(json.loads(self.strings[index])))
+        return record
+
+
+class _RecordList(Sequence):
+    """Records at the given positions"""
+
+    def __init__(self, positions, records: _Records):
+        self.positions = positions
+        self.records = records
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return self.records[self.positions[index]]
+
+
+class _CSR(Sequence):
+    """Rows of ints as zero-copy slices of one values view"""
+
+    def __init__(self, offsets, values):
+        self.offsets = offsets
+        self.values = values
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        index = _position(index, len(self))
+        return self.values[self.offsets[index]:self.offsets[index + 1]]
+
+
+class _Lookup(Mapping):
+    """Hash table from string key to its index in the key strings"""
+
+    def __init__(self, table, keys: _Strings):
+        self.table = table
+        self.keys = keys
+
+    def __getitem__(self, key: str) -> int:
+        if isinstance(key, str) and len(self.table):
+            table = self.table
+            mask = len(table) - 1
+            slot = _hash(key) & mask
+            while table[slot]:
+                index = table[slot] - 1
+                if self.keys[index] == key:
+                    return index
+                slot = (slot + 1) & mask
+        raise KeyError(key)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __iter__(self):
+        return iter(self.keys)
+
+
+class _RecordMap(Mapping):
+    """Records by string key through a _Lookup"""
+
+    def __init__(self, lookup: _Lookup, positions, records: _Records):
+        self.lookup = lookup
+        self.positions = positions
+        self.records = records
+
+    def __getitem__(self, key: str) -> Dict:
+        return self.records[self.positions[self.lookup[key]]]
+
+    def __len__(self) -> int:
+        return len(self.lookup)
+
+    def __iter__(self):
+        return iter(self.lookup)
+
+
+class _SymptomsByInt(Mapping):
+    """Symptom records by interned symptom id"""
+
+    def __init__(self, key_records, records: _Records):
+        self.key_records = key_records
+        self.records = records
+
+    def __getitem__(self, symptom_int: int) -> Dict:
+        if isinstance(symptom_int, int) and 0 <= symptom_int < len(self.key_records):
+            position = self.key_records[symptom_int]
+            if position:
+                return self.records[position - 1]
+        raise KeyError(symptom_int)
+
+    def __len__(self) -> int:
+        return sum(1 for position in self.key_records if position)
+
+    def __iter__(self):
+        return (i for i, position in enumerate(self.key_records) if position)
+
+
+class SnapshotIdSpace(IdSpace):
+    """Read-only IdSpace whose keys and ids live in a snapshot"""
+
+    def __init__(self, lookup: _Lookup):
+        self.keys = lookup.keys
+        self.ids = lookup
+
+    def intern(self, key: str) -> int:
+        """Get the id of a known key; new keys cannot be added"""
+        id_ = self.ids.get(key)
+        if id_ is None:
+            raise TypeError(f"Cannot intern {key!r}: snapshot id space is read-only")
+        return id_
+
+
+class Snapshot:
+    """A snapshot file mapped read-only, with typed views on its sections"""
+
+    def __init__(self, path: Path, verify: bool = False):
+        """Map path and check its header; verify also checks the payload checksum"""
+        self.path = Path(path)
+        with open(self.path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._buffer = memoryview(self._mmap)
+
+        if len(self._buffer) < _PREAMBLE.size:
+            raise ValueError(f"{self.path} is not a knowledge base snapshot")
+        magic, version, header_len, header_crc, payload_crc = _PREAMBLE.unpack_from(self._buffer)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not a knowledge base snapshot")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported snapshot format {version} (expected {FORMAT_VERSION})")
+
+        header_bytes = self._buffer[_PREAMBLE.size:_PREAMBLE.size + header_len]
+        if zlib.crc32(header_bytes) != header_crc:
+            raise ValueError(f"Snapshot header checksum mismatch in {self.path}")
+        self.header = json.loads(str(header_bytes, 'utf-8'))
+        if self.header['byteorder'] != sys.byteorder:
+            raise ValueError(f"Snapshot was compiled for a {self.header['byteorder']}-endian machine")
+
+        self._payload_start = _align(_PREAMBLE.size + header_len)
+        self._payload_crc = payload_crc
+        if verify:
+            self.verify()
+
+    def verify(self) -> None:
+        """Check the payload checksum, raising ValueError on mismatch"""
+        # crc32 reads the mapping directly, without copying it
+        if zlib.crc32(self._buffer[self._payload_start:]) != self._payload_crc:
+            raise ValueError(f"Snapshot payload checksum mismatch in {self.path}")
+
+    def section(self, name: str) -> memoryview:
+        """Zero-copy view on one section"""
+        offset, length, typecode = self.header['sections'][name]
+        start = self._payload_start + offset
+        view = self._buffer[start:start + length]
+        return view if typecode == 'B' else view.cast(typecode)
+
+    def strings(self, name: str) -> _Strings:
+        return _Strings(self.section(name + '.offsets'), self.section(name + '.data'))
+
+    def records(self, name: str, record_type) -> _Records:
+        """Records of record_type (Disease or Symptom) decoded on access"""
+        return _Records(self.strings(name), record_type)
+
+    def csr(self, name: str) -> _CSR:
+        return _CSR(self.section(name + '.offsets'), self.section(name + '.values'))
+
+    def lookup(self, name: str) -> _Lookup:
+        return _Lookup(self.section(name + '.table'), self.strings(name))
+
+    def close(self) -> None:
+        """Unmap the file, unless views handed out are still referenced"""
+        try:
+            self._buffer.release()
+            self._mmap.close()
+        except BufferError:
+            # Unmapped by the garbage collector once the last view is gone
+            logger.debug(f"Snapshot {self.path} still referenced, left mapped")
+
+
+def _revision(header: Dict, stat: os.stat_result) -> str:
+    """Revision of a snapshot; older headers without one fall back to the file's mtime and size"""
+    return header.get('revision') or f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
+
+class SnapshotKnowledgeManager(KnowledgeManager):
+    """Read-only knowledge manager served from a memory-mapped snapshot
+
+    Nothing is parsed or indexed at load: lookups probe the snapshot's hash
+    tables, ranking walks its posting lists in place, the incidence matrix is
+    a numpy view on the mapping and records are decoded on first access. Load
+    time therefore does not grow with the catalogue, and worker processes
+    mapping the same file share its pages. Changes go to the JSON knowledge
+    base and reach this manager when the snapshot is recompiled, on reload().
+    With source_path set, the manager recompiles the snapshot itself when
+    that JSON file or its journal is newer, at load and on reload().
+    """
+
+    def __init__(self,
+                 snapshot_path: Path = KNOWLEDGE_SNAPSHOT_PATH,
+                 verify: bool = KNOWLEDGE_SNAPSHOT_VERIFY,
+                 source_path: Optional[Path] = None):
+        """Map the snapshot at snapshot_path (compiled from source_path, if given)"""
+        self.snapshot_path = Path(snapshot_path)
+        self.verify = verify
+        self.source_path = None if source_path is None else Path(source_path)
+        self.snapshot = None
+        # Source mtimes at the last recompile check, so a failed compile is
+        # only retried once the source changes again
+        self._source_mtimes = None
+        super().__init__(self.snapshot_path)
+
+    def _open_journal(self) -> None:
+        """Snapshots are read-only, so they have no journal"""
+        return None
+
+    def _recompile_if_stale(self) -> None:
+        """Recompile the snapshot if the source JSON file or its journal is newer"""
+        if self.source_path is None:
+            return
+        self._source_mtimes = _mtimes(_source_paths(self.source_path))
+        if snapshot_is_stale(self.snapshot_path, self.source_path):
+            _compile_source(self.source_path, self.snapshot_path)
+
+    def load_knowledge_base(self) -> Dict:
+        """Map the snapshot and wire its views in place of the indexes"""
+        try:
+            self._recompile_if_stale()
+            logger.info(f"Mapping knowledge base snapshot {self.snapshot_path}")
+            # Stat before mapping: a snapshot renamed in meanwhile only
+            # costs one more header check, never a missed change
+            stat = os.stat(self.snapshot_path)
+            snapshot = Snapshot(self.snapshot_path, self.verify)
+            header = snapshot.header
+            fingerprint = (stat.st_mtime_ns, stat.st_size, _revision(header, stat))
+
+            diseases = snapshot.records('disease_records', Disease)
+            symptoms = snapshot.records('symptom_records', Symptom)
+            knowledge_base = dict(header['meta'], diseases=diseases, symptoms=symptoms)
+            state = KnowledgeState(knowledge_base, self.version + 1,
+                                   SnapshotIdSpace(snapshot.lookup('symptom_keys')))
+
+            disease_ids = snapshot.lookup('disease_ids')
+            state.disease_space = SnapshotIdSpace(disease_ids)
+            state.symptoms_by_int = _SymptomsByInt(snapshot.section('key_records'), symptoms)
+            state.symptom_triage = {int(k): v for k, v in header['symptom_triage'].items()}
+
+            state.diseases_by_id = _RecordMap(
+                disease_ids, snapshot.section('disease_ids.values'), diseases)
+            state.diseases_by_name = _RecordMap(
+                snapshot.lookup('disease_names'), snapshot.section('disease_names.values'), diseases)
+            state.symptoms_by_id = _RecordMap(
+                snapshot.lookup('symptom_ids'), snapshot.section('symptom_ids.values'), symptoms)
+
+            state.categories = list(header['categories'])
+            category_symptoms = snapshot.csr('categories')
+            state.symptoms_by_category = {
+                category: _RecordList(category_symptoms[i], symptoms)
+                for i, category in enumerate(state.categories)
+            }
+            state.total_disease_symptoms = header['total_disease_symptoms']
+            state.revision = fingerprint[2]
+
+            state.disease_index = DiseaseIndex.from_arrays(
+                diseases,
+                snapshot.csr('postings'),
+                snapshot.csr('disease_symptoms'),
+                snapshot.section('symptom_counts'),
+                state.symptom_space
+            )
+            if np is not None:
+                matrix = np.frombuffer(snapshot.section('incidence'), dtype=np.uint8)
+                state.incidence_matrix = IncidenceMatrixScorer.from_arrays(
+                    diseases,
+                    state.disease_index.disease_symptom_ids,
+                    matrix.reshape(len(diseases), header['row_bytes']),
+                    np.frombuffer(snapshot.section('symptom_counts'), dtype=np.uint32),
+                    state.symptom_space,
+                    header['n_columns']
+                )
+
+            with self._write_lock:
+                self._state = state
+                self._fingerprint = fingerprint
+                previous, self.snapshot = self.snapshot, snapshot
+            if previous is not None:
+                # Unmapped once calls still running on the old state are done
+                previous.close()
+            logger.info(f"Mapped {len(self.diseases)} diseases and {len(self.symptoms)} symptoms")
+            return self.knowledge_base
+
+        except Exception as e:
+            logger.error(f"Failed to load knowledge base snapshot: {e}")
+            raise
+
+    def _file_fingerprint(self) -> Tuple[int, int, str]:
+        """(mtime_ns, size, revision) of the snapshot, read from its header
+        
+        Recompiling always rewrites the file, so the header's revision tells
+        whether the content changed without hashing the whole snapshot.
+        """
+        stat = os.stat(self.snapshot_path)
+        try:
+            snapshot = Snapshot(self.snapshot_path)
+        except ValueError:
+            # Not a valid snapshot: let the reload report it
+            return stat.st_mtime_ns, stat.st_size, None
+        revision = _revision(snapshot.header, stat)
+        snapshot.close()
+        return stat.st_mtime_ns, stat.st_size, revision
+
+    def has_external_changes(self) -> bool:
+        """Whether the snapshot was replaced or, with source_path, is now stale"""
+        if (self.source_path is not None
+                and _mtimes(_source_paths(self.source_path)) != self._source_mtimes
+                and snapshot_is_stale(self.snapshot_path, self.source_path)):
+            return True
+        return super().has_external_changes()
+
+    def _read_only(self, action: str) -> None:
+        logger.error(f"Cannot {action}: the knowledge base snapshot is read-only")
+
+    def add_disease(self, disease_data: Dict) -> bool:
+        """Snapshots are read-only; add to the JSON knowledge base and recompile"""
+        self._read_only('add disease')
+        return False
+
+    def add_symptom(self, symptom_data: Dict) -> bool:
+        """Snapshots are read-only; add to the JSON knowledge base and recompile"""
+        self._read_only('add symptom')
+        return False
+
+    def _add_batch(self, op: str, records: List[Dict], validate) -> int:
+        self._read_only(op.replace('_', ' '))
+        return 0
+
+    def apply_patch(self, changes: List[Dict]) -> int:
+        """Snapshots are read-only; patch the JSON knowledge base and recompile"""
+        self._read_only('apply patch')
+        return 0
+
+    def compact(self, background: bool = False) -> bool:
+        """Nothing to fold: a snapshot has no journal"""
+        return True
+
+    def close(self) -> None:
+        """Unmap the snapshot"""
+        super().close()
+        if self.snapshot is not None:
+            self.snapshot.close()
+
+
+def _source_paths(knowledge_base_path: Path) -> List[Path]:
+    """The JSON file and the journal files a snapshot is compiled from"""
+    journal = KnowledgeJournal(journal_path(knowledge_base_path))
+    return [Path(knowledge_base_path), journal.path, journal.rotated_path]
+
+
+def _mtimes(paths: Iterable[Path]) -> Tuple:
+    return tuple(path.stat().st_mtime_ns if path.exists() else None for path in paths)
+
+
+def _compile_source(knowledge_base_path: Path, snapshot_path: Path) -> None:
+    """Compile the snapshot of the JSON knowledge base at knowledge_base_path"""
+    source = KnowledgeManager(knowledge_base_path)
+    try:
+        compile_snapshot(source, snapshot_path)
+    finally:
+        source.close()
+
+
+def snapshot_is_stale(snapshot_path: Path = KNOWLEDGE_SNAPSHOT_PATH,
+                      knowledge_base_path: Path = KNOWLEDGE_BASE_PATH) -> bool:
+    """True if the snapshot is missing or older than the JSON file or its journal"""
+    snapshot_path = Path(snapshot_path)
+    if not snapshot_path.exists():
+        return True
+    compiled = snapshot_path.stat().st_mtime
+    return any(source.exists() and source.stat().st_mtime > compiled
+               for source in _source_paths(knowledge_base_path))
+
+
+def load_snapshot(knowledge_base_path: Path = KNOWLEDGE_BASE_PATH,
+                  snapshot_path: Path = KNOWLEDGE_SNAPSHOT_PATH) -> SnapshotKnowledgeManager:
+    """Map the snapshot of a knowledge base, recompiled whenever the JSON file is newer"""
+    return SnapshotKnowledgeManager(snapshot_path, source_path=knowledge_base_path)
+
+
+def main(argv: List[str] = None) -> int:
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Knowledge base snapshot tools")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    compile_parser = subparsers.add_parser('compile', help="compile the JSON knowledge base into a snapshot")
+    compile_parser.add_argument('--knowledge-base', type=Path, default=KNOWLEDGE_BASE_PATH)
+    compile_parser.add_argument('--output', type=Path, default=KNOWLEDGE_SNAPSHOT_PATH)
+    verify_parser = subparsers.add_parser('verify', help="check a snapshot's checksums")
+    verify_parser.add_argument('path', type=Path, nargs='?', default=KNOWLEDGE_SNAPSHOT_PATH)
+    args = parser.parse_args(argv)
+
+    if args.command == 'compile':
+        knowledge_manager = KnowledgeManager(args.knowledge_base)
+        header = compile_snapshot(knowledge_manager, args.output)
+        knowledge_manager.close()
+        stats = header['statistics']
+        print(f"Compiled {stats['total_diseases']} diseases and {stats['total_symptoms']} symptoms to {args.output}")
+        return 0
+
+    try:
+        snapshot = Snapshot(args.path, verify=True)
+    except (OSError, ValueError) as e:
+        print(f"Invalid snapshot: {e}")
+        return 1
+    stats = snapshot.header['statistics']
+    snapshot.close()
+    print(f"{args.path}: OK ({stats['total_diseases']} diseases, {stats['total_symptoms']} symptoms)")
+    return 0
+
+
+# Export
+__all__ = [
+    'Snapshot',
+    'SnapshotIdSpace',
+    'SnapshotKnowledgeManager',
+    'compile_snapshot',
+    'load_snapshot',
+    'snapshot_is_stale',
+    'main'
+]
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+"""
+Keyword Matcher for AI Medical Diagnosis System
+Aho-Corasick automaton that finds many keywords in a single pass over the text
+"""
+from collections import deque
+from typing import List, Dict, Iterable
+
+from utils import normalize_text, fold_diacritics, diacritics_compatible
+
+
+class KeywordMatcher:
+    """Multi-keyword matcher compiled once and reused for every message
+
+    Keywords are compiled on their diacritic-folded form, so "kho tho" finds
+    "khó thở". A folded hit is only accepted when every character the user
+    typed either equals the keyword character or carries no diacritic, which
+    keeps "chăm sóc" from matching "sốc". Hits must also sit on word
+    boundaries.
+    """
+
+    def __init__(self, keywords: Iterable[str]):
+        """Build the automaton"""
+        self.keywords = []
+        self._normalized = []
+        self._goto = [{}]
+        self._fail = [0]
+        self._outputs = [()]
+
+        seen = set()
+        for keyword in keywords:
+            normalized = normalize_text(keyword).strip()
+            if not normalized or normalized in seen:
+                continue
+            seen.add(normalized)
+            self.keywords.append(keyword)
+            self._normalized.append(normalized)
+            self._insert(fold_diacritics(normalized), len(self.keywords) - 1)
+
+        self._build_failure_links()
+
+    def __len__(self) -> int:
+        return len(self.keywords)
+
+    def _insert(self, folded: str, keyword_index: int) -> None:
+        """Add one folded keyword to the trie"""
+        state = 0
+        for char in folded:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._outputs.append(())
+            state = next_state
+        self._outputs[state] = self._outputs[state] + (keyword_index,)
+
+    def _build_failure_links(self) -> None:
+        """Breadth-first pass computing failure links and merged outputs"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                self._outputs[next_state] += self._outputs[self._fail[next_state]]
+
+    def find_all(self, text: str) -> List[Dict]:
+        """Find every keyword occurrence in text
+
+        Returns dicts with 'keyword', 'start' and 'end' (offsets into the NFC
+        form of text), ordered by position.
+        """
+        if not text or not self.keywords:
+            return []
+
+        normalized = normalize_text(text)
+        folded = fold_diacritics(normalized)
+        goto, fail, outputs = self._goto, self._fail, self._outputs
+
+        matches = []
+        state = 0
+        for position, char in enumerate(folded):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if not outputs[state]:
+                continue
+
+            end = position + 1
+            for keyword_index in outputs[state]:
+                keyword = self._normalized[keyword_index]
+                start = end - len(keyword)
+                if self._accept(normalized, start, end, keyword):
+                    matches.append({
+                        'keyword': self.keywords[keyword_index],
+                        'start': start,
+                        'end': end
+                    })
+
+        matches.sort(key=lambda m: (m['start'], -m['end']))
+        return matches
+
+    def contains_any(self, text: str) -> bool:
+        """Check whether text mentions at least one keyword"""
+        return bool(self.find_all(text))
+
+    @staticmethod
+    def _accept(normalized: str, start: int, end: int, keyword: str) -> bool:
+        """Check word boundaries and diacritic compatibility of a folded hit"""
+        if start > 0 and normalized[start - 1].isalnum():
+            return False
+        if end < len(normalized) and normalized[end].isalnum():
+            return False
+        return diacritics_compatible(normalized[start:end], keyword)
+
+
+# Export
+__all__ = ['KeywordMatcher']
@@ -2,46 +2,429 @@
 Knowledge Manager for AI Medical Diagnosis System
 Handles loading, validation, and management of medical knowledge base
 """
+import bisect
+import hashlib
+import json
 import logging
-from typing import List, Dict, Optional
+import os
+import threading
+from collections.abc import Mapping
+from typing import List, Dict, Optional, Tuple
 from pathlib import Path
 
-from config import KNOWLEDGE_BASE_PATH
+from config import (
+    KNOWLEDGE_BASE_PATH,
+    TOP_K_DISEASES,
+    CONTEXT_TOKEN_BUDGET,
+    CHARS_PER_TOKEN,
+    JOURNAL_COMPACT_THRESHOLD,
+    KNOWLEDGE_RELOAD_INTERVAL
+)
+from disease_index import DiseaseIndex, RankingState
+from id_space import IdSpace
+from incidence_matrix import IncidenceMatrixScorer
+from journal import KnowledgeJournal, journal_path
+from records import Disease, Symptom, to_plain
+from symptom_extractor import SymptomExtractor
+from triage import TRIAGE_ENGINE
 from utils import (
     setup_logging, 
     load_json_file, 
     save_json_file,
+    estimate_tokens,
+    file_fingerprint,
+    validate_symptom_record,
+    validate_disease_record,
     validate_symptoms_data,
     validate_diseases_data
 )
 
 logger = setup_logging(__name__)
 
+# Operations of apply_patch() and of the journal
+CHANGE_OPS = ('add_disease', 'add_symptom', 'update_disease', 'update_symptom', 'remove_disease')
+
+
+def _position(records: List[Dict], record: Dict) -> int:
+    """Position of a record in a list, by identity"""
+    for position, item in enumerate(records):
+        if item is record:
+            return position
+    raise ValueError(f"Record {record['id']} is not indexed")
+
+
+class KnowledgeState:
+    """One version of the knowledge base with its lookup indexes and caches
+    
+    A new state is built off to the side and published by a single reference
+    assignment, so a reader that takes the current state once works on one
+    consistent version for the whole call, without locking. A published
+    state is never modified again (apart from its lazily built caches);
+    changes go to a derive()d copy.
+    """
+    
+    def __init__(self, knowledge_base: Dict, version: int, symptom_space: Optional[IdSpace] = None):
+        """Empty indexes over knowledge_base; build() fills them"""
+        self.knowledge_base = knowledge_base
+        self.diseases = knowledge_base['diseases']
+        self.symptoms = knowledge_base['symptoms']
+        self.version = version
+        # Content hash, stable across processes (see advance())
+        self.revision = None
+        # Dense integer ids for symptoms (lowercased id) and diseases
+        self.symptom_space = IdSpace() if symptom_space is None else symptom_space
+        self.disease_space = IdSpace()
+        self.symptoms_by_int = {}
+        self.symptom_triage = {}
+        self.disease_index = DiseaseIndex(symptom_space=self.symptom_space)
+        # Hash and secondary indexes, kept in sync by index_disease/index_symptom
+        self.diseases_by_id = {}
+        self.diseases_by_name = {}
+        self.symptoms_by_id = {}
+        self.symptoms_by_category = {}
+        self.categories = []
+        self.total_disease_symptoms = 0
+        self.clear_caches()
+    
+    def clear_caches(self) -> None:
+        """Drop derived structures built on first use"""
+        self.symptom_extractor = None
+        self.incidence_matrix = None
+        self.knowledge_context = None
+        self.snippets = {}
+    
+    def build(self) -> 'KnowledgeState':
+        """Index all records"""
+        # Catalogue symptoms take the low ids, in file order
+        for symptom in self.symptoms:
+            self.index_symptom(symptom)
+        for disease in self.diseases:
+            self.index_disease(disease)
+        return self
+    
+    def index_disease(self, disease: Dict) -> None:
+        """Add one disease to the lookup indexes"""
+        # First record wins, as with the former linear scans
+        self.disease_space.intern(disease['id'])
+        self.diseases_by_id.setdefault(disease['id'], disease)
+        self.diseases_by_name.setdefault(disease['name'].lower(), disease)
+        self.total_disease_symptoms += len(disease.get('symptoms', []))
+        self.disease_index.add_disease(disease)
+    
+    def index_symptom(self, symptom: Dict) -> None:
+        """Add one symptom to the lookup indexes"""
+        symptom_int = self.symptom_space.intern(symptom['id'].lower())
+        self.symptoms_by_int.setdefault(symptom_int, symptom)
+        self.symptoms_by_id.setdefault(symptom['id'], symptom)
+        # Emergency keywords in the name are resolved once, not per request
+        matches = TRIAGE_ENGINE.triage(symptom['name'])['matches']
+        if matches:
+            self.symptom_triage.setdefault(symptom_int, matches)
+        if 'category' in symptom:
+            category = symptom['category']
+            if category not in self.symptoms_by_category:
+                self.symptoms_by_category[category] = []
+                bisect.insort(self.categories, category)
+            self.symptoms_by_category[category].append(symptom)
+    
+    def derive(self) -> 'KnowledgeState':
+        """Unpublished copy for the next version, to apply changes to
+        
+        Records are immutable and shared; containers are copied (posting
+        lists on first write). Caches that stay valid are carried over and
+        append() drops the ones a change invalidates.
+        """
+        state = KnowledgeState.__new__(KnowledgeState)
+        state.knowledge_base = dict(self.knowledge_base, diseases=list(self.diseases), symptoms=list(self.symptoms))
+        state.diseases = state.knowledge_base['diseases']
+        state.symptoms = state.knowledge_base['symptoms']
+        state.version = self.version + 1
+        state.revision = self.revision
+        state.symptom_space = self.symptom_space.copy()
+        state.disease_space = self.disease_space.copy()
+        state.symptoms_by_int = dict(self.symptoms_by_int)
+        state.symptom_triage = dict(self.symptom_triage)
+        state.disease_index = self.disease_index.copy(state.symptom_space)
+        state.diseases_by_id = dict(self.diseases_by_id)
+        state.diseases_by_name = dict(self.diseases_by_name)
+        state.symptoms_by_id = dict(self.symptoms_by_id)
+        state.symptoms_by_category = {
+            category: list(symptoms) for category, symptoms in self.symptoms_by_category.items()
+        }
+        state.categories = list(self.categories)
+        state.total_disease_symptoms = self.total_disease_symptoms
+        state.symptom_extractor = self.symptom_extractor
+        state.incidence_matrix = None
+        state.knowledge_context = None
+        state.snippets = dict(self.snippets)
+        return state
+    
+    def append(self, op: str, records: List[Dict]) -> None:
+        """Append and index new records ('add_disease' or 'add_symptom')
+        
+        Only for a state that is not published yet.
+        """
+        target, index, record_type = (
+            (self.diseases, self.index_disease, Disease) if op == 'add_disease'
+            else (self.symptoms, self.index_symptom, Symptom)
+        )
+        records = [record_type.from_dict(record) for record in records]
+        target.extend(records)
+        for record in records:
+            index(record)
+        self.incidence_matrix = None
+        self.knowledge_context = None
+        if op == 'add_symptom':
+            self.symptom_extractor = None
+    
+    def advance(self, entries: List[Dict]) -> None:
+        """Chain the revision hash over applied journal entries"""
+        payload = json.dumps([self.revision, to_plain(entries)], ensure_ascii=False, sort_keys=True)
+        self.revision = hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    
+    def apply(self, op: str, data: Dict) -> Dict:
+        """Apply one change (see CHANGE_OPS), returning the data to journal
+        
+        Only for a state that is not published yet. Updates merge data into
+        the current record and are journaled as the full new record, so
+        replaying them is idempotent. Raises ValueError for an invalid change.
+        """
+        if op not in CHANGE_OPS:
+            raise ValueError(f"Unknown operation: {op}")
+        if not isinstance(data, Mapping) or 'id' not in data:
+            raise ValueError("Missing required field: id")
+        
+        kind = op.split('_', 1)[1]
+        by_id, validate = (
+            (self.diseases_by_id, validate_disease_record) if kind == 'disease'
+            else (self.symptoms_by_id, validate_symptom_record)
+        )
+        current = by_id.get(data['id'])
+        if op.startswith('add_'):
+            record = data
+            if current is not None:
+                raise ValueError(f"Duplicate id: {data['id']}")
+        elif current is None:
+            raise ValueError(f"Unknown id: {data['id']}")
+        elif op == 'remove_disease':
+            self.replace_disease(current, None)
+            return {'id': current['id']}
+        else:
+            record = dict(current.to_dict(), **data)
+        
+        error = validate(record)
+        if error:
+            raise ValueError(error)
+        if current is None:
+            self.append(op, [record])
+        elif kind == 'disease':
+            self.replace_disease(current, Disease.from_dict(record))
+        else:
+            self.replace_symptom(current, Symptom.from_dict(record))
+        return record
+    
+    def _rekey(self, mapping: Dict, records: List[Dict], old: Dict, new: Optional[Dict], key) -> None:
+        """Move a first-record-wins map entry from old to new (None: removed)"""
+        old_key = key(old)
+        if mapping.get(old_key) is old:
+            if new is not None and key(new) == old_key:
+                # Same key at the same position
+                mapping[old_key] = new
+                return
+            del mapping[old_key]
+            for record in records:
+                if key(record) == old_key:
+                    mapping[old_key] = record
+                    break
+        if new is not None:
+            mapping.setdefault(key(new), new)
+    
+    def replace_disease(self, old: Dict, new: Optional[Dict]) -> None:
+        """Re-index an updated disease in place, or remove it if new is None"""
+        position = _position(self.diseases, old)
+        if new is None:
+            del self.diseases[position]
+        else:
+            self.diseases[position] = new
+        
+        index_position = self.disease_index.positions[old['id']]
+        if new is None:
+            self.disease_index.remove_disease(index_position)
+        else:
+            self.disease_index.update_disease(index_position, new)
+        self._rekey(self.diseases_by_id, self.diseases, old, new, lambda d: d['id'])
+        self._rekey(self.diseases_by_name, self.diseases, old, new, lambda d: d['name'].lower())
+        self.total_disease_symptoms -= len(old.get('symptoms', []))
+        if new is not None:
+            self.total_disease_symptoms += len(new.get('symptoms', []))
+        
+        self.snippets = {key: value for key, value in self.snippets.items() if key[1] != old['id']}
+        self.incidence_matrix = None
+        self.knowledge_context = None
+    
+    def replace_symptom(self, old: Dict, new: Dict) -> None:
+        """Re-index an updated symptom in place (its id is unchanged)"""
+        self.symptoms[_position(self.symptoms, old)] = new
+        symptom_int = self.symptom_space.get(old['id'].lower())
+        if self.symptoms_by_int.get(symptom_int) is old:
+            self.symptoms_by_int[symptom_int] = new
+            matches = TRIAGE_ENGINE.triage(new['name'])['matches']
+            if matches:
+                self.symptom_triage[symptom_int] = matches
+            else:
+                self.symptom_triage.pop(symptom_int, None)
+        self._rekey(self.symptoms_by_id, self.symptoms, old, new, lambda s: s['id'])
+        
+        old_category, category = old.get('category'), new.get('category')
+        if old_category is not None and old_category == category:
+            group = self.symptoms_by_category[category]
+            group[_position(group, old)] = new
+        else:
+            if old_category is not None:
+                group = self.symptoms_by_category[old_category]
+                del group[_position(group, old)]
+                if not group:
+                    del self.symptoms_by_category[old_category]
+                    self.categories.remove(old_category)
+            if category is not None:
+                if category not in self.symptoms_by_category:
+                    bisect.insort(self.categories, category)
+                # Catalogue order inside the category
+                self.symptoms_by_category[category] = [
+                    s for s in self.symptoms if s.get('category') == category
+                ]
+        
+        self.symptom_extractor = None
+        self.knowledge_context = None
+
 
 class KnowledgeManager:
-    """Manage medical knowledge base"""
+    """Manage medical knowledge base
+    
+    All indexes live in a KnowledgeState. Loading, and reload() when the
+    file changes on disk, build a complete new state and publish it in one
+    assignment: calls already running finish on the state they started
+    with, later calls see the new one, and readers never take a lock.
+    Symptom ids are carried over from the previous state, so ids held by a
+    session stay valid across reloads.
+    
+    Writers are serialised by a single lock and copy on write: a change is
+    applied to a derived copy of the current state, which is then published
+    the same way, so one manager can be shared by concurrent sessions.
+    """
     
     def __init__(self, knowledge_base_path: Path = KNOWLEDGE_BASE_PATH):
         """Initialize knowledge manager"""
         self.knowledge_base_path = knowledge_base_path
-        self.knowledge_base = None
-        self.diseases = []
-        self.symptoms = []
+        # Inserts are appended here; the JSON file is only rewritten on compaction
+        self.journal = self._open_journal()
+        self._write_lock = threading.RLock()
+        self._compaction_thread = None
+        self._state = KnowledgeState({'diseases': [], 'symptoms': []}, 0)
+        # (mtime_ns, size, sha256) of the file behind the current state
+        self._fingerprint = None
+        self._watch_thread = None
+        self._stop_watching = threading.Event()
         self.load_knowledge_base()
     
+    def _open_journal(self) -> Optional[KnowledgeJournal]:
+        """Journal of the JSON file; backends that store changes elsewhere have none"""
+        return KnowledgeJournal(journal_path(self.knowledge_base_path))
+    
+    @property
+    def state(self) -> KnowledgeState:
+        """The published state: one consistent version that is never modified
+        
+        Take it once to work on a single version while the manager keeps
+        changing or reloading.
+        """
+        return self._state
+    
+    @property
+    def knowledge_base(self) -> Dict:
+        return self._state.knowledge_base
+    
+    @property
+    def diseases(self) -> List[Dict]:
+        return self._state.diseases
+    
+    @property
+    def symptoms(self) -> List[Dict]:
+        return self._state.symptoms
+    
+    @property
+    def version(self) -> int:
+        """Bumped on every load or change; derived indexes are cached against it"""
+        return self._state.version
+    
+    @property
+    def revision(self) -> Optional[str]:
+        """Content hash of the current version, the same in every process
+        
+        Unlike version it can key caches shared between processes or kept
+        across restarts.
+        """
+        return self._state.revision
+    
+    @property
+    def symptom_space(self) -> IdSpace:
+        return self._state.symptom_space
+    
+    @property
+    def disease_index(self) -> DiseaseIndex:
+        return self._state.disease_index
+    
+    def _publish(self, op: str, records: List[Dict], log: bool = True) -> None:
+        """Apply a change to a copy of the current state, log it and publish it
+        
+        The change is journaled only once it applied cleanly, so a failure
+        leaves both the journal and the published state untouched. A single
+        record goes through the batched-fsync append. Callers hold the write
+        lock; log=False is for changes already stored elsewhere.
+        """
+        entries = [{'op': op, 'data': record} for record in records]
+        state = self._state.derive()
+        state.append(op, records)
+        if log:
+            if len(records) == 1:
+                self.journal.append(op, records[0])
+            else:
+                self.journal.append_many(op, records)
+        state.advance(entries)
+        self._state = state
+    
+    def _new_state(self, knowledge_base: Dict) -> KnowledgeState:
+        """Empty state for the next version, reusing the current symptom ids
+        
+        Records are converted to slotted Disease/Symptom objects.
+        """
+        payload = json.dumps(to_plain(knowledge_base), ensure_ascii=False, sort_keys=True)
+        revision = hashlib.sha256(payload.encode('utf-8')).hexdigest()
+        knowledge_base['diseases'] = [Disease.from_dict(d) for d in knowledge_base['diseases']]
+        knowledge_base['symptoms'] = [Symptom.from_dict(s) for s in knowledge_base['symptoms']]
+        state = KnowledgeState(knowledge_base, self.version + 1, IdSpace(self._state.symptom_space.keys))
+        state.revision = revision
+        return state
+    
     def load_knowledge_base(self) -> Dict:
-        """Load knowledge base from JSON file"""
+        """Load knowledge base from JSON file, then replay the journal"""
         try:
             logger.info(f"Loading knowledge base from {self.knowledge_base_path}")
-            self.knowledge_base = load_json_file(self.knowledge_base_path)
-            
-            # Extract diseases and symptoms
-            self.diseases = self.knowledge_base.get('diseases', [])
-            self.symptoms = self.knowledge_base.get('symptoms', [])
-            
-            # Validate data
-            if not self.validate_knowledge_base():
-                raise ValueError("Invalid knowledge base structure")
+            with self._write_lock:
+                fingerprint = file_fingerprint(self.knowledge_base_path)
+                knowledge_base = load_json_file(self.knowledge_base_path)
+                
+                # Extract diseases and symptoms
+                knowledge_base.setdefault('diseases', [])
+                knowledge_base.setdefault('symptoms', [])
+                self._replay_journal(knowledge_base, self.journal.replay())
+                
+                # Validate data
+                if not self.validate_knowledge_base(knowledge_base):
+                    raise ValueError("Invalid knowledge base structure")
+                
+                self._state = self._new_state(knowledge_base).build()
+                self._fingerprint = fingerprint
             
             logger.info(f"Loaded {len(self.diseases)} diseases and {len(self.symptoms)} symptoms")
             return self.knowledge_base
@@ -50,14 +433,57 @@ class KnowledgeManager:
             logger.error(f"Failed to load knowledge base: {e}")
             raise
     
-    def validate_knowledge_base(self) -> bool:
-        """Validate knowledge base structure"""
+    def _replay_journal(self, knowledge_base: Dict, entries: List[Dict]) -> None:
+        """Apply journal entries on top of the loaded snapshot
+        
+        Inserts of an id already present are skipped and updates carry the
+        full record, which makes replay idempotent if a compaction was
+        interrupted. Updated records keep their position; removed ones leave
+        a gap dropped at the end.
+        """
+        targets = {}
+        for kind in ('disease', 'symptom'):
+            records = knowledge_base[kind + 's']
+            positions = {}
+            for position, record in enumerate(records):
+                positions.setdefault(record.get('id'), position)
+            targets[kind] = (records, positions)
+        
+        for entry in entries:
+            op = entry.get('op')
+            if op not in CHANGE_OPS:
+                logger.warning(f"Skipping unknown journal operation: {op}")
+                continue
+            action, kind = op.split('_', 1)
+            records, positions = targets[kind]
+            data = entry.get('data') or {}
+            position = positions.get(data.get('id'))
+            if action == 'add':
+                if position is None:
+                    positions[data.get('id')] = len(records)
+                    records.append(data)
+            elif position is not None:
+                if action == 'update':
+                    records[position] = data
+                else:
+                    records[position] = None
+                    del positions[data.get('id')]
+        
+        for records, _ in targets.values():
+            records[:] = [record for record in records if record is not None]
+        
+        if entries:
+            logger.info(f"Replayed {len(entries)} journal entries")
+    
+    def validate_knowledge_base(self, knowledge_base: Optional[Dict] = None) -> bool:
+        """Validate knowledge base structure (the loaded one by default)"""
         try:
-            if not validate_diseases_data(self.diseases):
+            knowledge_base = self.knowledge_base if knowledge_base is None else knowledge_base
+            if not validate_diseases_data(knowledge_base['diseases']):
                 logger.error("Invalid diseases data structure")
                 return False
             
-            if not validate_symptoms_data(self.symptoms):
+            if not validate_symptoms_data(knowledge_base['symptoms']):
                 logger.error("Invalid symptoms data structure")
                 return False
             
@@ -68,122 +494,352 @@ class KnowledgeManager:
             logger.error(f"Validation error: {e}")
             return False
     
+    def _file_fingerprint(self) -> Tuple[int, int, str]:
+        """(mtime_ns, size, content key) of the file, compared by has_external_changes"""
+        return file_fingerprint(self.knowledge_base_path)
+    
+    def has_external_changes(self) -> bool:
+        """Whether the knowledge base file changed on disk since it was loaded
+        
+        The size and mtime are checked first; the file is only hashed when
+        they differ, so touching it without changes does not reload.
+        """
+        if self._fingerprint is None or self.is_compacting():
+            # Our own compaction rewrites the file
+            return False
+        try:
+            stat = os.stat(self.knowledge_base_path)
+            if (stat.st_mtime_ns, stat.st_size) == self._fingerprint[:2]:
+                return False
+            fingerprint = self._file_fingerprint()
+        except OSError as e:
+            logger.warning(f"Cannot check {self.knowledge_base_path}: {e}")
+            return False
+        if fingerprint[2] == self._fingerprint[2]:
+            self._fingerprint = fingerprint
+            return False
+        return True
+    
+    def reload(self) -> bool:
+        """Reload the knowledge base if it changed on disk, returning whether it did
+        
+        The new state is built while the current one keeps serving reads.
+        A failed reload (e.g. a half-edited file) keeps the current state.
+        """
+        if not self.has_external_changes():
+            return False
+        try:
+            self.load_knowledge_base()
+        except Exception:
+            # Retry once the file changes again, not on every check
+            try:
+                self._fingerprint = self._file_fingerprint()
+            except OSError:
+                pass
+            return False
+        logger.info(f"Reloaded knowledge base (version {self.version})")
+        return True
+    
+    def start_watching(self, interval: float = KNOWLEDGE_RELOAD_INTERVAL) -> None:
+        """Check for changes every interval seconds in a daemon thread, reloading on change"""
+        if self._watch_thread is not None and self._watch_thread.is_alive():
+            return
+        self._stop_watching.clear()
+        
+        def watch() -> None:
+            while not self._stop_watching.wait(interval):
+                self.reload()
+        
+        self._watch_thread = threading.Thread(target=watch, name='knowledge-watcher', daemon=True)
+        self._watch_thread.start()
+    
+    def stop_watching(self) -> None:
+        """Stop the watcher thread"""
+        self._stop_watching.set()
+        thread = self._watch_thread
+        if thread is not None:
+            thread.join()
+            self._watch_thread = None
+    
     def get_disease_by_id(self, disease_id: str) -> Optional[Dict]:
         """Get disease information by ID"""
-        for disease in self.diseases:
-            if disease['id'] == disease_id:
-                return disease
-        return None
+        return self._state.diseases_by_id.get(disease_id)
     
     def get_disease_by_name(self, disease_name: str) -> Optional[Dict]:
         """Get disease information by name"""
-        disease_name_lower = disease_name.lower()
-        for disease in self.diseases:
-            if disease['name'].lower() == disease_name_lower:
-                return disease
-        return None
+        return self._state.diseases_by_name.get(disease_name.lower())
     
     def get_symptom_by_id(self, symptom_id: str) -> Optional[Dict]:
         """Get symptom information by ID"""
-        for symptom in self.symptoms:
-            if symptom['id'] == symptom_id:
-                return symptom
-        return None
+        return self._state.symptoms_by_id.get(symptom_id)
     
     def get_symptoms_by_category(self, category: str) -> List[Dict]:
         """Get all symptoms in a category"""
-        return [s for s in self.symptoms if s.get('category') == category]
+        return list(self._state.symptoms_by_category.get(category, []))
     
-    def search_diseases_by_symptoms(self, symptom_ids: List[str]) -> List[Dict]:
-        """Search diseases that match given symptoms"""
-        matching_diseases = []
+    def encode_symptoms(self, symptoms: List[str]) -> List[int]:
+        """Translate symptom ids, names or aliases to unique interned ids
         
-        for disease in self.diseases:
-            disease_symptoms = set(disease.get('symptoms', []))
-            user_symptoms = set(symptom_ids)
-            
-            # Check if any symptoms match
-            if disease_symptoms & user_symptoms:
-                match_count = len(disease_symptoms & user_symptoms)
-                match_ratio = match_count / len(disease_symptoms) if disease_symptoms else 0
-                
-                matching_diseases.append({
-                    'disease': disease,
-                    'match_count': match_count,
-                    'match_ratio': match_ratio,
-                    'matched_symptoms': list(disease_symptoms & user_symptoms)
-                })
-        
-        # Sort by match ratio descending
-        matching_diseases.sort(key=lambda x: (x['match_ratio'], x['match_count']), reverse=True)
-        
-        return matching_diseases
+        Unknown symptoms are dropped; order of first mention is kept.
+        """
+        state = self._state
+        symptom_space = state.symptom_space
+        ids = []
+        for symptom in symptoms:
+            symptom_int = symptom_space.get(symptom.lower())
+            if symptom_int is None:
+                record = self._lookup_symptom(state, symptom)
+                if record:
+                    symptom_int = symptom_space.get(record['id'].lower())
+            if symptom_int is not None:
+                ids.append(symptom_int)
+        return list(dict.fromkeys(ids))
+    
+    def decode_symptoms(self, symptom_ints: List[int]) -> List[str]:
+        """Translate interned ids back to (lowercased) symptom ids"""
+        return self._state.symptom_space.decode(symptom_ints)
+    
+    def symptom_names(self, symptom_ints: List[int]) -> List[str]:
+        """Display names of interned symptoms, the id if it has no record"""
+        state = self._state
+        names = []
+        for symptom_int in symptom_ints:
+            record = state.symptoms_by_int.get(symptom_int)
+            names.append(record['name'] if record else state.symptom_space.key(symptom_int))
+        return names
+    
+    def triage_symptom_ids(self, symptom_ints: List[int]) -> Dict:
+        """Triage interned symptoms from their precomputed keyword matches"""
+        symptom_triage = self._state.symptom_triage
+        matches = []
+        for source, symptom_int in enumerate(symptom_ints):
+            for match in symptom_triage.get(symptom_int, ()):
+                matches.append(dict(match, source=source))
+        return TRIAGE_ENGINE.triage_matches(matches)
+    
+    def search_diseases_by_symptoms(self,
+                                    symptom_ids: List[str],
+                                    top_k: Optional[int] = None) -> List[Dict]:
+        """Search diseases that match given symptoms"""
+        return self._state.disease_index.search(symptom_ids, top_k)
+    
+    def rank_diseases(self, symptoms: List[str], top_k: int = TOP_K_DISEASES) -> List[Dict]:
+        """Rank diseases by Jaccard similarity using the symptom index"""
+        return self._state.disease_index.rank(symptoms, top_k)
+    
+    def rank_diseases_by_ids(self, symptom_ints: List[int], top_k: int = TOP_K_DISEASES) -> List[Dict]:
+        """Rank diseases for interned symptom ids"""
+        return self._state.disease_index.rank_ids(symptom_ints, top_k)
+    
+    def new_ranking_state(self, symptoms: List[str] = None, track_counts: bool = True) -> RankingState:
+        """Create an incremental ranking state bound to the current version"""
+        state = self._state
+        ranking_state = RankingState(state.disease_index, state.version, track_counts)
+        ranking_state.add_symptoms(symptoms or [])
+        return ranking_state
+    
+    def refresh_ranking_state(self, ranking_state: RankingState) -> RankingState:
+        """Rebind a ranking state to the current version if the base changed"""
+        state = self._state
+        if ranking_state.version != state.version:
+            ranking_state.rebind(state.disease_index, state.version)
+        return ranking_state
+    
+    def get_incidence_matrix(self) -> IncidenceMatrixScorer:
+        """Get the incidence matrix for the current knowledge base version"""
+        state = self._state
+        if state.incidence_matrix is None:
+            state.incidence_matrix = IncidenceMatrixScorer(state.diseases, state.symptom_space)
+        return state.incidence_matrix
+    
+    def rank_diseases_batch(self,
+                            symptom_sets: List[List[str]],
+                            top_k: int = TOP_K_DISEASES) -> List[List[Dict]]:
+        """Rank diseases for many symptom sets with the incidence matrix"""
+        return self.get_incidence_matrix().rank_batch(symptom_sets, top_k)
+    
+    def rank_diseases_batch_by_ids(self,
+                                   symptom_int_sets: List[List[int]],
+                                   top_k: int = TOP_K_DISEASES) -> List[List[Dict]]:
+        """Rank diseases for many interned symptom id sets with the incidence matrix"""
+        return self.get_incidence_matrix().rank_batch_ids(symptom_int_sets, top_k)
     
     def get_all_diseases(self) -> List[Dict]:
         """Get all diseases"""
-        return self.diseases
+        return self._state.diseases
     
     def get_all_symptoms(self) -> List[Dict]:
         """Get all symptoms"""
-        return self.symptoms
+        return self._state.symptoms
+    
+    def get_symptom_extractor(self) -> SymptomExtractor:
+        """Get the symptom extractor for the current knowledge base version"""
+        return self._symptom_extractor(self._state)
+    
+    def _symptom_extractor(self, state: KnowledgeState) -> SymptomExtractor:
+        if state.symptom_extractor is None:
+            state.symptom_extractor = SymptomExtractor(state.symptoms)
+        return state.symptom_extractor
+    
+    def lookup_symptom(self, phrase: str) -> Optional[Dict]:
+        """Get symptom by any surface form: name, alias, with or without diacritics"""
+        return self._lookup_symptom(self._state, phrase)
+    
+    def _lookup_symptom(self, state: KnowledgeState, phrase: str) -> Optional[Dict]:
+        for entry in self._symptom_extractor(state).lookup(phrase):
+            symptom = state.symptoms_by_id.get(entry['symptom_id'])
+            if symptom:
+                return symptom
+        return None
     
     def get_symptom_categories(self) -> List[str]:
         """Get unique symptom categories"""
-        categories = set()
-        for symptom in self.symptoms:
-            if 'category' in symptom:
-                categories.add(symptom['category'])
-        return sorted(list(categories))
+        return list(self._state.categories)
+    
+    def _snippet(self, kind: str, disease: Dict, build) -> str:
+        """Get a per-disease prompt snippet, rebuilt only after a change"""
+        state = self._state
+        if state.diseases_by_id.get(disease['id']) is not disease:
+            # A record of another version (e.g. across a reload): not cached
+            return build(disease)
+        key = (kind, disease['id'])
+        snippet = state.snippets.get(key)
+        if snippet is None:
+            snippet = state.snippets[key] = build(disease)
+        return snippet
+    
+    def get_disease_context(self, disease: Dict) -> str:
+        """Get the knowledge context block of one disease"""
+        def build(disease: Dict) -> str:
+            lines = [
+                f"- {disease['name']} ({disease['id']}): "
+                f"{disease.get('description', 'N/A')}",
+                f"  Triệu chứng: {', '.join(disease.get('symptoms', []))}"
+            ]
+            if 'treatment' in disease:
+                lines.append(f"  Điều trị: {disease['treatment']}")
+            lines.append("")
+            return "\n".join(lines)
+        
+        return self._snippet('context', disease, build)
+    
+    def get_disease_description(self, disease: Dict) -> str:
+        """Get the description line of one disease for the symptoms summary"""
+        return self._snippet(
+            'description', disease,
+            lambda d: f"   - Mô tả: {d.get('description', 'N/A')}\n"
+        )
     
     def build_knowledge_context(self) -> str:
-        """Build knowledge context string for LLM"""
+        """Build knowledge context string for LLM (cached until the base changes)"""
+        state = self._state
+        if state.knowledge_context is not None:
+            return state.knowledge_context
+        
         context_parts = []
         
         # Add diseases summary
         context_parts.append("=== CÁC BỆNH PHỔ BIẾN ===\n")
-        for disease in self.diseases:
-            context_parts.append(
-                f"- {disease['name']} ({disease['id']}): "
-                f"{disease.get('description', 'N/A')}"
-            )
-            context_parts.append(f"  Triệu chứng: {', '.join(disease.get('symptoms', []))}")
-            if 'treatment' in disease:
-                context_parts.append(f"  Điều trị: {disease['treatment']}")
-            context_parts.append("")
+        for disease in state.diseases:
+            context_parts.append(self.get_disease_context(disease))
         
         # Add symptoms summary
         context_parts.append("\n=== CÁC TRIỆU CHỨNG ===\n")
         
         # Group by category
-        for category in self.get_symptom_categories():
+        for category in state.categories:
             context_parts.append(f"\n{category}:")
-            category_symptoms = self.get_symptoms_by_category(category)
-            for symptom in category_symptoms:
+            for symptom in state.symptoms_by_category[category]:
                 context_parts.append(f"  - {symptom['name']} ({symptom['id']})")
         
-        return "\n".join(context_parts)
+        state.knowledge_context = "\n".join(context_parts)
+        return state.knowledge_context
+    
+    def get_disease_row(self, disease: Dict) -> str:
+        """Get the compact table row of one disease"""
+        return self._snippet(
+            'row', disease,
+            lambda d: "|".join([
+                d['id'],
+                d['name'],
+                ",".join(d.get('symptoms', [])),
+                d.get('description', ''),
+                d.get('treatment', '')
+            ])
+        )
+    
+    def build_relevant_context(self,
+                               candidates: List[Dict],
+                               symptom_ids: List[str] = None,
+                               token_budget: int = CONTEXT_TOKEN_BUDGET) -> str:
+        """Build a compact knowledge context for the candidate diseases only
+        
+        Candidates (in rank order) become rows of a pipe-separated table,
+        followed by the patient's and the candidates' symptoms grouped by
+        category. Rows and lines are added until token_budget is reached.
+        With no candidates, the catalogue is used in its own order.
+        """
+        state = self._state
+        budget = token_budget * CHARS_PER_TOKEN
+        parts = ["=== BỆNH ỨNG VIÊN (id|tên|triệu chứng|mô tả|điều trị) ==="]
+        used = len(parts[0])
+        
+        included = []
+        for disease in candidates or state.diseases:
+            row = self.get_disease_row(disease)
+            if used + len(row) + 1 > budget:
+                break
+            parts.append(row)
+            used += len(row) + 1
+            included.append(disease)
+        
+        # Relevant symptoms grouped by category, catalogue order inside each
+        relevant = set(self.encode_symptoms(symptom_ids or []))
+        for disease in included:
+            relevant.update(state.symptom_space.encode(s.lower() for s in disease.get('symptoms', [])))
+        groups = {}
+        for symptom_int in sorted(relevant):
+            record = state.symptoms_by_int.get(symptom_int)
+            if record and 'category' in record:
+                groups.setdefault(record['category'], []).append(f"{record['name']} ({record['id']})")
+        
+        if groups:
+            header = "\n=== TRIỆU CHỨNG LIÊN QUAN ==="
+            if used + len(header) + 1 <= budget:
+                parts.append(header)
+                used += len(header) + 1
+                for category in sorted(groups):
+                    line = f"{category}: {', '.join(groups[category])}"
+                    if used + len(line) + 1 > budget:
+                        break
+                    parts.append(line)
+                    used += len(line) + 1
+        
+        context = "\n".join(parts)
+        logger.debug(
+            f"Relevant context: {len(included)} diseases, "
+            f"{len(context)} chars, ~{estimate_tokens(context)} tokens"
+        )
+        return context
     
     def add_disease(self, disease_data: Dict) -> bool:
         """Add new disease to knowledge base"""
         try:
-            # Validate required fields
-            required_fields = ['id', 'name', 'symptoms']
-            for field in required_fields:
-                if field not in disease_data:
-                    logger.error(f"Missing required field: {field}")
-                    return False
-            
-            # Check if disease already exists
-            if self.get_disease_by_id(disease_data['id']):
-                logger.error(f"Disease {disease_data['id']} already exists")
+            error = validate_disease_record(disease_data)
+            if error:
+                logger.error(error)
                 return False
             
-            # Add disease
-            self.diseases.append(disease_data)
-            self.knowledge_base['diseases'] = self.diseases
+            with self._write_lock:
+                # Check if disease already exists
+                if self.get_disease_by_id(disease_data['id']):
+                    logger.error(f"Disease {disease_data['id']} already exists")
+                    return False
+                
+                # Add disease, journaled before it is published
+                self._publish('add_disease', [disease_data])
             
-            # Save to file
-            save_json_file(self.knowledge_base, self.knowledge_base_path)
+            self._maybe_compact()
             
             logger.info(f"Added disease: {disease_data['name']}")
             return True
@@ -195,24 +851,21 @@ class KnowledgeManager:
     def add_symptom(self, symptom_data: Dict) -> bool:
         """Add new symptom to knowledge base"""
         try:
-            # Validate required fields
-            required_fields = ['id', 'name', 'category']
-            for field in required_fields:
-                if field not in symptom_data:
-                    logger.error(f"Missing required field: {field}")
-                    return False
-            
-            # Check if symptom already exists
-            if self.get_symptom_by_id(symptom_data['id']):
-                logger.error(f"Symptom {symptom_data['id']} already exists")
+            error = validate_symptom_record(symptom_data)
+            if error:
+                logger.error(error)
                 return False
             
-            # Add symptom
-            self.symptoms.append(symptom_data)
-            self.knowledge_base['symptoms'] = self.symptoms
+            with self._write_lock:
+                # Check if symptom already exists
+                if self.get_symptom_by_id(symptom_data['id']):
+                    logger.error(f"Symptom {symptom_data['id']} already exists")
+                    return False
+                
+                # Add symptom, journaled before it is published
+                self._publish('add_symptom', [symptom_data])
             
-            # Save to file
-            save_json_file(self.knowledge_base, self.knowledge_base_path)
+            self._maybe_compact()
             
             logger.info(f"Added symptom: {symptom_data['name']}")
             return True
@@ -221,15 +874,183 @@ class KnowledgeManager:
             logger.error(f"Failed to add symptom: {e}")
             return False
     
+    def add_diseases(self, diseases: List[Dict]) -> int:
+        """Add a batch of diseases with one journal commit, returning how many were added
+        
+        Invalid records and ids already present are skipped.
+        """
+        return self._add_batch('add_disease', diseases, validate_disease_record)
+    
+    def add_symptoms(self, symptoms: List[Dict]) -> int:
+        """Add a batch of symptoms with one journal commit, returning how many were added
+        
+        Invalid records and ids already present are skipped.
+        """
+        return self._add_batch('add_symptom', symptoms, validate_symptom_record)
+    
+    def _existing_ids(self, op: str) -> Dict:
+        """Records by id of the kind an operation adds"""
+        state = self._state
+        return state.diseases_by_id if op == 'add_disease' else state.symptoms_by_id
+    
+    def _add_batch(self, op: str, records: List[Dict], validate) -> int:
+        try:
+            with self._write_lock:
+                by_id = self._existing_ids(op)
+                batch = []
+                seen = set()
+                for record in records:
+                    error = validate(record)
+                    if error is None and (record['id'] in by_id or record['id'] in seen):
+                        error = f"Duplicate id: {record['id']}"
+                    if error:
+                        logger.warning(f"Skipping record ({op}): {error}")
+                        continue
+                    seen.add(record['id'])
+                    batch.append(record)
+                
+                if not batch:
+                    return 0
+                
+                self._publish(op, batch)
+            
+            self._maybe_compact()
+            logger.info(f"Added {len(batch)} records ({op})")
+            return len(batch)
+            
+        except Exception as e:
+            logger.error(f"Failed to add batch ({op}): {e}")
+            return 0
+    
+    def update_disease(self, disease_id: str, updates: Dict) -> bool:
+        """Change fields of a disease (its id stays the same)"""
+        return self.apply_patch([{'op': 'update_disease', 'data': dict(updates, id=disease_id)}]) == 1
+    
+    def remove_disease(self, disease_id: str) -> bool:
+        """Remove a disease"""
+        return self.apply_patch([{'op': 'remove_disease', 'data': {'id': disease_id}}]) == 1
+    
+    def update_symptom(self, symptom_id: str, updates: Dict) -> bool:
+        """Change fields of a symptom (its id stays the same)"""
+        return self.apply_patch([{'op': 'update_symptom', 'data': dict(updates, id=symptom_id)}]) == 1
+    
+    def apply_patch(self, changes: List[Dict]) -> int:
+        """Apply a batch of changes as one journal commit and one new version
+        
+        Each change is {'op': ..., 'data': ...} like a journal entry, with op
+        in CHANGE_OPS; updates only need the id and the changed fields. Only
+        the touched records are re-indexed. Invalid changes are skipped and
+        later changes see the earlier ones. Returns how many were applied.
+        """
+        try:
+            with self._write_lock:
+                state = self._state.derive()
+                entries = []
+                for change in changes:
+                    op = change.get('op') if isinstance(change, Mapping) else None
+                    try:
+                        data = state.apply(op, change.get('data') if op else None)
+                    except ValueError as e:
+                        logger.warning(f"Skipping change ({op}): {e}")
+                        continue
+                    entries.append({'op': op, 'data': data})
+                
+                if not entries:
+                    return 0
+                
+                # Log before publishing, so a failed write leaves memory untouched
+                self._commit(entries)
+                state.advance(entries)
+                self._state = state
+            
+            self._maybe_compact()
+            logger.info(f"Applied {len(entries)} changes")
+            return len(entries)
+            
+        except Exception as e:
+            logger.error(f"Failed to apply patch: {e}")
+            return 0
+    
+    def _commit(self, entries: List[Dict]) -> None:
+        """Make applied changes durable before they are published"""
+        self.journal.append_entries(entries)
+    
+    def _maybe_compact(self) -> None:
+        """Start a background compaction once the journal is long enough"""
+        if self.journal is not None and len(self.journal) >= JOURNAL_COMPACT_THRESHOLD:
+            self.compact(background=True)
+    
+    def compact(self, background: bool = False) -> bool:
+        """Fold the journal into the JSON file
+        
+        The snapshot is taken and the journal rotated under the write lock;
+        the O(size) rewrite itself runs outside it (in a daemon thread when
+        background is set), so inserts keep going meanwhile. If the file
+        was edited on disk since it was loaded, compaction is skipped so the
+        edit is not overwritten; it runs again once reload() has picked the
+        edit up.
+        """
+        with self._write_lock:
+            if self.is_compacting():
+                return False
+            if self.has_external_changes():
+                logger.warning(f"Not compacting: {self.knowledge_base_path} changed on disk since it was loaded")
+                return False
+            state = self._state
+            snapshot = dict(state.knowledge_base, diseases=list(state.diseases), symptoms=list(state.symptoms))
+            self.journal.rotate()
+            
+            if background:
+                self._compaction_thread = threading.Thread(
+                    target=self._write_snapshot, args=(snapshot,),
+                    name='knowledge-compaction', daemon=True
+                )
+                self._compaction_thread.start()
+                return True
+        
+        return self._write_snapshot(snapshot)
+    
+    def _write_snapshot(self, snapshot: Dict) -> bool:
+        try:
+            save_json_file(to_plain(snapshot), self.knowledge_base_path)
+            # The rewrite is ours: do not reload it as an external change
+            self._fingerprint = file_fingerprint(self.knowledge_base_path)
+            self.journal.discard_rotated()
+            logger.info(f"Compacted knowledge base to {self.knowledge_base_path}")
+            return True
+        except Exception as e:
+            # Rotated entries stay on disk and are replayed on next load
+            logger.error(f"Failed to compact knowledge base: {e}")
+            return False
+    
+    def wait_for_compaction(self, timeout: Optional[float] = None) -> None:
+        """Block until a running background compaction has finished"""
+        thread = self._compaction_thread
+        if thread is not None:
+            thread.join(timeout)
+    
+    def is_compacting(self) -> bool:
+        """Whether a background compaction is running"""
+        thread = self._compaction_thread
+        return thread is not None and thread.is_alive()
+    
+    def close(self) -> None:
+        """Stop watching, finish pending compaction and sync the journal"""
+        self.stop_watching()
+        self.wait_for_compaction()
+        if self.journal is not None:
+            self.journal.close()
+    
     def get_statistics(self) -> Dict:
-        """Get knowledge base statistics"""
+        """Get knowledge base statistics (maintained incrementally, O(1))"""
+        state = self._state
         return {
-            'total_diseases': len(self.diseases),
-            'total_symptoms': len(self.symptoms),
-            'symptom_categories': len(self.get_symptom_categories()),
-            'avg_symptoms_per_disease': sum(len(d.get('symptoms', [])) for d in self.diseases) / len(self.diseases) if self.diseases else 0
+            'total_diseases': len(state.diseases),
+            'total_symptoms': len(state.symptoms),
+            'symptom_categories': len(state.categories),
+            'avg_symptoms_per_disease': state.total_disease_symptoms / len(state.diseases) if state.diseases else 0
         }
 
 
 # Export
-__all__ = ['KnowledgeManager']
+__all__ = ['KnowledgeManager', 'KnowledgeState', 'CHANGE_OPS']
@@ -0,0 +1,525 @@
+"""
+Knowledge Store for AI Medical Diagnosis System
+SQLite storage backend for the knowledge base, migration tool and factory
+
+Usage:
+    python src/knowledge_store.py migrate [--json PATH] [--db PATH] [--overwrite]
+"""
+import argparse
+import json
+import sqlite3
+import sys
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import List, Dict, Iterable, Optional
+
+from config import (
+    KNOWLEDGE_BASE_PATH,
+    KNOWLEDGE_DB_PATH,
+    KNOWLEDGE_SNAPSHOT_PATH,
+    KNOWLEDGE_BACKEND,
+    TOP_K_DISEASES
+)
+from kb_snapshot import load_snapshot
+from knowledge_manager import KnowledgeManager
+from records import Disease, DiseaseMatch, Symptom, to_plain
+from utils import setup_logging, validate_disease_record, validate_symptom_record
+
+logger = setup_logging(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS diseases (
+    position INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE,
+    name_lower TEXT NOT NULL,
+    symptom_count INTEGER NOT NULL,
+    listed_symptoms INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_diseases_name ON diseases(name_lower);
+
+CREATE TABLE IF NOT EXISTS symptoms (
+    position INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE,
+    category TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_symptoms_category ON symptoms(category, position);
+
+CREATE TABLE IF NOT EXISTS disease_symptoms (
+    symptom_key TEXT NOT NULL,
+    disease_position INTEGER NOT NULL REFERENCES diseases(position),
+    PRIMARY KEY (symptom_key, disease_position)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_disease_symptoms_disease ON disease_symptoms(disease_position);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def connect(db_path: Path) -> sqlite3.Connection:
+    """Open a store, creating the schema if needed"""
+    # Autocommit mode: transactions are explicit, see transaction()
+    connection = sqlite3.connect(str(db_path), check_same_thread=False, timeout=30, isolation_level=None)
+    # WAL lets worker processes read while one of them writes
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA foreign_keys=ON")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+@contextmanager
+def transaction(connection: sqlite3.Connection):
+    """Run a block in one write transaction"""
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        yield connection
+    except BaseException:
+        connection.execute("ROLLBACK")
+        raise
+    connection.execute("COMMIT")
+
+
+def _insert_disease(connection: sqlite3.Connection, disease: Dict) -> None:
+    """Insert one disease and its join rows (raises IntegrityError on a duplicate id)"""
+    keys = {s.lower() for s in disease['symptoms']}
+    cursor = connection.execute(
+        "INSERT INTO diseases (id, name_lower, symptom_count, listed_symptoms, data) VALUES (?, ?, ?, ?, ?)",
+        (disease['id'], disease['name'].lower(), len(keys), len(disease['symptoms']),
+         json.dumps(to_plain(disease), ensure_ascii=False))
+    )
+    connection.executemany(
+        "INSERT INTO disease_symptoms (symptom_key, disease_position) VALUES (?, ?)",
+        [(key, cursor.lastrowid) for key in keys]
+    )
+
+
+def _insert_symptom(connection: sqlite3.Connection, symptom: Dict) -> None:
+    """Insert one symptom (raises IntegrityError on a duplicate id)"""
+    connection.execute(
+        "INSERT INTO symptoms (id, category, data) VALUES (?, ?, ?)",
+        (symptom['id'], symptom['category'], json.dumps(to_plain(symptom), ensure_ascii=False))
+    )
+
+
+def _disease_position(connection: sqlite3.Connection, disease_id: str) -> int:
+    row = connection.execute("SELECT position FROM diseases WHERE id = ?", (disease_id,)).fetchone()
+    if row is None:
+        raise KeyError(f"Unknown disease: {disease_id}")
+    return row[0]
+
+
+def _update_disease(connection: sqlite3.Connection, disease: Dict) -> None:
+    """Replace one disease and its join rows, keeping its position"""
+    position = _disease_position(connection, disease['id'])
+    keys = {s.lower() for s in disease['symptoms']}
+    connection.execute(
+        "UPDATE diseases SET name_lower = ?, symptom_count = ?, listed_symptoms = ?, data = ? WHERE position = ?",
+        (disease['name'].lower(), len(keys), len(disease['symptoms']),
+         json.dumps(to_plain(disease), ensure_ascii=False), position)
+    )
+    connection.execute("DELETE FROM disease_symptoms WHERE disease_position = ?", (position,))
+    connection.executemany(
+        "INSERT INTO disease_symptoms (symptom_key, disease_position) VALUES (?, ?)",
+        [(key, position) for key in keys]
+    )
+
+
+def _remove_disease(connection: sqlite3.Connection, data: Dict) -> None:
+    """Delete one disease and its join rows"""
+    position = _disease_position(connection, data['id'])
+    connection.execute("DELETE FROM disease_symptoms WHERE disease_position = ?", (position,))
+    connection.execute("DELETE FROM diseases WHERE position = ?", (position,))
+
+
+def _update_symptom(connection: sqlite3.Connection, symptom: Dict) -> None:
+    """Replace one symptom, keeping its position"""
+    cursor = connection.execute(
+        "UPDATE symptoms SET category = ?, data = ? WHERE id = ?",
+        (symptom['category'], json.dumps(to_plain(symptom), ensure_ascii=False), symptom['id'])
+    )
+    if not cursor.rowcount:
+        raise KeyError(f"Unknown symptom: {symptom['id']}")
+
+
+# Writers of the journal operations (see CHANGE_OPS)
+_WRITERS = {
+    'add_disease': _insert_disease,
+    'add_symptom': _insert_symptom,
+    'update_disease': _update_disease,
+    'update_symptom': _update_symptom,
+    'remove_disease': _remove_disease
+}
+
+
+class SQLiteKnowledgeManager(KnowledgeManager):
+    """KnowledgeManager stored in SQLite
+
+    Lookups, category listing, disease search and ranking and statistics are
+    answered by indexed SQL queries, so they always see the shared store,
+    including rows committed by other worker processes. They run on pooled
+    read-only connections, which WAL lets read while a write is in progress,
+    so they never wait for the write lock. Inserts and patches are written
+    in one transaction per call.
+
+    Scaling the catalogue beyond memory is out of scope for this backend.
+    Opening it reads every row into Python and builds the same full
+    in-memory state as the JSON backend, because the symptom extractor, the
+    knowledge context and the ranking indexes used by DiagnosisEngine run on
+    that mirror. What it adds is one store shared by worker processes. The
+    mirror only sees rows committed by other processes after reload() (or
+    the reload watcher) notices the change, so until then extraction and
+    engine ranking can disagree with the SQL queries.
+    """
+
+    def __init__(self, db_path: Path = KNOWLEDGE_DB_PATH):
+        """Open the store at db_path"""
+        self.db_path = Path(db_path)
+        self.connection = connect(self.db_path)
+        self._data_version = None
+        self._readers = []
+        self._readers_lock = threading.Lock()
+        super().__init__(self.db_path)
+
+    def _open_journal(self) -> None:
+        """Changes are committed to the store, so there is no journal"""
+        return None
+
+    def _open_reader(self) -> sqlite3.Connection:
+        return sqlite3.connect(f"{self.db_path.resolve().as_uri()}?mode=ro", uri=True,
+                               check_same_thread=False, timeout=30)
+
+    def _query(self, sql: str, params: Iterable = ()) -> List[tuple]:
+        """Run a read on an idle read-only connection, opening one if all are busy"""
+        with self._readers_lock:
+            connection = self._readers.pop() if self._readers else None
+        if connection is None:
+            connection = self._open_reader()
+        try:
+            return connection.execute(sql, tuple(params)).fetchall()
+        finally:
+            with self._readers_lock:
+                self._readers.append(connection)
+
+    def load_knowledge_base(self) -> Dict:
+        """Load the in-memory mirror from the store"""
+        try:
+            logger.info(f"Loading knowledge base from {self.db_path}")
+            with self._write_lock:
+                knowledge_base = {
+                    key: json.loads(value)
+                    for key, value in self.connection.execute("SELECT key, value FROM meta")
+                }
+                knowledge_base['diseases'] = [
+                    json.loads(data) for (data,) in
+                    self.connection.execute("SELECT data FROM diseases ORDER BY position")
+                ]
+                knowledge_base['symptoms'] = [
+                    json.loads(data) for (data,) in
+                    self.connection.execute("SELECT data FROM symptoms ORDER BY position")
+                ]
+                data_version = self._current_data_version()
+
+                if not self.validate_knowledge_base(knowledge_base):
+                    raise ValueError("Invalid knowledge base structure")
+
+                self._state = self._new_state(knowledge_base).build()
+                self._data_version = data_version
+            logger.info(f"Loaded {len(self.diseases)} diseases and {len(self.symptoms)} symptoms")
+            return self.knowledge_base
+
+        except Exception as e:
+            logger.error(f"Failed to load knowledge base: {e}")
+            raise
+
+    def _current_data_version(self) -> int:
+        return self.connection.execute("PRAGMA data_version").fetchone()[0]
+
+    def has_external_changes(self) -> bool:
+        """Whether another connection committed since the mirror was loaded"""
+        with self._write_lock:
+            return self._current_data_version() != self._data_version
+
+    def reload(self) -> bool:
+        """Reload the mirror if another process changed the store
+
+        A failed reload (e.g. the store is locked) keeps the current mirror
+        and is retried on the next check.
+        """
+        try:
+            if not self.has_external_changes():
+                return False
+            self.load_knowledge_base()
+        except Exception as e:
+            logger.error(f"Failed to reload knowledge base: {e}")
+            return False
+        logger.info(f"Reloaded knowledge base (version {self.version})")
+        return True
+
+    def get_disease_by_id(self, disease_id: str) -> Optional[Dict]:
+        """Get disease information by ID"""
+        rows = self._query("SELECT data FROM diseases WHERE id = ?", (disease_id,))
+        return Disease.from_dict(json.loads(rows[0][0])) if rows else None
+
+    def get_disease_by_name(self, disease_name: str) -> Optional[Dict]:
+        """Get disease information by name"""
+        rows = self._query(
+            "SELECT data FROM diseases WHERE name_lower = ? ORDER BY position LIMIT 1",
+            (disease_name.lower(),)
+        )
+        return Disease.from_dict(json.loads(rows[0][0])) if rows else None
+
+    def get_symptom_by_id(self, symptom_id: str) -> Optional[Dict]:
+        """Get symptom information by ID"""
+        rows = self._query("SELECT data FROM symptoms WHERE id = ?", (symptom_id,))
+        return Symptom.from_dict(json.loads(rows[0][0])) if rows else None
+
+    def get_symptoms_by_category(self, category: str) -> List[Dict]:
+        """Get all symptoms in a category"""
+        rows = self._query("SELECT data FROM symptoms WHERE category = ? ORDER BY position", (category,))
+        return [Symptom.from_dict(json.loads(data)) for (data,) in rows]
+
+    def get_symptom_categories(self) -> List[str]:
+        """Get unique symptom categories"""
+        return [category for (category,) in self._query("SELECT DISTINCT category FROM symptoms ORDER BY category")]
+
+    def _candidates(self, symptoms: List[str], order_by: str, top_k: Optional[int]):
+        """Candidate diseases with their intersection counts, ordered in SQL"""
+        keys = sorted({s.lower() for s in symptoms})
+        if not keys:
+            return keys, []
+        sql = f"""
+            SELECT d.data, COUNT(*) AS match_count, d.symptom_count
+            FROM disease_symptoms ds JOIN diseases d ON d.position = ds.disease_position
+            WHERE ds.symptom_key IN ({','.join('?' * len(keys))})
+            GROUP BY d.position
+            ORDER BY {order_by}, d.position
+        """
+        params = list(keys)
+        if top_k is not None:
+            sql += " LIMIT ?"
+            params.append(top_k)
+        return set(keys), self._query(sql, params)
+
+    @staticmethod
+    def _matched(disease: Dict, keys: set) -> List[str]:
+        return [s for s in disease.get('symptoms', []) if s.lower() in keys]
+
+    def search_diseases_by_symptoms(self,
+                                    symptom_ids: List[str],
+                                    top_k: Optional[int] = None) -> List[Dict]:
+        """Search diseases that match given symptoms"""
+        keys, rows = self._candidates(
+            symptom_ids,
+            "CAST(match_count AS REAL) / d.symptom_count DESC, match_count DESC",
+            top_k
+        )
+        results = []
+        for data, match_count, symptom_count in rows:
+            disease = Disease.from_dict(json.loads(data))
+            results.append(DiseaseMatch(
+                disease=disease,
+                match_count=match_count,
+                match_ratio=match_count / symptom_count,
+                matched_symptoms=self._matched(disease, keys)
+            ))
+        return results
+
+    def rank_diseases(self, symptoms: List[str], top_k: int = TOP_K_DISEASES) -> List[Dict]:
+        """Rank diseases by Jaccard similarity in SQL"""
+        size = len({s.lower() for s in symptoms})
+        keys, rows = self._candidates(
+            symptoms,
+            f"CAST(match_count AS REAL) / ({size} + d.symptom_count - match_count) DESC",
+            top_k
+        )
+        results = []
+        for data, match_count, symptom_count in rows:
+            disease = Disease.from_dict(json.loads(data))
+            results.append(DiseaseMatch(
+                disease=disease,
+                score=match_count / (size + symptom_count - match_count),
+                matched_symptoms=self._matched(disease, keys)
+            ))
+        return results
+
+    def get_statistics(self) -> Dict:
+        """Get knowledge base statistics from the store"""
+        (total_diseases, listed), = self._query("SELECT COUNT(*), COALESCE(SUM(listed_symptoms), 0) FROM diseases")
+        (total_symptoms, categories), = self._query("SELECT COUNT(*), COUNT(DISTINCT category) FROM symptoms")
+        return {
+            'total_diseases': total_diseases,
+            'total_symptoms': total_symptoms,
+            'symptom_categories': categories,
+            'avg_symptoms_per_disease': listed / total_diseases if total_diseases else 0
+        }
+
+    def _insert(self, op: str, records: List[Dict]) -> List[Dict]:
+        """Insert records in one transaction, returning those that were new"""
+        insert = _insert_disease if op == 'add_disease' else _insert_symptom
+        inserted = []
+        with transaction(self.connection):
+            for record in records:
+                try:
+                    self.connection.execute("SAVEPOINT record")
+                    insert(self.connection, record)
+                    self.connection.execute("RELEASE record")
+                    inserted.append(record)
+                except sqlite3.IntegrityError:
+                    self.connection.execute("ROLLBACK TO record")
+                    self.connection.execute("RELEASE record")
+                    logger.warning(f"Skipping record ({op}): Duplicate id: {record['id']}")
+        return inserted
+
+    def _add_one(self, op: str, record: Dict, validate) -> bool:
+        try:
+            error = validate(record)
+            if error:
+                logger.error(error)
+                return False
+
+            with self._write_lock:
+                if not self._insert(op, [record]):
+                    logger.error(f"{record['id']} already exists")
+                    return False
+                self._publish(op, [record], log=False)
+
+            logger.info(f"Added {op[4:]}: {record['name']}")
+            return True
+
+        except Exception as e:
+            logger.error(f"Failed to {op.replace('_', ' ')}: {e}")
+            return False
+
+    def add_disease(self, disease_data: Dict) -> bool:
+        """Add new disease to the store"""
+        return self._add_one('add_disease', disease_data, validate_disease_record)
+
+    def add_symptom(self, symptom_data: Dict) -> bool:
+        """Add new symptom to the store"""
+        return self._add_one('add_symptom', symptom_data, validate_symptom_record)
+
+    def _add_batch(self, op: str, records: List[Dict], validate) -> int:
+        try:
+            valid = []
+            for record in records:
+                error = validate(record)
+                if error:
+                    logger.warning(f"Skipping record ({op}): {error}")
+                else:
+                    valid.append(record)
+
+            with self._write_lock:
+                inserted = self._insert(op, valid)
+                if not inserted:
+                    return 0
+                self._publish(op, inserted, log=False)
+
+            logger.info(f"Added {len(inserted)} records ({op})")
+            return len(inserted)
+
+        except Exception as e:
+            logger.error(f"Failed to add batch ({op}): {e}")
+            return 0
+
+    def _commit(self, entries: List[Dict]) -> None:
+        """Write the changes of a patch to the store in one transaction"""
+        with transaction(self.connection):
+            for entry in entries:
+                _WRITERS[entry['op']](self.connection, entry['data'])
+
+    def compact(self, background: bool = False) -> bool:
+        """Nothing to fold: every insert is already committed to the store"""
+        return True
+
+    def close(self) -> None:
+        """Stop watching and close the store"""
+        self.stop_watching()
+        with self._readers_lock:
+            readers, self._readers = self._readers, []
+        for connection in readers:
+            connection.close()
+        with self._write_lock:
+            self.connection.close()
+
+
+def migrate_json_to_sqlite(json_path: Path = KNOWLEDGE_BASE_PATH,
+                           db_path: Path = KNOWLEDGE_DB_PATH,
+                           overwrite: bool = False) -> Dict:
+    """Copy a JSON knowledge base (with its pending journal) into a new store"""
+    db_path = Path(db_path)
+    if db_path.exists():
+        if not overwrite:
+            raise FileExistsError(f"Store already exists: {db_path}")
+        for path in (db_path, Path(f"{db_path}-wal"), Path(f"{db_path}-shm")):
+            if path.exists():
+                path.unlink()
+
+    source = KnowledgeManager(json_path)
+    connection = connect(db_path)
+    try:
+        with transaction(connection):
+            for key, value in source.knowledge_base.items():
+                if key not in ('diseases', 'symptoms'):
+                    connection.execute("INSERT INTO meta (key, value) VALUES (?, ?)",
+                                       (key, json.dumps(value, ensure_ascii=False)))
+            for symptom in source.symptoms:
+                _insert_symptom(connection, symptom)
+            for disease in source.diseases:
+                _insert_disease(connection, disease)
+    finally:
+        connection.close()
+        source.close()
+
+    logger.info(f"Migrated {json_path} to {db_path}")
+    return source.get_statistics()
+
+
+def create_knowledge_manager(backend: str = KNOWLEDGE_BACKEND, path: Optional[Path] = None) -> KnowledgeManager:
+    """Create the knowledge manager for the configured storage backend
+
+    The SQLite store is migrated from the JSON knowledge base on first use;
+    the snapshot is recompiled whenever the JSON file or its journal is newer.
+    """
+    if backend == 'json':
+        return KnowledgeManager(path or KNOWLEDGE_BASE_PATH)
+    if backend == 'sqlite':
+        db_path = Path(path or KNOWLEDGE_DB_PATH)
+        if not db_path.exists():
+            migrate_json_to_sqlite(KNOWLEDGE_BASE_PATH, db_path)
+        return SQLiteKnowledgeManager(db_path)
+    if backend == 'snapshot':
+        return load_snapshot(KNOWLEDGE_BASE_PATH, path or KNOWLEDGE_SNAPSHOT_PATH)
+    raise ValueError(f"Unknown knowledge backend: {backend}")
+
+
+def main(argv: List[str] = None) -> int:
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Knowledge base storage tools")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    migrate = subparsers.add_parser('migrate', help="copy the JSON knowledge base into SQLite")
+    migrate.add_argument('--json', type=Path, default=KNOWLEDGE_BASE_PATH)
+    migrate.add_argument('--db', type=Path, default=KNOWLEDGE_DB_PATH)
+    migrate.add_argument('--overwrite', action='store_true')
+    args = parser.parse_args(argv)
+
+    stats = migrate_json_to_sqlite(args.json, args.db, args.overwrite)
+    print(f"Migrated {stats['total_diseases']} diseases and {stats['total_symptoms']} symptoms to {args.db}")
+    return 0
+
+
+# Export
+__all__ = [
+    'SQLiteKnowledgeManager',
+    'migrate_json_to_sqlite',
+    'create_knowledge_manager',
+    'main'
+]
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,36 +4,65 @@ Handles all medical diagnosis using Gemini AI directly
 """
 import os
 import logging
-from typing import List, Dict, Optional
+from typing import List, Dict, Iterator, Optional, Tuple
 import google.generativeai as genai
 
 from config import (
     LLM_MODEL,
     LLM_TEMPERATURE,
     LLM_MAX_TOKENS,
-    SYSTEM_PROMPT,
-    EMERGENCY_KEYWORDS
+    KNOWLEDGE_BASE_PATH,
+    SEMANTIC_CACHE_ENABLED,
+    SYSTEM_PROMPT
 )
-from utils import setup_logging
+from request_limiter import RequestLimiter, LLM_REQUEST_LIMITER
+from response_cache import DEFAULT_CACHE
+from semantic_cache import SemanticCache, reusable_message
+from symptom_extractor import SymptomExtractor
+from triage import TRIAGE_ENGINE, format_emergency_warning
+from utils import setup_logging, load_json_file
 
 logger = setup_logging(__name__)
 
 
 class MedicalAIHandler:
-    """Handle all medical diagnosis using AI directly"""
+    """Handle all medical diagnosis using AI directly
+    
+    With a SemanticCache, the first message of a conversation is answered
+    from an earlier conversation whose opening message named the same
+    symptoms in similar words; the exchange is still added to the history.
+    """
     
     def __init__(self, 
                  model_name: str = LLM_MODEL,
                  temperature: float = LLM_TEMPERATURE,
-                 max_tokens: int = LLM_MAX_TOKENS):
-        """Initialize Medical AI Handler"""
+                 max_tokens: int = LLM_MAX_TOKENS,
+                 semantic_cache: Optional[SemanticCache] = DEFAULT_CACHE,
+                 symptom_extractor: Optional[SymptomExtractor] = None):
+        """Initialize Medical AI Handler (with the default semantic cache if enabled, None for none)"""
         self.model_name = model_name
         self.temperature = temperature
         self.max_tokens = max_tokens
+        if semantic_cache is DEFAULT_CACHE:
+            semantic_cache = SemanticCache() if SEMANTIC_CACHE_ENABLED else None
+        self.semantic_cache = semantic_cache
+        if semantic_cache is not None and symptom_extractor is None:
+            symptom_extractor = self._load_symptom_extractor()
+        self.symptom_extractor = symptom_extractor
         self.model = None
         self.chat_session = None
+        self._turns = 0
         self.initialize_model()
     
+    @staticmethod
+    def _load_symptom_extractor() -> Optional[SymptomExtractor]:
+        """Symptom extractor over the knowledge base symptoms, used as cache key"""
+        try:
+            return SymptomExtractor(load_json_file(KNOWLEDGE_BASE_PATH).get('symptoms', []))
+        except Exception as e:
+            logger.warning(f"Semantic cache disabled, could not load symptoms: {e}")
+            return None
+    
     def initialize_model(self) -> None:
         """Initialize Gemini model with chat session"""
         try:
@@ -72,28 +101,17 @@ class MedicalAIHandler:
             logger.error(f"Failed to initialize Medical AI: {e}")
             raise
     
+    def triage(self, user_input: str) -> Dict:
+        """Triage the input against tiered emergency keywords"""
+        return TRIAGE_ENGINE.triage(user_input)
+    
+    def find_emergency_keywords(self, user_input: str) -> List[Dict]:
+        """Find all emergency keywords in the input with their offsets"""
+        return self.triage(user_input)['matches']
+    
     def check_emergency(self, user_input: str) -> Optional[str]:
         """Quick check for emergency keywords"""
-        user_input_lower = user_input.lower()
-        
-        for keyword in EMERGENCY_KEYWORDS:
-            if keyword in user_input_lower:
-                return f"""
-⚠️⚠️⚠️ **CẢNH BÁO KHẨN CẤP** ⚠️⚠️⚠️
-
-Bạn đã đề cập đến triệu chứng **"{keyword}"** - đây có thể là dấu hiệu nghiêm trọng!
-
-🚨 **HÀNH ĐỘNG NGAY LẬP TỨC:**
-1. **Gọi cấp cứu 115** hoặc
-2. **Đến bệnh viện gần nhất** ngay
-3. **KHÔNG tự điều trị** tại nhà
-
-Đây là tình huống khẩn cấp cần được xử lý bởi chuyên gia y tế ngay lập tức!
-
-⏰ **THỜI GIAN LÀ VÀNG** - Đừng chần chừ!
-"""
-        
-        return None
+        return format_emergency_warning(self.triage(user_input))
     
     def diagnose(self, user_input: str) -> str:
         """
@@ -109,6 +127,10 @@ Bạn đã đề cập đến triệu chứng **"{keyword}"** - đây có thể
                 logger.warning("Emergency symptoms detected")
                 return emergency_warning
             
+            symptom_ids, cached = self._first_turn_cache(user_input)
+            if cached is not None:
+                return cached
+            
             # Send to AI for diagnosis
             response = self.chat_session.send_message(user_input)
             
@@ -117,12 +139,107 @@ Bạn đã đề cập đến triệu chứng **"{keyword}"** - đây có thể
                 return "❌ Xin lỗi, tôi không thể tạo phản hồi lúc này. Vui lòng thử lại."
             
             logger.info("Successfully generated diagnosis")
+            if symptom_ids:
+                self.semantic_cache.store(user_input, response.text, symptom_ids, self._cache_namespace())
             return response.text
             
         except Exception as e:
             logger.error(f"Error in diagnosis: {e}")
             return f"❌ Lỗi: {str(e)}\n\n💡 Vui lòng kiểm tra kết nối hoặc thử lại sau."
     
+    def diagnose_stream(self, user_input: str) -> Iterator[str]:
+        """
+        Streaming variant of diagnose, yielding text chunks as they arrive
+        Emergency warnings and cached answers are yielded as a single chunk
+        """
+        try:
+            logger.info("Processing streamed diagnosis request")
+            
+            # Check for emergency first
+            emergency_warning = self.check_emergency(user_input)
+            if emergency_warning:
+                logger.warning("Emergency symptoms detected")
+                yield emergency_warning
+                return
+            
+            symptom_ids, cached = self._first_turn_cache(user_input)
+            if cached is not None:
+                yield cached
+                return
+        except Exception as e:
+            logger.error(f"Error in diagnosis: {e}")
+            yield f"❌ Lỗi: {str(e)}\n\n💡 Vui lòng kiểm tra kết nối hoặc thử lại sau."
+            return
+        
+        chunks = []
+        try:
+            # Stream from AI, chunk by chunk
+            for chunk in self.chat_session.send_message(user_input, stream=True):
+                if chunk.text:
+                    chunks.append(chunk.text)
+                    yield chunk.text
+        except Exception as e:
+            logger.error(f"Error in streamed diagnosis: {e}")
+            self._rewind()
+            separator = "\n\n" if chunks else ""
+            yield f"{separator}❌ Lỗi: {str(e)}\n\n💡 Vui lòng kiểm tra kết nối hoặc thử lại sau."
+            return
+        
+        if not chunks:
+            logger.error("Empty response from AI")
+            yield "❌ Xin lỗi, tôi không thể tạo phản hồi lúc này. Vui lòng thử lại."
+            return
+        
+        logger.info("Successfully streamed diagnosis")
+        if symptom_ids:
+            self.semantic_cache.store(user_input, "".join(chunks), symptom_ids, self._cache_namespace())
+    
+    def _rewind(self) -> None:
+        """Drop a broken exchange so the chat session stays usable"""
+        try:
+            if self.chat_session.last is not None:
+                self.chat_session.rewind()
+        except Exception as e:
+            logger.warning(f"Could not rewind chat session: {e}")
+    
+    def _cache_namespace(self) -> tuple:
+        """Settings a cached answer depends on besides the message itself"""
+        return self.model_name, self.temperature, self.max_tokens
+    
+    def _cache_symptom_ids(self, user_input: str) -> List[str]:
+        """Symptom ids of the input when the semantic cache is usable
+        
+        Empty unless the input is only symptom mentions and filler words, so
+        an answer is never reused across negations, ages or pregnancy.
+        """
+        if self.semantic_cache is None or self.symptom_extractor is None:
+            return []
+        matches = self.symptom_extractor.extract(user_input)
+        if not reusable_message(user_input, matches):
+            return []
+        return [m['symptom_id'] for m in matches if m['symptom_id']]
+    
+    def _first_turn_cache(self, user_input: str) -> Tuple[List[str], Optional[str]]:
+        """Cache symptom ids of an opening message and its cached answer, if any
+        
+        Only the opening message is answered without earlier context, so
+        later turns get no symptom ids. A cached answer is added to the chat
+        history as if the model had given it.
+        """
+        first_turn = self._turns == 0
+        self._turns += 1
+        symptom_ids = self._cache_symptom_ids(user_input) if first_turn else []
+        if not symptom_ids:
+            return symptom_ids, None
+        
+        cached = self.semantic_cache.lookup(user_input, symptom_ids, self._cache_namespace())
+        if cached is not None:
+            self.chat_session.history = list(self.chat_session.history) + [
+                {'role': 'user', 'parts': [user_input]},
+                {'role': 'model', 'parts': [cached]}
+            ]
+        return symptom_ids, cached
+    
     def reset_conversation(self) -> None:
         """Reset chat session for new conversation"""
         try:
@@ -137,6 +254,7 @@ Bạn đã đề cập đến triệu chứng **"{keyword}"** - đây có thể
                     'parts': ['Tôi hiểu rồi. Tôi là AI Doctor và sẵn sàng giúp đỡ bạn.']
                 }
             ])
+            self._turns = 0
             logger.info("Chat session reset")
         except Exception as e:
             logger.error(f"Error resetting conversation: {e}")
@@ -158,5 +276,58 @@ Bạn đã đề cập đến triệu chứng **"{keyword}"** - đây có thể
             return []
 
 
+class AsyncMedicalAIHandler(MedicalAIHandler):
+    """MedicalAIHandler whose diagnose is a coroutine on the SDK's async chat call
+    
+    Model requests wait on a RequestLimiter, shared by default with every
+    other async handler on the event loop, so one loop can drive many
+    consultations without exceeding the request bound. Turns of one
+    conversation must still be awaited one after the other.
+    """
+    
+    def __init__(self,
+                 model_name: str = LLM_MODEL,
+                 temperature: float = LLM_TEMPERATURE,
+                 max_tokens: int = LLM_MAX_TOKENS,
+                 semantic_cache: Optional[SemanticCache] = DEFAULT_CACHE,
+                 symptom_extractor: Optional[SymptomExtractor] = None,
+                 limiter: RequestLimiter = LLM_REQUEST_LIMITER):
+        """Initialize Async Medical AI Handler"""
+        self.limiter = limiter
+        super().__init__(model_name, temperature, max_tokens, semantic_cache, symptom_extractor)
+    
+    async def diagnose(self, user_input: str) -> str:
+        """Async variant of MedicalAIHandler.diagnose"""
+        try:
+            logger.info("Processing diagnosis request")
+            
+            # Check for emergency first
+            emergency_warning = self.check_emergency(user_input)
+            if emergency_warning:
+                logger.warning("Emergency symptoms detected")
+                return emergency_warning
+            
+            symptom_ids, cached = self._first_turn_cache(user_input)
+            if cached is not None:
+                return cached
+            
+            # Send to AI for diagnosis
+            async with self.limiter:
+                response = await self.chat_session.send_message_async(user_input)
+            
+            if not response or not response.text:
+                logger.error("Empty response from AI")
+                return "❌ Xin lỗi, tôi không thể tạo phản hồi lúc này. Vui lòng thử lại."
+            
+            logger.info("Successfully generated diagnosis")
+            if symptom_ids:
+                self.semantic_cache.store(user_input, response.text, symptom_ids, self._cache_namespace())
+            return response.text
+            
+        except Exception as e:
+            logger.error(f"Error in diagnosis: {e}")
+            return f"❌ Lỗi: {str(e)}\n\n💡 Vui lòng kiểm tra kết nối hoặc thử lại sau."
+
+
 # Export
-__all__ = ['MedicalAIHandler']
+__all__ = ['MedicalAIHandler', 'AsyncMedicalAIHandler']
@@ -2,34 +2,66 @@
 Medical LLM Handler for AI Medical Diagnosis System
 Handles interactions with Google Gemini AI for medical diagnosis
 """
+import asyncio
 import os
+import json
 import logging
-from typing import List, Dict, Optional
+from typing import List, Dict, Iterator, Optional, Tuple
 import google.generativeai as genai
 
 from config import (
     LLM_MODEL,
     LLM_TEMPERATURE,
     LLM_MAX_TOKENS,
+    LLM_CACHE_ENABLED,
+    SEMANTIC_CACHE_ENABLED,
     SYSTEM_PROMPT,
     DIAGNOSIS_PROMPT_TEMPLATE
 )
-from utils import setup_logging
+from request_limiter import RequestLimiter, LLM_REQUEST_LIMITER
+from response_cache import DEFAULT_CACHE, ResponseCache, cache_key
+from semantic_cache import SemanticCache
+from triage import TRIAGE_ENGINE, format_emergency_warning
+from utils import setup_logging, estimate_tokens
 
 logger = setup_logging(__name__)
 
 
 class MedicalLLMHandler:
-    """Handle LLM interactions for medical diagnosis"""
+    """Handle LLM interactions for medical diagnosis
+    
+    Follow-up questions, severity and treatment prompts are built only from
+    symptom and disease lists, so their responses go through a ResponseCache
+    keyed by the prompt, the model settings and the knowledge base revision.
+    First-turn diagnoses can also be reused for near-duplicate messages with
+    the same extracted symptoms through an optional SemanticCache.
+    
+    Every generate_* method has an *_async twin built on the SDK's async
+    calls, with model requests bounded by a RequestLimiter.
+    """
     
     def __init__(self, 
                  model_name: str = LLM_MODEL,
                  temperature: float = LLM_TEMPERATURE,
-                 max_tokens: int = LLM_MAX_TOKENS):
-        """Initialize LLM handler"""
+                 max_tokens: int = LLM_MAX_TOKENS,
+                 response_cache: Optional[ResponseCache] = DEFAULT_CACHE,
+                 semantic_cache: Optional[SemanticCache] = DEFAULT_CACHE,
+                 limiter: RequestLimiter = LLM_REQUEST_LIMITER):
+        """Initialize LLM handler (with the default caches if enabled, None for no cache)"""
         self.model_name = model_name
         self.temperature = temperature
         self.max_tokens = max_tokens
+        self.generation_config = {
+            "temperature": temperature,
+            "max_output_tokens": max_tokens,
+        }
+        if response_cache is DEFAULT_CACHE:
+            response_cache = ResponseCache() if LLM_CACHE_ENABLED else None
+        self.response_cache = response_cache
+        if semantic_cache is DEFAULT_CACHE:
+            semantic_cache = SemanticCache() if SEMANTIC_CACHE_ENABLED else None
+        self.semantic_cache = semantic_cache
+        self.limiter = limiter
         self.model = None
         self.initialize_model()
     
@@ -47,10 +79,7 @@ class MedicalLLMHandler:
             # Create model
             self.model = genai.GenerativeModel(
                 model_name=self.model_name,
-                generation_config={
-                    "temperature": self.temperature,
-                    "max_output_tokens": self.max_tokens,
-                }
+                generation_config=self.generation_config
             )
             
             logger.info(f"Initialized Gemini model: {self.model_name}")
@@ -59,26 +88,52 @@ class MedicalLLMHandler:
             logger.error(f"Failed to initialize Gemini model: {e}")
             raise
     
-    def generate_diagnosis(self,
+    def _diagnosis_prompt(self,
                           user_input: str,
                           knowledge_context: str,
                           chat_history: str = "",
                           symptoms_info: str = "") -> str:
-        """Generate medical diagnosis response"""
+        """Full diagnosis prompt, system prompt included"""
+        prompt = DIAGNOSIS_PROMPT_TEMPLATE.format(
+            user_input=user_input,
+            knowledge_context=knowledge_context,
+            chat_history=chat_history if chat_history else "Chưa có lịch sử",
+            symptoms_info=symptoms_info if symptoms_info else "Chưa có triệu chứng được xác định"
+        )
+        full_prompt = f"{SYSTEM_PROMPT}\n\n{prompt}"
+        
+        logger.info(
+            f"Generating diagnosis response (prompt: {len(full_prompt)} chars, "
+            f"~{estimate_tokens(full_prompt)} tokens; "
+            f"context: ~{estimate_tokens(knowledge_context)} tokens)"
+        )
+        return full_prompt
+    
+    def _diagnosis_cache(self, chat_history: str, symptom_ids: Optional[List[str]]) -> Optional[SemanticCache]:
+        """Semantic cache usable for this request (first turn with symptoms only)"""
+        return self.semantic_cache if not chat_history and symptom_ids else None
+    
+    def generate_diagnosis(self,
+                          user_input: str,
+                          knowledge_context: str,
+                          chat_history: str = "",
+                          symptoms_info: str = "",
+                          symptom_ids: Optional[List[str]] = None,
+                          knowledge_version: Optional[str] = None) -> str:
+        """Generate medical diagnosis response
+        
+        Without chat history, a cached answer to a similar message with the
+        same symptom ids is returned when the semantic cache is enabled.
+        """
         try:
-            # Build prompt
-            prompt = DIAGNOSIS_PROMPT_TEMPLATE.format(
-                user_input=user_input,
-                knowledge_context=knowledge_context,
-                chat_history=chat_history if chat_history else "Chưa có lịch sử",
-                symptoms_info=symptoms_info if symptoms_info else "Chưa có triệu chứng được xác định"
-            )
-            
-            # Add system prompt
-            full_prompt = f"{SYSTEM_PROMPT}\n\n{prompt}"
+            semantic_cache = self._diagnosis_cache(chat_history, symptom_ids)
+            namespace = self._cache_namespace(knowledge_version)
+            if semantic_cache is not None:
+                cached = semantic_cache.lookup(user_input, symptom_ids, namespace)
+                if cached is not None:
+                    return cached
             
-            logger.info("Generating diagnosis response")
-            logger.debug(f"Prompt length: {len(full_prompt)} characters")
+            full_prompt = self._diagnosis_prompt(user_input, knowledge_context, chat_history, symptoms_info)
             
             # Generate response
             response = self.model.generate_content(full_prompt)
@@ -88,18 +143,173 @@ class MedicalLLMHandler:
                 return "❌ Xin lỗi, tôi không thể tạo phản hồi lúc này. Vui lòng thử lại."
             
             logger.info("Successfully generated diagnosis response")
+            if semantic_cache is not None:
+                semantic_cache.store(user_input, response.text, symptom_ids, namespace)
             return response.text
             
         except Exception as e:
             logger.error(f"Error generating diagnosis: {e}")
             return f"❌ Lỗi: {str(e)}\n\n💡 Vui lòng kiểm tra API key hoặc thử lại sau."
     
+    def generate_diagnosis_stream(self,
+                                  user_input: str,
+                                  knowledge_context: str,
+                                  chat_history: str = "",
+                                  symptoms_info: str = "",
+                                  symptom_ids: Optional[List[str]] = None,
+                                  knowledge_version: Optional[str] = None) -> Iterator[str]:
+        """Streaming variant of generate_diagnosis, yielding text chunks as they arrive"""
+        chunks = []
+        try:
+            semantic_cache = self._diagnosis_cache(chat_history, symptom_ids)
+            namespace = self._cache_namespace(knowledge_version)
+            if semantic_cache is not None:
+                cached = semantic_cache.lookup(user_input, symptom_ids, namespace)
+                if cached is not None:
+                    yield cached
+                    return
+            
+            full_prompt = self._diagnosis_prompt(user_input, knowledge_context, chat_history, symptoms_info)
+            
+            # Stream response
+            for chunk in self.model.generate_content(full_prompt, stream=True):
+                if chunk.text:
+                    chunks.append(chunk.text)
+                    yield chunk.text
+            
+        except Exception as e:
+            logger.error(f"Error streaming diagnosis: {e}")
+            separator = "\n\n" if chunks else ""
+            yield f"{separator}❌ Lỗi: {str(e)}\n\n💡 Vui lòng kiểm tra API key hoặc thử lại sau."
+            return
+        
+        if not chunks:
+            logger.error("Empty response from model")
+            yield "❌ Xin lỗi, tôi không thể tạo phản hồi lúc này. Vui lòng thử lại."
+            return
+        
+        logger.info("Successfully streamed diagnosis response")
+        if semantic_cache is not None:
+            semantic_cache.store(user_input, "".join(chunks), symptom_ids, namespace)
+    
+    async def generate_diagnosis_async(self,
+                                       user_input: str,
+                                       knowledge_context: str,
+                                       chat_history: str = "",
+                                       symptoms_info: str = "",
+                                       symptom_ids: Optional[List[str]] = None,
+                                       knowledge_version: Optional[str] = None) -> str:
+        """Async variant of generate_diagnosis"""
+        try:
+            semantic_cache = self._diagnosis_cache(chat_history, symptom_ids)
+            namespace = self._cache_namespace(knowledge_version)
+            if semantic_cache is not None:
+                cached = semantic_cache.lookup(user_input, symptom_ids, namespace)
+                if cached is not None:
+                    return cached
+            
+            full_prompt = self._diagnosis_prompt(user_input, knowledge_context, chat_history, symptoms_info)
+            
+            # Generate response
+            async with self.limiter:
+                response = await self.model.generate_content_async(full_prompt)
+            
+            if not response or not response.text:
+                logger.error("Empty response from model")
+                return "❌ Xin lỗi, tôi không thể tạo phản hồi lúc này. Vui lòng thử lại."
+            
+            logger.info("Successfully generated diagnosis response")
+            if semantic_cache is not None:
+                semantic_cache.store(user_input, response.text, symptom_ids, namespace)
+            return response.text
+            
+        except Exception as e:
+            logger.error(f"Error generating diagnosis: {e}")
+            return f"❌ Lỗi: {str(e)}\n\n💡 Vui lòng kiểm tra API key hoặc thử lại sau."
+    
+    def _cache_namespace(self, knowledge_version: Optional[str] = None) -> tuple:
+        """Settings a cached answer depends on besides the message itself"""
+        return self.model_name, tuple(sorted(self.generation_config.items())), knowledge_version
+    
+    def _cached_response(self, prompt: str, knowledge_version: Optional[str] = None) -> Tuple[Optional[str], Optional[str]]:
+        """Response cache key of a deterministic prompt and its cached text, if any"""
+        if self.response_cache is None:
+            return None, None
+        key = cache_key(prompt, self.model_name, self.generation_config, knowledge_version)
+        text = self.response_cache.get(key)
+        if text is not None:
+            logger.debug("Response cache hit")
+        return key, text
+    
+    @staticmethod
+    def _request_options(request_timeout: Optional[float]) -> Dict:
+        """generate_content arguments that bound a single request to request_timeout seconds"""
+        return {} if request_timeout is None else {'request_options': {'timeout': request_timeout}}
+    
+    def _generate_cached(self,
+                         prompt: str,
+                         knowledge_version: Optional[str] = None,
+                         request_timeout: Optional[float] = None) -> str:
+        """Response text for a deterministic prompt, from the cache when possible"""
+        key, text = self._cached_response(prompt, knowledge_version)
+        if text is not None:
+            return text
+        
+        response = self.model.generate_content(prompt, **self._request_options(request_timeout))
+        text = response.text if response and response.text else ""
+        if key is not None and text:
+            self.response_cache.put(key, text)
+        return text
+    
+    async def _generate_cached_async(self,
+                                     prompt: str,
+                                     knowledge_version: Optional[str] = None,
+                                     request_timeout: Optional[float] = None) -> str:
+        """Async variant of _generate_cached (cache I/O runs in a worker thread)"""
+        key, text = await asyncio.to_thread(self._cached_response, prompt, knowledge_version)
+        if text is not None:
+            return text
+        
+        async with self.limiter:
+            response = await self.model.generate_content_async(prompt, **self._request_options(request_timeout))
+        text = response.text if response and response.text else ""
+        if key is not None and text:
+            await asyncio.to_thread(self.response_cache.put, key, text)
+        return text
+    
     def generate_follow_up_questions(self,
                                     current_symptoms: List[str],
-                                    possible_diseases: List[Dict]) -> str:
-        """Generate follow-up questions to narrow down diagnosis"""
+                                    possible_diseases: List[Dict],
+                                    knowledge_version: Optional[str] = None) -> str:
+        """Generate follow-up questions to narrow down diagnosis
+        
+        knowledge_version (KnowledgeManager.revision) separates cached
+        responses of different knowledge bases.
+        """
+        try:
+            prompt = self._follow_up_prompt(current_symptoms, possible_diseases)
+            return self._generate_cached(prompt, knowledge_version)
+            
+        except Exception as e:
+            logger.error(f"Error generating follow-up questions: {e}")
+            return ""
+    
+    async def generate_follow_up_questions_async(self,
+                                                 current_symptoms: List[str],
+                                                 possible_diseases: List[Dict],
+                                                 knowledge_version: Optional[str] = None) -> str:
+        """Async variant of generate_follow_up_questions"""
         try:
-            prompt = f"""Dựa trên các triệu chứng hiện tại:
+            prompt = self._follow_up_prompt(current_symptoms, possible_diseases)
+            return await self._generate_cached_async(prompt, knowledge_version)
+            
+        except Exception as e:
+            logger.error(f"Error generating follow-up questions: {e}")
+            return ""
+    
+    @staticmethod
+    def _follow_up_prompt(current_symptoms: List[str], possible_diseases: List[Dict]) -> str:
+        return f"""Dựa trên các triệu chứng hiện tại:
 {', '.join(current_symptoms)}
 
 Và các bệnh có thể:
@@ -111,18 +321,49 @@ Câu hỏi nên:
 - Giúp phân biệt giữa các bệnh
 - Liên quan đến mức độ, thời gian, hoặc triệu chứng đi kèm
 """
-            
-            response = self.model.generate_content(prompt)
-            return response.text if response and response.text else ""
+    
+    def assess_severity(self,
+                        symptoms: List[str],
+                        knowledge_version: Optional[str] = None,
+                        raise_errors: bool = False,
+                        request_timeout: Optional[float] = None) -> Dict:
+        """Assess severity of symptoms
+        
+        A failed request gives an 'unknown' severity, or is raised with
+        raise_errors so callers can tell it from an answer. request_timeout
+        bounds the model request itself, in seconds.
+        """
+        try:
+            text = self._generate_cached(self._severity_prompt(symptoms), knowledge_version, request_timeout)
+            return self._parse_severity(text)
             
         except Exception as e:
-            logger.error(f"Error generating follow-up questions: {e}")
-            return ""
+            logger.error(f"Error assessing severity: {e}")
+            if raise_errors:
+                raise
+            return self._unknown_severity(str(e))
     
-    def assess_severity(self, symptoms: List[str]) -> Dict:
-        """Assess severity of symptoms"""
+    async def assess_severity_async(self,
+                                    symptoms: List[str],
+                                    knowledge_version: Optional[str] = None,
+                                    raise_errors: bool = False,
+                                    request_timeout: Optional[float] = None) -> Dict:
+        """Async variant of assess_severity"""
         try:
-            prompt = f"""Đánh giá mức độ nghiêm trọng của các triệu chứng sau:
+            text = await self._generate_cached_async(
+                self._severity_prompt(symptoms), knowledge_version, request_timeout
+            )
+            return self._parse_severity(text)
+            
+        except Exception as e:
+            logger.error(f"Error assessing severity: {e}")
+            if raise_errors:
+                raise
+            return self._unknown_severity(str(e))
+    
+    @staticmethod
+    def _severity_prompt(symptoms: List[str]) -> str:
+        return f"""Đánh giá mức độ nghiêm trọng của các triệu chứng sau:
 {', '.join(symptoms)}
 
 Trả lời theo format JSON:
@@ -132,42 +373,65 @@ Trả lời theo format JSON:
     "explanation": "Giải thích ngắn gọn"
 }}
 """
-            
-            response = self.model.generate_content(prompt)
-            
-            if response and response.text:
-                # Try to parse JSON response
-                import json
-                try:
-                    return json.loads(response.text)
-                except:
-                    # Fallback to text response
-                    return {
-                        "severity_level": "unknown",
-                        "urgency": "should_see_doctor_soon",
-                        "explanation": response.text
-                    }
-            
-            return {
-                "severity_level": "unknown",
-                "urgency": "should_see_doctor_soon",
-                "explanation": "Không thể đánh giá"
-            }
-            
-        except Exception as e:
-            logger.error(f"Error assessing severity: {e}")
-            return {
-                "severity_level": "unknown",
-                "urgency": "should_see_doctor_soon",
-                "explanation": str(e)
-            }
+    
+    @staticmethod
+    def _unknown_severity(explanation: str) -> Dict:
+        return {
+            "severity_level": "unknown",
+            "urgency": "should_see_doctor_soon",
+            "explanation": explanation
+        }
+    
+    @classmethod
+    def _parse_severity(cls, text: str) -> Dict:
+        """Severity dict from the model's JSON answer, falling back to its text"""
+        if not text:
+            return cls._unknown_severity("Không thể đánh giá")
+        try:
+            return json.loads(text)
+        except ValueError:
+            # Fallback to text response
+            return cls._unknown_severity(text)
     
     def generate_treatment_recommendations(self, 
                                           diagnosis: str,
-                                          symptoms: List[str]) -> str:
-        """Generate treatment recommendations"""
+                                          symptoms: List[str],
+                                          knowledge_version: Optional[str] = None,
+                                          raise_errors: bool = False,
+                                          request_timeout: Optional[float] = None) -> str:
+        """Generate treatment recommendations ("" on failure, unless raise_errors)"""
+        try:
+            return self._generate_cached(
+                self._treatment_prompt(diagnosis, symptoms), knowledge_version, request_timeout
+            )
+            
+        except Exception as e:
+            logger.error(f"Error generating treatment recommendations: {e}")
+            if raise_errors:
+                raise
+            return ""
+    
+    async def generate_treatment_recommendations_async(self,
+                                                       diagnosis: str,
+                                                       symptoms: List[str],
+                                                       knowledge_version: Optional[str] = None,
+                                                       raise_errors: bool = False,
+                                                       request_timeout: Optional[float] = None) -> str:
+        """Async variant of generate_treatment_recommendations"""
         try:
-            prompt = f"""Dựa trên chẩn đoán: {diagnosis}
+            return await self._generate_cached_async(
+                self._treatment_prompt(diagnosis, symptoms), knowledge_version, request_timeout
+            )
+            
+        except Exception as e:
+            logger.error(f"Error generating treatment recommendations: {e}")
+            if raise_errors:
+                raise
+            return ""
+    
+    @staticmethod
+    def _treatment_prompt(diagnosis: str, symptoms: List[str]) -> str:
+        return f"""Dựa trên chẩn đoán: {diagnosis}
 Và các triệu chứng: {', '.join(symptoms)}
 
 Hãy đưa ra khuyến nghị điều trị bao gồm:
@@ -178,13 +442,6 @@ Hãy đưa ra khuyến nghị điều trị bao gồm:
 
 Lưu ý: Luôn nhắc nhở đây chỉ là tham khảo, cần tham khảo bác sĩ.
 """
-            
-            response = self.model.generate_content(prompt)
-            return response.text if response and response.text else ""
-            
-        except Exception as e:
-            logger.error(f"Error generating treatment recommendations: {e}")
-            return ""
     
     def format_medical_response(self,
                                diagnosis_text: str,
@@ -207,32 +464,13 @@ Lưu ý: Luôn nhắc nhở đây chỉ là tham khảo, cần tham khảo bác
         
         return formatted
     
+    def triage_symptoms(self, symptoms: List[str]) -> Dict:
+        """Triage a list of symptoms against tiered emergency keywords"""
+        return TRIAGE_ENGINE.triage_symptoms(symptoms)
+    
     def check_emergency_symptoms(self, symptoms: List[str]) -> Optional[str]:
         """Check for emergency symptoms"""
-        emergency_keywords = [
-            'khó thở', 'đau ngực', 'bất tỉnh', 'co giật', 
-            'chảy máu nhiều', 'đau đầu dữ dội', 'liệt',
-            'mất ý thức', 'sốc', 'ngộ độc'
-        ]
-        
-        symptoms_text = ' '.join(symptoms).lower()
-        
-        for keyword in emergency_keywords:
-            if keyword in symptoms_text:
-                return f"""
-⚠️⚠️⚠️ **CẢNH BÁO KHẨN CẤP** ⚠️⚠️⚠️
-
-Triệu chứng "{keyword}" có thể là dấu hiệu nghiêm trọng!
-
-🚨 **HÀNH ĐỘNG NGAY:**
-- Gọi cấp cứu 115
-- Đến bệnh viện gần nhất
-- KHÔNG tự điều trị tại nhà
-
-Đây là tình huống khẩn cấp cần được xử lý ngay lập tức!
-"""
-        
-        return None
+        return format_emergency_warning(self.triage_symptoms(symptoms))
 
 
 # Export
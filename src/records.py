@@ -0,0 +1,169 @@
+"""
+Records for AI Medical Diagnosis System
+Compact slotted record types with a read-only dict interface
+"""
+import sys
+from collections.abc import Mapping
+from dataclasses import dataclass, field
+from typing import Any, ClassVar, Dict, FrozenSet, List, Optional, Tuple
+
+
+class RecordMixin(Mapping):
+    """Read-only mapping interface for slotted records
+
+    Records replace the dicts previously passed around, so existing code
+    keeps working with record['id'], record.get('treatment'), 'aliases' in
+    record, dict(record) and comparisons with plain dicts. Optional fields
+    set to None read as absent keys, like a dict without them, and keys
+    outside the schema are kept in 'extra'.
+    """
+    __slots__ = ()
+    _optional: ClassVar[FrozenSet[str]] = frozenset()
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self.__slots__ and key != 'extra':
+            value = getattr(self, key)
+            if value is None and key in self._optional:
+                raise KeyError(key)
+            return value
+        extra = getattr(self, 'extra', None)
+        if extra and key in extra:
+            return extra[key]
+        raise KeyError(key)
+
+    def __iter__(self):
+        for key in self.__slots__:
+            if key == 'extra' or (key in self._optional and getattr(self, key) is None):
+                continue
+            yield key
+        extra = getattr(self, 'extra', None)
+        if extra:
+            yield from extra
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, Mapping):
+            return self.to_dict() == to_plain(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def to_dict(self) -> Dict:
+        """Plain dict copy (tuples as lists, nested records as dicts), e.g. for JSON"""
+        return {key: to_plain(self[key]) for key in self}
+
+
+def to_plain(value: Any) -> Any:
+    """Convert records, tuples and nested containers to plain JSON types"""
+    if isinstance(value, RecordMixin):
+        return value.to_dict()
+    if isinstance(value, Mapping):
+        return {key: to_plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_plain(item) for item in value]
+    return value
+
+
+def _strings(values) -> Tuple[str, ...]:
+    # Interned: symptom ids repeat across many diseases
+    return tuple(sys.intern(value) for value in values)
+
+
+def _extra(data: Mapping, fields: Tuple[str, ...]) -> Optional[Dict]:
+    extra = {key: value for key, value in data.items() if key not in fields}
+    return extra or None
+
+
+@dataclass(frozen=True, slots=True, eq=False)
+class Disease(RecordMixin):
+    """A disease of the knowledge base"""
+    id: str
+    name: str
+    description: Optional[str] = None
+    symptoms: Tuple[str, ...] = ()
+    treatment: Optional[str] = None
+    severity: Optional[str] = None
+    extra: Optional[Dict] = None
+
+    _optional: ClassVar[FrozenSet[str]] = frozenset({'description', 'treatment', 'severity'})
+
+    @classmethod
+    def from_dict(cls, data: Mapping) -> 'Disease':
+        """Build from a (validated) dict; records are returned unchanged"""
+        if isinstance(data, cls):
+            return data
+        return cls(
+            id=sys.intern(data['id']),
+            name=data['name'],
+            description=data.get('description'),
+            symptoms=_strings(data.get('symptoms', ())),
+            treatment=data.get('treatment'),
+            severity=data.get('severity'),
+            extra=_extra(data, cls.__slots__)
+        )
+
+
+@dataclass(frozen=True, slots=True, eq=False)
+class Symptom(RecordMixin):
+    """A symptom of the knowledge base"""
+    id: str
+    name: str
+    category: Optional[str] = None
+    aliases: Optional[Tuple[str, ...]] = None
+    extra: Optional[Dict] = None
+
+    _optional: ClassVar[FrozenSet[str]] = frozenset({'category', 'aliases'})
+
+    @classmethod
+    def from_dict(cls, data: Mapping) -> 'Symptom':
+        """Build from a (validated) dict; records are returned unchanged"""
+        if isinstance(data, cls):
+            return data
+        aliases = data.get('aliases')
+        return cls(
+            id=sys.intern(data['id']),
+            name=data['name'],
+            category=data.get('category'),
+            aliases=tuple(aliases) if aliases is not None else None,
+            extra=_extra(data, cls.__slots__)
+        )
+
+
+@dataclass(frozen=True, slots=True, eq=False)
+class DiseaseMatch(RecordMixin):
+    """A ranked or searched disease
+
+    Ranking fills score; search fills match_count and match_ratio.
+    """
+    disease: Mapping
+    matched_symptoms: List[str] = field(default_factory=list)
+    score: Optional[float] = None
+    match_count: Optional[int] = None
+    match_ratio: Optional[float] = None
+
+    _optional: ClassVar[FrozenSet[str]] = frozenset({'score', 'match_count', 'match_ratio'})
+
+
+@dataclass(frozen=True, slots=True, eq=False)
+class AnalysisResult(RecordMixin):
+    """Result of DiagnosisEngine.analyze_symptoms"""
+    symptoms: List[str] = field(default_factory=list)
+    symptom_ids: List[str] = field(default_factory=list)
+    new_symptoms: List[str] = field(default_factory=list)
+    matched_diseases: List[DiseaseMatch] = field(default_factory=list)
+    top_confidence: float = 0.0
+    has_enough_info: bool = False
+    emergency_warning: Optional[str] = None
+
+
+# Export
+__all__ = [
+    'RecordMixin',
+    'Disease',
+    'Symptom',
+    'DiseaseMatch',
+    'AnalysisResult',
+    'to_plain'
+]
@@ -0,0 +1,50 @@
+"""
+Request Limiter for AI Medical Diagnosis System
+Bound the number of model requests in flight from async handlers
+"""
+import asyncio
+import threading
+import weakref
+
+from config import LLM_MAX_CONCURRENT_REQUESTS
+
+
+class RequestLimiter:
+    """Async context manager admitting at most limit concurrent requests
+
+    asyncio.Semaphore belongs to a single event loop, so one semaphore is
+    created lazily for each running loop. Handlers sharing a limiter share
+    the bound on a loop; loops in different threads have independent bounds.
+    """
+
+    def __init__(self, limit: int = LLM_MAX_CONCURRENT_REQUESTS):
+        """Create a limiter admitting limit concurrent requests per event loop"""
+        if limit < 1:
+            raise ValueError(f"Request limit must be positive: {limit}")
+        self.limit = limit
+        self._semaphores = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def semaphore(self) -> asyncio.Semaphore:
+        """Semaphore of the running event loop"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            semaphore = self._semaphores.get(loop)
+            if semaphore is None:
+                semaphore = self._semaphores[loop] = asyncio.Semaphore(self.limit)
+        return semaphore
+
+    async def __aenter__(self) -> 'RequestLimiter':
+        await self.semaphore().acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        self.semaphore().release()
+
+
+# Shared by the handlers unless they are given their own limiter
+LLM_REQUEST_LIMITER = RequestLimiter()
+
+
+# Export
+__all__ = ['RequestLimiter', 'LLM_REQUEST_LIMITER']
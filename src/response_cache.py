@@ -0,0 +1,186 @@
+"""
+Response Cache for AI Medical Diagnosis System
+Two-tier LRU + TTL cache of LLM responses (memory, then SQLite on disk)
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional
+
+from config import LLM_CACHE_MAX_ENTRIES, LLM_CACHE_TTL, LLM_CACHE_PATH
+from utils import setup_logging
+
+logger = setup_logging(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    expires_at REAL NOT NULL
+)
+"""
+
+# Expired rows are purged from disk on open and every this many puts
+_PURGE_EVERY = 256
+
+# Default of the handlers' cache arguments: the cache from config if it is
+# enabled. Passing None instead turns caching off.
+DEFAULT_CACHE = object()
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Unicode NFC form with runs of whitespace collapsed"""
+    return ' '.join(unicodedata.normalize('NFC', prompt).split())
+
+
+def cache_key(prompt: str,
+              model_name: str,
+              generation_config: Optional[Dict] = None,
+              knowledge_version: Optional[str] = None) -> str:
+    """Hash of everything a response depends on"""
+    payload = json.dumps(
+        [normalize_prompt(prompt), model_name, generation_config or {}, knowledge_version],
+        ensure_ascii=False, sort_keys=True, default=str
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """LRU + TTL cache of model responses, in memory and on disk
+
+    Lookups check an in-memory LRU first, then a SQLite table that every
+    process using the same path shares; disk hits are promoted to memory.
+    Entries expire ttl seconds after they were stored. The file is opened on
+    first use; if that fails the cache keeps working in memory only.
+    """
+
+    def __init__(self,
+                 path: Optional[Path] = LLM_CACHE_PATH,
+                 max_entries: int = LLM_CACHE_MAX_ENTRIES,
+                 ttl: float = LLM_CACHE_TTL):
+        """Create a cache stored at path (None: memory only)"""
+        self.path = Path(path) if path is not None else None
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # key -> (expires_at, value), least recently used first
+        self._memory = OrderedDict()
+        self._connection = None
+        self._puts = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._memory)
+
+    def _disk(self) -> Optional[sqlite3.Connection]:
+        """Connection to the disk tier, opened on first use"""
+        if self._connection is None and self.path is not None:
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                connection = sqlite3.connect(str(self.path), check_same_thread=False,
+                                             timeout=30, isolation_level=None)
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.execute(SCHEMA)
+                connection.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),))
+                self._connection = connection
+            except (OSError, sqlite3.Error) as e:
+                logger.warning(f"Response cache on disk disabled ({self.path}): {e}")
+                self.path = None
+        return self._connection
+
+    def _remember(self, key: str, expires_at: float, value: str) -> None:
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[str]:
+        """Cached value of key, None on a miss or once expired"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._memory[key]
+
+            row = None
+            connection = self._disk()
+            if connection is not None:
+                try:
+                    row = connection.execute(
+                        "SELECT expires_at, value FROM responses WHERE key = ? AND expires_at > ?",
+                        (key, now)
+                    ).fetchone()
+                except sqlite3.Error as e:
+                    logger.warning(f"Response cache read failed: {e}")
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.disk_hits += 1
+            self._remember(key, row[0], row[1])
+            return row[1]
+
+    def put(self, key: str, value: str) -> None:
+        """Store value under key for ttl seconds"""
+        now = time.time()
+        expires_at = now + self.ttl
+        with self._lock:
+            self._remember(key, expires_at, value)
+            connection = self._disk()
+            if connection is None:
+                return
+            try:
+                connection.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, value, expires_at)
+                )
+                self._puts += 1
+                if self._puts % _PURGE_EVERY == 0:
+                    connection.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+            except sqlite3.Error as e:
+                logger.warning(f"Response cache write failed: {e}")
+
+    def clear(self) -> None:
+        """Drop all entries, in memory and on disk"""
+        with self._lock:
+            self._memory.clear()
+            connection = self._disk()
+            if connection is not None:
+                try:
+                    connection.execute("DELETE FROM responses")
+                except sqlite3.Error as e:
+                    logger.warning(f"Response cache clear failed: {e}")
+
+    def get_statistics(self) -> Dict:
+        """Hit and miss counters"""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'memory_entries': len(self._memory)
+        }
+
+    def close(self) -> None:
+        """Close the disk tier"""
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+# Export
+__all__ = ['DEFAULT_CACHE', 'ResponseCache', 'cache_key', 'normalize_prompt']
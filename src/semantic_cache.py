@@ -0,0 +1,193 @@
+"""
+Semantic Cache for AI Medical Diagnosis System
+Reuse answers to near-duplicate patient messages without an embedding service
+"""
+import threading
+import zlib
+from typing import Dict, Hashable, Iterable, List, Optional
+
+try:
+    import numpy as np
+except ImportError:  # numpy is only needed for the semantic cache
+    np = None
+
+from config import SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_MAX_ENTRIES, SEMANTIC_CACHE_DIM
+from utils import setup_logging, tokenize, fold_diacritics
+
+logger = setup_logging(__name__)
+
+# Words (folded to plain letters) that change what a message means without
+# changing its symptoms or much of its text: negation, whose symptoms they
+# are (age, children, relatives) and pregnancy. A message containing one,
+# or any digit, is never answered from or stored in the cache.
+RISK_WORDS = frozenset({
+    'khong', 'ko', 'k', 'chua', 'chang', 'cha', 'het', 'dung', 'bot', 'do',
+    'tuoi', 'thang', 'con', 'be', 'chau', 'tre', 'nhi', 'me', 'bo', 'ong', 'ba',
+    'vo', 'chong', 'cu', 'gia',
+    'thai', 'bau', 'mang', 'sinh', 'de', 'cho', 'bu'
+})
+
+# Words that may surround the symptom mentions of a reusable message
+FILLER_WORDS = frozenset({
+    'toi', 'minh', 'em', 'anh', 'chi', 'bi', 'co', 'va', 'voi', 'hoi', 'thay',
+    'cam', 'dang', 'thi', 'la', 'nhung', 'cung', 'them', 'roi', 'a', 'oi',
+    'bac', 'si', 'xin', 'chao', 'cac', 'giup', 'nay'
+})
+
+
+def has_risk_words(text: str) -> bool:
+    """Whether text has a negation, age or pregnancy word or a digit"""
+    for token, _, _ in tokenize(text):
+        if fold_diacritics(token) in RISK_WORDS or any(c.isdigit() for c in token):
+            return True
+    return False
+
+
+def unexplained_words(text: str, matches: Iterable[Dict]) -> List[str]:
+    """Words of text outside the extracted symptom matches that are not filler
+
+    matches are SymptomExtractor.extract results (their 'start' and 'end'
+    offsets). Text that is none of these could qualify the symptoms in ways
+    the cache cannot see.
+    """
+    spans = [(m['start'], m['end']) for m in matches]
+    return [
+        token for token, start, end in tokenize(text)
+        if not any(s <= start and end <= e for s, e in spans)
+        and fold_diacritics(token) not in FILLER_WORDS
+    ]
+
+
+def reusable_message(text: str, matches: Iterable[Dict]) -> bool:
+    """Whether the answer to text may be cached and reused: only symptom
+    mentions and filler words, no risk words"""
+    matches = list(matches)
+    return bool(matches) and not has_risk_words(text) and not unexplained_words(text, matches)
+
+
+def text_vector(text: str, dim: int = SEMANTIC_CACHE_DIM):
+    """L2-normalised hashed bag of words and character trigrams
+
+    Words are lowercased and folded to plain letters, so 'sốt' and 'sot'
+    share features; trigrams make inflected or misspelt words overlap.
+    crc32 keeps the hashing identical across processes.
+    """
+    vector = np.zeros(dim, dtype=np.float32)
+    for token, _, _ in tokenize(text):
+        word = fold_diacritics(token)
+        features = [word] + [f" {word} "[i:i + 3] for i in range(len(word))]
+        for feature in features:
+            vector[zlib.crc32(feature.encode('utf-8')) % dim] += 1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class SemanticCache:
+    """Answers of earlier messages, found again by meaning rather than exact text
+
+    A message can only match entries with exactly the same set of extracted
+    symptom ids (and namespace: model settings, knowledge base revision);
+    among those the most similar text by cosine is returned if it reaches
+    threshold. Similar wording is not similar meaning: "không bị sốt" or
+    "con tôi 2 tuổi" barely moves the score, so messages with risk words are
+    never looked up or stored, and callers that extract symptoms should only
+    pass symptom ids for reusable_message() texts. Messages with no
+    recognised symptom are never cached either. Text
+    vectors sit in one preallocated matrix used as a ring buffer, so the
+    oldest entry is replaced once max_entries is reached.
+    """
+
+    def __init__(self,
+                 threshold: float = SEMANTIC_CACHE_THRESHOLD,
+                 max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES,
+                 dim: int = SEMANTIC_CACHE_DIM):
+        """Create an empty cache"""
+        if np is None:
+            raise ImportError("numpy is required for the semantic cache")
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.dim = dim
+        self._vectors = np.zeros((max_entries, dim), dtype=np.float32)
+        self._values = [None] * max_entries
+        self._groups = [None] * max_entries
+        # Group key -> rows holding its entries
+        self._rows = {}
+        self._next = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return sum(len(rows) for rows in self._rows.values())
+
+    @staticmethod
+    def _group(symptom_ids: Iterable, namespace: Hashable) -> Optional[tuple]:
+        symptoms = frozenset(str(s).lower() for s in symptom_ids)
+        return (symptoms, namespace) if symptoms else None
+
+    def lookup(self, text: str, symptom_ids: Iterable, namespace: Hashable = None) -> Optional[str]:
+        """Cached answer of the most similar earlier message, None below threshold"""
+        group = self._group(symptom_ids, namespace)
+        if group is None or has_risk_words(text):
+            return None
+        vector = text_vector(text, self.dim)
+        with self._lock:
+            rows = self._rows.get(group)
+            if rows:
+                scores = self._vectors[rows] @ vector
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    self.hits += 1
+                    logger.info(f"Semantic cache hit (similarity {scores[best]:.2f})")
+                    return self._values[rows[best]]
+            self.misses += 1
+            return None
+
+    def store(self, text: str, value: str, symptom_ids: Iterable, namespace: Hashable = None) -> None:
+        """Remember the answer to a message (ignored without symptoms)"""
+        group = self._group(symptom_ids, namespace)
+        if group is None or not value or has_risk_words(text):
+            return
+        vector = text_vector(text, self.dim)
+        with self._lock:
+            row = self._next
+            self._next = (row + 1) % self.max_entries
+            previous = self._groups[row]
+            if previous is not None:
+                self._rows[previous].remove(row)
+                if not self._rows[previous]:
+                    del self._rows[previous]
+            self._vectors[row] = vector
+            self._values[row] = value
+            self._groups[row] = group
+            self._rows.setdefault(group, []).append(row)
+
+    def clear(self) -> None:
+        """Drop all entries"""
+        with self._lock:
+            self._values = [None] * self.max_entries
+            self._groups = [None] * self.max_entries
+            self._rows = {}
+            self._next = 0
+
+    def get_statistics(self) -> Dict:
+        """Hit and miss counters"""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': len(self)
+        }
+
+
+# Export
+__all__ = [
+    'FILLER_WORDS',
+    'RISK_WORDS',
+    'SemanticCache',
+    'has_risk_words',
+    'reusable_message',
+    'text_vector',
+    'unexplained_words'
+]
@@ -0,0 +1,343 @@
+"""
+Symptom Extractor for AI Medical Diagnosis System
+Token trie over normalized symptom names, built once per knowledge base version
+"""
+import re
+from functools import lru_cache
+from typing import List, Dict, Iterable, Optional, Tuple
+
+from config import FUZZY_MAX_EDIT_DISTANCE, FUZZY_MIN_CONFIDENCE, FUZZY_MIN_LENGTH
+from utils import tokenize, fold_diacritics, diacritics_compatible
+
+# Trie key holding the entries that end at a node (tokens are never empty)
+_END = ''
+
+# Qualifiers such as "(>38°C)" dropped to derive a shorter surface form
+_QUALIFIER_PATTERN = re.compile(r'\s*\([^)]*\)')
+
+
+def phrase_key(tokens: Iterable[str]) -> str:
+    """Hash key of a tokenized phrase: diacritic-folded tokens joined by spaces"""
+    return fold_diacritics(' '.join(tokens))
+
+
+def _trigrams(text: str) -> set:
+    """Distinct padded character trigrams of text"""
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def bounded_edit_distance(a: str, b: str, max_distance: int) -> Optional[int]:
+    """Levenshtein distance of a and b, or None if it exceeds max_distance"""
+    if abs(len(a) - len(b)) > max_distance:
+        return None
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char_a != char_b)
+            ))
+        if min(current) > max_distance:
+            return None
+        previous = current
+    return previous[-1] if previous[-1] <= max_distance else None
+
+
+def surface_distance(typed: str, expected: str) -> int:
+    """Edit distance of typed to expected where dropping a diacritic is free
+
+    Both strings must be normalized. Changing a diacritic ('ngừa' for 'ngứa')
+    costs an edit, so only text that keeps or drops the expected diacritics
+    reaches distance 0.
+    """
+    folded = fold_diacritics(expected)
+    previous = list(range(len(expected) + 1))
+    for i, char_a in enumerate(typed, 1):
+        current = [i]
+        for j, char_b in enumerate(expected, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char_a != char_b and char_a != folded[j - 1])
+            ))
+        previous = current
+    return previous[-1]
+
+
+class FuzzyPhraseIndex:
+    """Character-trigram inverted index over folded phrase keys
+
+    An edit changes at most three trigrams of the query, so a phrase within
+    edit distance k shares at least |trigrams(query)| - 3k of them. Only
+    phrases reaching that count in the posting lists are verified with a
+    bounded edit distance, so a lookup never scans the whole vocabulary.
+    """
+
+    def __init__(self, keys: Iterable[str]):
+        """Index phrase keys"""
+        self.keys = list(keys)
+        self.postings = {}
+        for key_index, key in enumerate(self.keys):
+            for trigram in _trigrams(key):
+                self.postings.setdefault(trigram, []).append(key_index)
+
+    def search(self, query: str, max_distance: int = FUZZY_MAX_EDIT_DISTANCE) -> List[Tuple[str, int, float]]:
+        """Find keys within max_distance of query as (key, distance, confidence)"""
+        query = fold_diacritics(query)
+        query_trigrams = _trigrams(query)
+        # Keep the count filter meaningful for short queries
+        max_distance = min(max_distance, (len(query_trigrams) - 1) // 3)
+        if len(query) < FUZZY_MIN_LENGTH or max_distance < 1:
+            return []
+
+        counts = {}
+        for trigram in query_trigrams:
+            for key_index in self.postings.get(trigram, ()):
+                counts[key_index] = counts.get(key_index, 0) + 1
+
+        min_common = len(query_trigrams) - 3 * max_distance
+        results = []
+        for key_index, common in counts.items():
+            if common < min_common:
+                continue
+            key = self.keys[key_index]
+            distance = bounded_edit_distance(query, key, max_distance)
+            if distance is not None:
+                confidence = 1.0 - distance / max(len(query), len(key))
+                results.append((key, distance, confidence))
+
+        results.sort(key=lambda r: (r[1], -r[2], r[0]))
+        return results
+
+
+class SymptomExtractor:
+    """Find known symptom phrases in free text
+
+    Every surface form of a symptom (its name, its 'aliases' and the name
+    without a parenthesized qualifier) is split into normalized word tokens
+    and inserted into a token trie keyed on the diacritic-folded tokens, so
+    "dau hong" finds "Đau họng". A hit is kept only if the typed diacritics
+    are compatible with the surface form. Extraction walks the trie from every
+    token of the input, so the cost depends on the input length and the
+    longest phrase, not on the size of the vocabulary.
+    """
+
+    def __init__(self, symptoms: Iterable[Dict]):
+        """Compile symptom records (dicts with 'id', 'name', optional 'aliases')"""
+        self.entries = []
+        self.phrase_index = {}
+        self._trie = {}
+        self._fuzzy_index = None
+        self.max_phrase_tokens = 0
+
+        symptoms = list(symptoms)
+        for symptom in symptoms:
+            self._add_explicit_forms(symptom)
+        # Derived forms never override a name or alias of another symptom
+        for symptom in symptoms:
+            self._add_derived_forms(symptom)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def add_symptom(self, symptom: Dict) -> None:
+        """Index all surface forms of one symptom"""
+        self._add_explicit_forms(symptom)
+        self._add_derived_forms(symptom)
+
+    def _add_explicit_forms(self, symptom: Dict) -> None:
+        self.add_phrase(symptom['name'], symptom)
+        for alias in symptom.get('aliases', []):
+            self.add_phrase(alias, symptom)
+
+    def _add_derived_forms(self, symptom: Dict) -> None:
+        short_name = _QUALIFIER_PATTERN.sub('', symptom['name']).strip()
+        if short_name and short_name != symptom['name']:
+            self.add_phrase(short_name, symptom, derived=True)
+
+    def add_phrase(self, phrase: str, symptom: Dict, derived: bool = False) -> None:
+        """Index one surface phrase for a symptom"""
+        tokens = tuple(token for token, _, _ in tokenize(phrase))
+        if not tokens:
+            return
+
+        key = phrase_key(tokens)
+        existing = self.phrase_index.get(key, [])
+        if derived and existing:
+            return
+        for entry_index in existing:
+            entry = self.entries[entry_index]
+            if entry['tokens'] == tokens and entry['name'] == symptom['name']:
+                return
+
+        node = self._trie
+        for token in tokens:
+            node = node.setdefault(fold_diacritics(token), {})
+        node.setdefault(_END, []).append(len(self.entries))
+        self.phrase_index.setdefault(key, []).append(len(self.entries))
+        self._fuzzy_index = None
+
+        self.entries.append({
+            'symptom_id': symptom.get('id'),
+            'name': symptom['name'],
+            'phrase': phrase,
+            'tokens': tokens
+        })
+        self.max_phrase_tokens = max(self.max_phrase_tokens, len(tokens))
+
+    def lookup(self, phrase: str) -> List[Dict]:
+        """Find the entries whose surface form is exactly phrase (O(1) hash lookup)"""
+        tokens = tuple(token for token, _, _ in tokenize(phrase))
+        return [
+            self.entries[entry_index]
+            for entry_index in self.phrase_index.get(phrase_key(tokens), ())
+            if self._compatible(tokens, self.entries[entry_index]['tokens'])
+        ]
+
+    def get_fuzzy_index(self) -> FuzzyPhraseIndex:
+        """Get the trigram index over all phrase keys, built on first use"""
+        if self._fuzzy_index is None:
+            self._fuzzy_index = FuzzyPhraseIndex(self.phrase_index.keys())
+        return self._fuzzy_index
+
+    def fuzzy_lookup(self,
+                     phrase: str,
+                     max_distance: int = FUZZY_MAX_EDIT_DISTANCE,
+                     min_confidence: float = FUZZY_MIN_CONFIDENCE) -> List[Dict]:
+        """Find entries whose surface form is close to phrase, best first
+
+        Each result is an entry dict with 'distance' and 'confidence' added.
+        """
+        typed = tuple(token for token, _, _ in tokenize(phrase))
+        results = []
+        for match_key, distance, _ in self.get_fuzzy_index().search(phrase_key(typed), max_distance):
+            for entry_index in self.phrase_index[match_key]:
+                entry = self.entries[entry_index]
+                confidence = self._fuzzy_confidence(typed, entry, distance)
+                if confidence is not None and confidence >= min_confidence:
+                    results.append(dict(entry, distance=distance, confidence=confidence))
+        return results
+
+    def extract(self,
+                text: str,
+                fuzzy: bool = False,
+                min_confidence: float = FUZZY_MIN_CONFIDENCE) -> List[Dict]:
+        """Find every indexed phrase in text
+
+        Returns one dict per symptom ('symptom_id', 'name', 'phrase', 'start',
+        'end', 'confidence') in order of first mention. Offsets refer to the
+        NFC form of text. With fuzzy=True, word windows not covered by an
+        exact match are also looked up in the trigram index to catch typos.
+        """
+        if not text or not self.entries:
+            return []
+
+        tokens = tokenize(text)
+        folded = [fold_diacritics(token) for token, _, _ in tokens]
+        found = {}
+        covered = set()
+        for start_index in range(len(tokens)):
+            node = self._trie
+            stop_index = min(len(tokens), start_index + self.max_phrase_tokens)
+            for end_index in range(start_index, stop_index):
+                node = node.get(folded[end_index])
+                if node is None:
+                    break
+                if _END not in node:
+                    continue
+
+                typed = tuple(token for token, _, _ in tokens[start_index:end_index + 1])
+                for entry_index in node[_END]:
+                    entry = self.entries[entry_index]
+                    if not self._compatible(typed, entry['tokens']):
+                        continue
+                    covered.update(range(start_index, end_index + 1))
+                    key = entry['symptom_id'] or entry['name']
+                    if key not in found:
+                        found[key] = self._match(entry, tokens, start_index, end_index, 1.0)
+
+        if fuzzy:
+            self._extract_fuzzy(tokens, covered, found, min_confidence)
+
+        return sorted(found.values(), key=lambda m: m['start'])
+
+    def _extract_fuzzy(self,
+                       tokens: List[Tuple[str, int, int]],
+                       covered: set,
+                       found: Dict,
+                       min_confidence: float) -> None:
+        """Match uncovered word windows against the trigram index, longest first"""
+        index = self.get_fuzzy_index()
+        for length in range(self.max_phrase_tokens, 0, -1):
+            for start_index in range(len(tokens) - length + 1):
+                window = range(start_index, start_index + length)
+                if covered.intersection(window):
+                    continue
+
+                typed = tuple(tokens[i][0] for i in window)
+                for match_key, distance, _ in index.search(phrase_key(typed)):
+                    entry, confidence = None, None
+                    for entry_index in self.phrase_index[match_key]:
+                        entry = self.entries[entry_index]
+                        confidence = self._fuzzy_confidence(typed, entry, distance)
+                        if confidence is not None and confidence >= min_confidence:
+                            break
+                    if confidence is None or confidence < min_confidence:
+                        continue
+                    key = entry['symptom_id'] or entry['name']
+                    if key not in found:
+                        found[key] = self._match(entry, tokens, start_index, window[-1], confidence)
+                    covered.update(window)
+                    break
+
+    @staticmethod
+    def _match(entry: Dict, tokens: List, start_index: int, end_index: int, confidence: float) -> Dict:
+        return {
+            'symptom_id': entry['symptom_id'],
+            'name': entry['name'],
+            'phrase': entry['phrase'],
+            'start': tokens[start_index][1],
+            'end': tokens[end_index][2],
+            'confidence': confidence
+        }
+
+    def extract_names(self, text: str, fuzzy: bool = False) -> List[str]:
+        """Find symptom names mentioned in text"""
+        return [match['name'] for match in self.extract(text, fuzzy=fuzzy)]
+
+    def _fuzzy_confidence(self, typed: Tuple[str, ...], entry: Dict, distance: int) -> Optional[float]:
+        """Confidence of a fuzzy hit measured on the typed text, None if rejected
+
+        A folded-equal hit with conflicting diacritics ('phòng ngừa' against
+        'Ngứa') is rejected like on the exact path, and any other diacritic
+        change lowers the confidence, so only a compatible hit scores 1.0.
+        """
+        if distance == 0 and not self._compatible(typed, entry['tokens']):
+            return None
+        typed_text = ' '.join(typed)
+        expected_text = ' '.join(entry['tokens'])
+        return 1.0 - surface_distance(typed_text, expected_text) / max(len(typed_text), len(expected_text))
+
+    @staticmethod
+    def _compatible(typed: Tuple[str, ...], expected: Tuple[str, ...]) -> bool:
+        return all(diacritics_compatible(t, e) for t, e in zip(typed, expected))
+
+
+@lru_cache(maxsize=8)
+def compile_symptom_names(names: Tuple[str, ...]) -> SymptomExtractor:
+    """Build (and cache) an extractor for a plain list of symptom names"""
+    return SymptomExtractor({'id': None, 'name': name} for name in names)
+
+
+# Export
+__all__ = [
+    'SymptomExtractor',
+    'FuzzyPhraseIndex',
+    'bounded_edit_distance',
+    'surface_distance',
+    'compile_symptom_names',
+    'phrase_key'
+]
@@ -0,0 +1,129 @@
+"""
+Emergency Triage for AI Medical Diagnosis System
+Single tiered keyword engine shared by the AI handler and the LLM handler
+"""
+import bisect
+import unicodedata
+from typing import List, Dict, Optional
+
+from config import TRIAGE_LEVELS, EMERGENCY_LEVELS, EMERGENCY_KEYWORD_TIERS
+from keyword_matcher import KeywordMatcher
+
+
+class TriageEngine:
+    """Score messages against tiered emergency keywords"""
+
+    def __init__(self, keyword_tiers: Dict[str, List[str]] = EMERGENCY_KEYWORD_TIERS):
+        """Compile all tiers into a single matcher"""
+        self.keyword_tiers = keyword_tiers
+        self._tier_of = {}
+        for level in TRIAGE_LEVELS:
+            for keyword in keyword_tiers.get(level, []):
+                # A keyword listed in several tiers keeps the most severe one
+                self._tier_of.setdefault(keyword, level)
+        self.matcher = KeywordMatcher(self._tier_of.keys())
+
+    def triage(self, text: str) -> Dict:
+        """Triage a single message"""
+        return self._build_result(self.matcher.find_all(text))
+
+    def triage_batch(self, texts: List[str]) -> List[Dict]:
+        """Triage many messages in one pass of the automaton
+
+        Offsets in each result refer to the NFC form of the matching text.
+        """
+        normalized = [unicodedata.normalize('NFC', text or '') for text in texts]
+        starts = []
+        offset = 0
+        for text in normalized:
+            starts.append(offset)
+            offset += len(text) + 1
+
+        # Newline separators are word boundaries, so no hit can span two texts
+        per_text = [[] for _ in normalized]
+        for match in self.matcher.find_all('\n'.join(normalized)):
+            index = bisect.bisect_right(starts, match['start']) - 1
+            per_text[index].append({
+                'keyword': match['keyword'],
+                'start': match['start'] - starts[index],
+                'end': match['end'] - starts[index]
+            })
+
+        return [self._build_result(matches) for matches in per_text]
+
+    def triage_symptoms(self, symptoms: List[str]) -> Dict:
+        """Triage a list of symptoms as one case, keeping symptoms separate"""
+        matches = []
+        for index, result in enumerate(self.triage_batch(symptoms)):
+            for match in result['matches']:
+                matches.append(dict(match, source=index))
+        return self._build_result(matches)
+
+    def triage_matches(self, matches: List[Dict]) -> Dict:
+        """Summarize precomputed keyword matches (e.g. cached per symptom) as one case"""
+        return self._build_result(matches)
+
+    def _build_result(self, matches: List[Dict]) -> Dict:
+        """Attach tiers to raw matches and summarize the most severe level"""
+        level = None
+        for match in matches:
+            match['tier'] = self._tier_of[match['keyword']]
+            if level is None or TRIAGE_LEVELS.index(match['tier']) < TRIAGE_LEVELS.index(level):
+                level = match['tier']
+
+        return {
+            'level': level,
+            'is_emergency': level in EMERGENCY_LEVELS,
+            'keywords': list(dict.fromkeys(m['keyword'] for m in matches)),
+            'matches': matches
+        }
+
+
+def format_emergency_warning(result: Dict) -> Optional[str]:
+    """Format an emergency warning for a triage result, None if not an emergency"""
+    if not result or not result.get('is_emergency'):
+        return None
+
+    keywords = [
+        m['keyword'] for m in result['matches']
+        if m['tier'] in EMERGENCY_LEVELS
+    ]
+    keywords_text = ', '.join(f'"{k}"' for k in dict.fromkeys(keywords))
+    return f"""
+⚠️⚠️⚠️ **CẢNH BÁO KHẨN CẤP** ⚠️⚠️⚠️
+
+Bạn đã đề cập đến triệu chứng **{keywords_text}** - đây có thể là dấu hiệu nghiêm trọng!
+
+🚨 **HÀNH ĐỘNG NGAY LẬP TỨC:**
+1. **Gọi cấp cứu 115** hoặc
+2. **Đến bệnh viện gần nhất** ngay
+3. **KHÔNG tự điều trị** tại nhà
+
+Đây là tình huống khẩn cấp cần được xử lý bởi chuyên gia y tế ngay lập tức!
+
+⏰ **THỜI GIAN LÀ VÀNG** - Đừng chần chừ!
+"""
+
+
+# Default engine compiled once at import
+TRIAGE_ENGINE = TriageEngine()
+
+
+def triage(text: str) -> Dict:
+    """Triage a message with the default engine"""
+    return TRIAGE_ENGINE.triage(text)
+
+
+def triage_batch(texts: List[str]) -> List[Dict]:
+    """Triage many messages with the default engine"""
+    return TRIAGE_ENGINE.triage_batch(texts)
+
+
+# Export
+__all__ = [
+    'TriageEngine',
+    'TRIAGE_ENGINE',
+    'triage',
+    'triage_batch',
+    'format_emergency_warning'
+]
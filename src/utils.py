@@ -1,13 +1,20 @@
 """
 Utility functions for AI Medical Diagnosis System
 """
+import hashlib
 import logging
+import math
+import os
+import re
+import tempfile
+import unicodedata
+from collections.abc import Mapping, Sequence
 from datetime import datetime
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 import json
 
-from config import LOG_FORMAT, LOG_LEVEL, LOG_FILE
+from config import LOG_FORMAT, LOG_LEVEL, LOG_FILE, CHARS_PER_TOKEN
 
 
 def setup_logging(name: str = __name__) -> logging.Logger:
@@ -43,14 +50,42 @@ def load_json_file(file_path: Path) -> Dict:
 
 
 def save_json_file(data: Dict, file_path: Path) -> None:
-    """Save data to JSON file"""
+    """Save data to JSON file atomically (temp file, fsync, rename)
+    
+    mkstemp creates the temporary file with mode 0600, so it is given the
+    permissions of the file it replaces; a new file gets the read/write bits
+    of its directory, which were shaped by the same umask.
+    """
+    file_path = Path(file_path)
+    tmp_path = None
     try:
-        with open(file_path, 'w', encoding='utf-8') as f:
+        try:
+            mode = os.stat(file_path).st_mode & 0o7777
+        except FileNotFoundError:
+            mode = os.stat(file_path.parent).st_mode & 0o666
+        fd, tmp_path = tempfile.mkstemp(dir=file_path.parent, prefix=f".{file_path.name}.", suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
             json.dump(data, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, file_path)
     except Exception as e:
+        if tmp_path and os.path.exists(tmp_path):
+            os.unlink(tmp_path)
         raise IOError(f"Failed to save JSON to {file_path}: {e}")
 
 
+def file_fingerprint(file_path: Path) -> Tuple[int, int, str]:
+    """(mtime_ns, size, sha256 hex digest) of a file, to detect changes"""
+    stat = os.stat(file_path)
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return stat.st_mtime_ns, stat.st_size, digest.hexdigest()
+
+
 def format_timestamp(dt: datetime = None) -> str:
     """Format datetime to string"""
     if dt is None:
@@ -58,17 +93,80 @@ def format_timestamp(dt: datetime = None) -> str:
     return dt.strftime("%Y-%m-%d %H:%M:%S")
 
 
-def extract_symptoms_from_text(text: str, known_symptoms: List[str]) -> List[str]:
-    """Extract symptoms mentioned in text"""
-    text_lower = text.lower()
-    found_symptoms = []
+class _CharTable(dict):
+    """Lazily filled str.translate table mapping one character to one character"""
     
-    for symptom in known_symptoms:
-        symptom_lower = symptom.lower()
-        if symptom_lower in text_lower:
-            found_symptoms.append(symptom)
+    def __init__(self, fold: bool):
+        super().__init__()
+        self.fold = fold
     
-    return found_symptoms
+    def __missing__(self, codepoint: int) -> str:
+        char = chr(codepoint)
+        lowered = char.lower()
+        # Keep a 1:1 mapping so offsets stay valid across normalization
+        if len(lowered) != 1:
+            lowered = char
+        if self.fold:
+            if lowered == 'đ':
+                lowered = 'd'
+            else:
+                lowered = unicodedata.normalize('NFD', lowered)[0]
+        self[codepoint] = lowered
+        return lowered
+
+
+_LOWER_TABLE = _CharTable(fold=False)
+_FOLD_TABLE = _CharTable(fold=True)
+
+
+def normalize_text(text: str) -> str:
+    """NFC-normalize and lowercase text (one output char per NFC char)"""
+    return unicodedata.normalize('NFC', text).translate(_LOWER_TABLE)
+
+
+def fold_diacritics(text: str) -> str:
+    """Lowercase text and strip Vietnamese diacritics ('Khó thở' -> 'kho tho')
+
+    The result has the same length as the NFC form of the input, so offsets
+    found in folded text can be used on the normalized text directly.
+    """
+    return unicodedata.normalize('NFC', text).translate(_FOLD_TABLE)
+
+
+def diacritics_compatible(typed: str, expected: str) -> bool:
+    """Check that typed text only drops diacritics of expected, never changes them
+
+    Both strings must be normalized and fold to the same text. 'kho tho' and
+    'khó thở' are compatible; 'sóc' and 'sốc' are not.
+    """
+    folded = fold_diacritics(typed)
+    for char, plain, wanted in zip(typed, folded, expected):
+        if char != wanted and char != plain:
+            return False
+    return True
+
+
+_TOKEN_PATTERN = re.compile(r'\w+')
+
+
+def tokenize(text: str) -> List[Tuple[str, int, int]]:
+    """Split normalized text into (token, start, end) word tokens"""
+    return [(m.group(), m.start(), m.end()) for m in _TOKEN_PATTERN.finditer(normalize_text(text))]
+
+
+def extract_symptoms_from_text(text: str, known_symptoms: Any) -> List[str]:
+    """Extract symptoms mentioned in text
+    
+    known_symptoms is a KnowledgeManager, whose extractor is compiled once per
+    knowledge base version, or a list of symptom names. A list has to be
+    copied into a cache key on every call, so pass the manager when there
+    is one.
+    """
+    get_extractor = getattr(known_symptoms, 'get_symptom_extractor', None)
+    if get_extractor is not None:
+        return get_extractor().extract_names(text)
+    from symptom_extractor import compile_symptom_names
+    return compile_symptom_names(tuple(known_symptoms)).extract_names(text)
 
 
 def calculate_symptom_match_score(user_symptoms: List[str], 
@@ -90,24 +188,13 @@ def calculate_symptom_match_score(user_symptoms: List[str],
 def rank_diseases_by_symptoms(user_symptoms: List[str], 
                               diseases: List[Dict],
                               top_k: int = 5) -> List[Dict]:
-    """Rank diseases by symptom matching score"""
-    scored_diseases = []
-    
-    for disease in diseases:
-        disease_symptoms = disease.get('symptoms', [])
-        score = calculate_symptom_match_score(user_symptoms, disease_symptoms)
-        
-        if score > 0:
-            scored_diseases.append({
-                'disease': disease,
-                'score': score,
-                'matched_symptoms': list(set(user_symptoms) & set(disease_symptoms))
-            })
-    
-    # Sort by score descending
-    scored_diseases.sort(key=lambda x: x['score'], reverse=True)
+    """Rank diseases by symptom matching score
     
-    return scored_diseases[:top_k]
+    Builds a one-off DiseaseIndex; callers ranking repeatedly against the
+    same catalogue should use KnowledgeManager.rank_diseases instead.
+    """
+    from disease_index import DiseaseIndex
+    return DiseaseIndex(diseases).rank(user_symptoms, top_k)
 
 
 def format_disease_info(disease: Dict) -> str:
@@ -120,6 +207,11 @@ def format_disease_info(disease: Dict) -> str:
     return info
 
 
+def estimate_tokens(text: str) -> int:
+    """Estimate the number of LLM tokens in a text"""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
 def sanitize_user_input(text: str) -> str:
     """Sanitize user input"""
     # Remove excessive whitespace
@@ -129,31 +221,63 @@ def sanitize_user_input(text: str) -> str:
     return text.strip()
 
 
-def validate_symptoms_data(symptoms: List[Dict]) -> bool:
-    """Validate symptoms data structure"""
-    required_fields = ['id', 'name', 'category']
+def _field_problem(record: Mapping, field: str, kind: str) -> Optional[str]:
+    """Problem with one field of a record: kind is 'text' or 'text list'"""
+    value = record[field]
+    if kind == 'text':
+        if not isinstance(value, str):
+            return f"Field '{field}' must be a string"
+    elif (isinstance(value, str) or not isinstance(value, Sequence) or
+            not all(isinstance(item, str) for item in value)):
+        # Lists from JSON, tuples from loaded records
+        return f"Field '{field}' must be a list of strings"
+    return None
+
+
+def _record_problem(record: Dict, required: Dict[str, str], optional: Dict[str, str]) -> Optional[str]:
+    """First problem with a record's required and optional (None allowed) fields"""
+    if not isinstance(record, Mapping):
+        return "Record must be an object"
     
-    for symptom in symptoms:
-        for field in required_fields:
-            if field not in symptom:
-                return False
+    for field in required:
+        if field not in record:
+            return f"Missing required field: {field}"
     
-    return True
+    for field, kind in list(required.items()) + list(optional.items()):
+        if field in required or record.get(field) is not None:
+            problem = _field_problem(record, field, kind)
+            if problem:
+                return problem
+    
+    return None
+
+
+def validate_symptom_record(symptom: Dict) -> Optional[str]:
+    """Get the first problem with a symptom record, None if it is valid"""
+    return _record_problem(
+        symptom,
+        required={'id': 'text', 'name': 'text', 'category': 'text'},
+        optional={'aliases': 'text list'}
+    )
+
+
+def validate_disease_record(disease: Dict) -> Optional[str]:
+    """Get the first problem with a disease record, None if it is valid"""
+    return _record_problem(
+        disease,
+        required={'id': 'text', 'name': 'text', 'symptoms': 'text list'},
+        optional={'description': 'text', 'treatment': 'text', 'severity': 'text'}
+    )
+
+
+def validate_symptoms_data(symptoms: List[Dict]) -> bool:
+    """Validate symptoms data structure"""
+    return all(validate_symptom_record(symptom) is None for symptom in symptoms)
 
 
 def validate_diseases_data(diseases: List[Dict]) -> bool:
     """Validate diseases data structure"""
-    required_fields = ['id', 'name', 'symptoms']
-    
-    for disease in diseases:
-        for field in required_fields:
-            if field not in disease:
-                return False
-        
-        if not isinstance(disease['symptoms'], list):
-            return False
-    
-    return True
+    return all(validate_disease_record(disease) is None for disease in diseases)
 
 
 class SessionManager:
@@ -201,12 +325,20 @@ __all__ = [
     'setup_logging',
     'load_json_file',
     'save_json_file',
+    'file_fingerprint',
     'format_timestamp',
+    'normalize_text',
+    'fold_diacritics',
+    'diacritics_compatible',
+    'tokenize',
     'extract_symptoms_from_text',
     'calculate_symptom_match_score',
     'rank_diseases_by_symptoms',
     'format_disease_info',
+    'estimate_tokens',
     'sanitize_user_input',
+    'validate_symptom_record',
+    'validate_disease_record',
     'validate_symptoms_data',
     'validate_diseases_data',
     'SessionManager'
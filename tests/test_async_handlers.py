@@ -0,0 +1,185 @@
+"""
+Test Async Handlers
+Kiểm tra các phiên bản async của handler, DiagnosisEngine và bộ giới hạn yêu cầu
+"""
+import asyncio
+import pytest
+import sys
+import threading
+from pathlib import Path
+from unittest.mock import AsyncMock, MagicMock, patch
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from request_limiter import RequestLimiter
+from response_cache import ResponseCache
+
+
+class TestRequestLimiter:
+    """Test giới hạn số yêu cầu đồng thời"""
+
+    def test_bounds_concurrency(self):
+        """Test không quá limit yêu cầu chạy cùng lúc"""
+        limiter = RequestLimiter(limit=3)
+        active, peak = 0, 0
+
+        async def request():
+            nonlocal active, peak
+            async with limiter:
+                active += 1
+                peak = max(peak, active)
+                await asyncio.sleep(0.001)
+                active -= 1
+
+        async def main():
+            await asyncio.gather(*(request() for _ in range(20)))
+
+        asyncio.run(main())
+        assert peak == 3
+
+    def test_usable_across_event_loops(self):
+        """Test dùng lại được trên nhiều event loop"""
+        limiter = RequestLimiter(limit=1)
+
+        async def request():
+            async with limiter:
+                return 'ok'
+
+        assert asyncio.run(request()) == 'ok'
+        assert asyncio.run(request()) == 'ok'
+
+    def test_invalid_limit(self):
+        """Test giới hạn không hợp lệ"""
+        with pytest.raises(ValueError):
+            RequestLimiter(limit=0)
+
+
+@pytest.fixture
+def patched_genai():
+    with patch('google.generativeai.configure'), \
+         patch('google.generativeai.GenerativeModel') as model_class, \
+         patch.dict('os.environ', {'GEMINI_API_KEY': 'test-api-key'}):
+        model_class.return_value = MagicMock()
+        yield model_class.return_value
+
+
+class TestAsyncMedicalAIHandler:
+    """Test AsyncMedicalAIHandler dùng lời gọi async của SDK"""
+
+    def test_diagnose(self, patched_genai):
+        """Test chẩn đoán qua send_message_async"""
+        from medical_ai_handler import AsyncMedicalAIHandler
+        session = patched_genai.start_chat.return_value
+        session.send_message_async = AsyncMock(return_value=MagicMock(text='Có thể là cảm lạnh'))
+        handler = AsyncMedicalAIHandler()
+
+        assert asyncio.run(handler.diagnose('Tôi bị sổ mũi')) == 'Có thể là cảm lạnh'
+        session.send_message_async.assert_awaited_once_with('Tôi bị sổ mũi')
+        session.send_message.assert_not_called()
+
+    def test_emergency_and_errors(self, patched_genai):
+        """Test cảnh báo khẩn cấp không gọi AI, lỗi API trả về thông báo lỗi"""
+        from medical_ai_handler import AsyncMedicalAIHandler
+        session = patched_genai.start_chat.return_value
+        session.send_message_async = AsyncMock(side_effect=Exception('API Error'))
+        handler = AsyncMedicalAIHandler()
+
+        assert 'CẢNH BÁO' in asyncio.run(handler.diagnose('Tôi bị đau ngực dữ dội')).upper()
+        session.send_message_async.assert_not_called()
+        assert 'Lỗi' in asyncio.run(handler.diagnose('Tôi bị sốt'))
+
+
+class TestAsyncLLMHandler:
+    """Test các phương thức *_async của MedicalLLMHandler"""
+
+    def test_generate_methods(self, patched_genai):
+        """Test generate_*_async dùng generate_content_async"""
+        from medical_llm_handler import MedicalLLMHandler
+        patched_genai.generate_content_async = AsyncMock(return_value=MagicMock(text='{"severity_level": "mild"}'))
+        handler = MedicalLLMHandler(response_cache=None)
+
+        async def main():
+            return await asyncio.gather(
+                handler.assess_severity_async(['Ho']),
+                handler.generate_treatment_recommendations_async('Cúm', ['Ho']),
+                handler.generate_diagnosis_async('Tôi bị ho', 'ctx')
+            )
+
+        severity, treatment, diagnosis = asyncio.run(main())
+        assert severity == {'severity_level': 'mild'}
+        assert treatment == diagnosis == '{"severity_level": "mild"}'
+        assert patched_genai.generate_content_async.await_count == 3
+        patched_genai.generate_content.assert_not_called()
+
+    def test_shares_response_cache(self, patched_genai):
+        """Test bộ đệm phản hồi dùng chung giữa bản sync và async"""
+        from medical_llm_handler import MedicalLLMHandler
+        patched_genai.generate_content.return_value = MagicMock(text='Nghỉ ngơi')
+        patched_genai.generate_content_async = AsyncMock()
+        handler = MedicalLLMHandler(response_cache=ResponseCache(path=None))
+
+        assert handler.generate_treatment_recommendations('Cúm', ['Ho']) == 'Nghỉ ngơi'
+        assert asyncio.run(handler.generate_treatment_recommendations_async('Cúm', ['Ho'])) == 'Nghỉ ngơi'
+        patched_genai.generate_content_async.assert_not_called()
+
+    def test_cache_io_off_event_loop(self, patched_genai):
+        """Test đọc và ghi bộ đệm phản hồi không chặn vòng lặp sự kiện"""
+        from medical_llm_handler import MedicalLLMHandler
+        patched_genai.generate_content_async = AsyncMock(return_value=MagicMock(text='Nghỉ ngơi'))
+        cache = MagicMock()
+        threads = []
+        cache.get.side_effect = lambda key: threads.append(threading.get_ident())
+        cache.put.side_effect = lambda key, text: threads.append(threading.get_ident())
+        handler = MedicalLLMHandler(response_cache=cache)
+
+        async def main():
+            await handler.generate_treatment_recommendations_async('Cúm', ['Ho'])
+            return threading.get_ident()
+
+        loop_thread = asyncio.run(main())
+        assert len(threads) == 2
+        assert loop_thread not in threads
+
+
+class TestAsyncDiagnosisEngine:
+    """Test DiagnosisEngine.generate_diagnosis_report_async"""
+
+    def test_report_requests_run_concurrently(self):
+        """Test đánh giá mức độ và khuyến nghị điều trị chạy đồng thời"""
+        from diagnosis_engine import DiagnosisEngine
+        treatment_started = None
+
+        async def assess_severity_async(symptoms, knowledge_version=None, raise_errors=False, request_timeout=None):
+            # Only finishes if the treatment request is already in flight
+            await asyncio.wait_for(treatment_started.wait(), timeout=1)
+            return {'severity_level': 'mild'}
+
+        async def generate_treatment_recommendations_async(diagnosis, symptoms, knowledge_version=None, raise_errors=False, request_timeout=None):
+            treatment_started.set()
+            return f'Điều trị {diagnosis}'
+
+        llm_handler = MagicMock()
+        llm_handler.assess_severity_async = assess_severity_async
+        llm_handler.generate_treatment_recommendations_async = generate_treatment_recommendations_async
+        engine = DiagnosisEngine(MagicMock(), llm_handler)
+        analysis_result = {
+            'symptoms': ['Ho'],
+            'matched_diseases': [{'disease': {'name': 'Cúm'}}],
+            'top_confidence': 0.8
+        }
+
+        async def main():
+            nonlocal treatment_started
+            treatment_started = asyncio.Event()
+            return await engine.generate_diagnosis_report_async('Tôi bị ho', analysis_result, 'Chẩn đoán')
+
+        report = asyncio.run(main())
+        assert report['severity'] == {'severity_level': 'mild'}
+        assert report['treatment_recommendations'] == 'Điều trị Cúm'
+        assert report['top_diagnosis'] == 'Cúm'
+        assert report['matched_diseases'] == ['Cúm']
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
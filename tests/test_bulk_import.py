@@ -0,0 +1,145 @@
+"""
+Test Bulk Import
+Kiểm tra nhập hàng loạt bệnh và triệu chứng từ JSONL/CSV
+"""
+import json
+import pytest
+import shutil
+import sys
+from pathlib import Path
+from unittest.mock import patch
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from bulk_import import BulkImporter, main, read_records
+from config import KNOWLEDGE_BASE_PATH
+from knowledge_manager import KnowledgeManager
+
+
+@pytest.fixture
+def kb_path(tmp_path):
+    """Copy of the knowledge base"""
+    path = tmp_path / 'knowledge_base.json'
+    shutil.copy(KNOWLEDGE_BASE_PATH, path)
+    return path
+
+
+def write_jsonl(path, records):
+    with open(path, 'w', encoding='utf-8') as f:
+        for record in records:
+            f.write((record if isinstance(record, str) else json.dumps(record, ensure_ascii=False)) + '\n')
+    return path
+
+
+class TestReaders:
+    """Test đọc bản ghi dạng luồng"""
+
+    def test_csv_lists_and_empty_cells(self, tmp_path):
+        """Test tách cột danh sách và bỏ ô trống trong CSV"""
+        path = tmp_path / 'symptoms.csv'
+        path.write_text(
+            "id,name,category,aliases\n"
+            "hiccups,Nấc cụt,digestive,nấc; nấc cục\n"
+            "tinnitus,Ù tai,sensory,\n",
+            encoding='utf-8'
+        )
+        rows = list(read_records(path))
+        assert rows[0] == (2, {'id': 'hiccups', 'name': 'Nấc cụt', 'category': 'digestive',
+                               'aliases': ['nấc', 'nấc cục']}, None)
+        assert 'aliases' not in rows[1][1]
+
+    def test_jsonl_parse_errors(self, tmp_path):
+        """Test dòng JSON lỗi được báo lại thay vì dừng nhập"""
+        path = write_jsonl(tmp_path / 'd.jsonl', [{'id': 'a'}, '{broken', ''])
+        rows = list(read_records(path))
+        assert len(rows) == 2
+        assert rows[1][1] is None and rows[1][2].startswith("Invalid JSON")
+
+
+class TestBulkImporter:
+    """Test nhập hàng loạt vào KnowledgeManager"""
+
+    def test_import_with_rejects(self, kb_path, tmp_path):
+        """Test nhập hợp lệ, loại bản ghi lỗi và trùng"""
+        km = KnowledgeManager(kb_path)
+        path = write_jsonl(tmp_path / 'd.jsonl', [
+            {'id': 'd1', 'name': 'Bệnh 1', 'symptoms': ['fever']},
+            {'id': 'd2', 'name': 'Bệnh 2'},
+            {'id': 'd1', 'name': 'Bệnh 1 lặp', 'symptoms': []},
+            {'id': 'flu', 'name': 'Cúm', 'symptoms': ['fever']},
+            {'id': 'd3', 'name': 'Bệnh 3', 'symptoms': 'fever'},
+            '[1, 2]'
+        ])
+        summary = BulkImporter(km, 'diseases').import_file(path)
+        assert summary['read'] == 6
+        assert summary['imported'] == 1
+        assert [r['line'] for r in summary['rejects']] == [2, 3, 4, 5, 6]
+        assert summary['rejects'][0]['reason'] == "Missing required field: symptoms"
+        assert km.get_disease_by_id('d1')['name'] == 'Bệnh 1'
+
+    def test_wrongly_typed_records_rejected(self, kb_path, tmp_path):
+        """Test bản ghi sai kiểu bị loại trước khi ghi nhật ký, cơ sở tri thức vẫn tải lại được"""
+        km = KnowledgeManager(kb_path)
+        assert not km.add_disease({'id': 123, 'name': 'Bệnh số', 'symptoms': ['fever']})
+        assert not km.add_disease({'id': 'd1', 'name': 'Bệnh 1', 'symptoms': [1, 2]})
+        assert not km.add_disease({'id': 'd2', 'name': 'Bệnh 2', 'symptoms': ['fever'], 'treatment': 5})
+        assert not km.add_symptom({'id': 's1', 'name': 'Triệu chứng 1', 'category': None})
+        assert not km.add_symptom({'id': 's2', 'name': 'Triệu chứng 2', 'category': 'other', 'aliases': [1]})
+
+        path = write_jsonl(tmp_path / 'd.jsonl', [
+            {'id': 123, 'name': 'Bệnh số', 'symptoms': ['fever']},
+            {'id': 'd3', 'name': ['Bệnh 3'], 'symptoms': ['fever']},
+            {'id': 'd4', 'name': 'Bệnh 4', 'symptoms': ['fever', None]},
+            {'id': 'd5', 'name': 'Bệnh 5', 'symptoms': ['fever']}
+        ])
+        summary = BulkImporter(km, 'diseases').import_file(path)
+        assert summary['imported'] == 1
+        assert [r['reason'] for r in summary['rejects']] == [
+            "Field 'id' must be a string",
+            "Field 'name' must be a string",
+            "Field 'symptoms' must be a list of strings"
+        ]
+        assert len(km.journal) == 1
+        km.journal.close()
+
+        reloaded = KnowledgeManager(kb_path)
+        assert reloaded.get_disease_by_id('d5')['name'] == 'Bệnh 5'
+        assert reloaded.get_statistics()['total_diseases'] == 26
+
+    def test_one_commit_per_batch(self, kb_path):
+        """Test mỗi lô chỉ ghi nhật ký và tăng phiên bản một lần"""
+        km = KnowledgeManager(kb_path)
+        version = km.version
+        rows = [(i, {'id': f's{i}', 'name': f'Triệu chứng {i}', 'category': 'other'}, None) for i in range(25)]
+        with patch.object(km.journal, 'append_many', wraps=km.journal.append_many) as append_many:
+            summary = BulkImporter(km, 'symptoms', batch_size=10).import_records(rows)
+        assert summary['batches'] == 3
+        assert append_many.call_count == 3
+        assert km.version == version + 3
+        assert km.get_statistics()['total_symptoms'] == 70 + 25
+
+    def test_unknown_kind(self, kb_path):
+        """Test loại bản ghi không hỗ trợ"""
+        with pytest.raises(ValueError):
+            BulkImporter(KnowledgeManager(kb_path), 'drugs')
+
+    def test_cli(self, kb_path, tmp_path, capsys):
+        """Test dòng lệnh nhập, ghi tệp loại bỏ và nén nhật ký"""
+        path = write_jsonl(tmp_path / 'd.jsonl', [
+            {'id': f'icd_{i}', 'name': f'Bệnh {i}', 'symptoms': ['fever']} for i in range(30)
+        ] + [{'id': 'bad'}])
+        rejects = tmp_path / 'rejects.jsonl'
+        code = main(['diseases', str(path), '--knowledge-base', str(kb_path),
+                     '--batch-size', '8', '--rejects', str(rejects)])
+        assert code == 1
+        assert "30 imported, 1 rejected" in capsys.readouterr().out
+        assert json.loads(rejects.read_text(encoding='utf-8'))['id'] == 'bad'
+
+        data = json.loads(kb_path.read_text(encoding='utf-8'))
+        assert len(data['diseases']) == 25 + 30
+        assert len(KnowledgeManager(kb_path).journal) == 0
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,165 @@
+"""
+Test Diagnosis Report
+Kiểm tra báo cáo chẩn đoán: chạy song song, thời hạn từng bước và kết quả một phần
+"""
+import asyncio
+import pytest
+import sys
+import threading
+import time
+from pathlib import Path
+from unittest.mock import AsyncMock, MagicMock, patch
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from diagnosis_engine import DiagnosisEngine
+from medical_llm_handler import MedicalLLMHandler
+
+
+ANALYSIS_RESULT = {
+    'symptoms': ['Ho', 'Sốt'],
+    'matched_diseases': [{'disease': {'name': 'Cúm'}}],
+    'top_confidence': 0.8
+}
+
+
+@pytest.fixture
+def llm_handler():
+    handler = MagicMock()
+    handler.assess_severity.return_value = {'severity_level': 'mild'}
+    handler.generate_treatment_recommendations.return_value = 'Nghỉ ngơi'
+    return handler
+
+
+@pytest.fixture
+def patched_model():
+    with patch('google.generativeai.configure'), \
+         patch('google.generativeai.GenerativeModel') as model_class, \
+         patch.dict('os.environ', {'GEMINI_API_KEY': 'test-api-key'}):
+        model_class.return_value = MagicMock()
+        yield model_class.return_value
+
+
+class TestConcurrentReport:
+    """Test generate_diagnosis_report chạy các yêu cầu LLM song song"""
+
+    def test_stages_run_concurrently(self, llm_handler):
+        """Test đánh giá mức độ chỉ xong khi khuyến nghị đã bắt đầu"""
+        treatment_started = threading.Event()
+
+        def assess_severity(symptoms, knowledge_version=None, raise_errors=False, request_timeout=None):
+            assert treatment_started.wait(timeout=1)
+            return {'severity_level': 'mild'}
+
+        def generate_treatment_recommendations(diagnosis, symptoms, knowledge_version=None, raise_errors=False, request_timeout=None):
+            treatment_started.set()
+            return f'Điều trị {diagnosis}'
+
+        llm_handler.assess_severity.side_effect = assess_severity
+        llm_handler.generate_treatment_recommendations.side_effect = generate_treatment_recommendations
+        engine = DiagnosisEngine(MagicMock(), llm_handler)
+
+        report = engine.generate_diagnosis_report('Tôi bị ho', ANALYSIS_RESULT, 'Chẩn đoán')
+
+        assert report['severity'] == {'severity_level': 'mild'}
+        assert report['treatment_recommendations'] == 'Điều trị Cúm'
+        assert report['incomplete_stages'] == []
+        assert set(report['timings']) == {'severity', 'treatment', 'total'}
+
+    def test_latency_is_max_not_sum(self, llm_handler):
+        """Test thời gian báo cáo gần bằng bước chậm nhất"""
+        llm_handler.assess_severity.side_effect = lambda *a, **k: time.sleep(0.2) or {}
+        llm_handler.generate_treatment_recommendations.side_effect = lambda *a, **k: time.sleep(0.2) or ''
+        engine = DiagnosisEngine(MagicMock(), llm_handler)
+
+        report = engine.generate_diagnosis_report('Tôi bị ho', ANALYSIS_RESULT, 'Chẩn đoán')
+
+        assert report['timings']['severity'] >= 0.2
+        assert report['timings']['total'] < 0.35
+
+    def test_timeout_gives_partial_report(self, llm_handler):
+        """Test bước quá hạn bị bỏ qua, các bước khác vẫn có trong báo cáo"""
+        release = threading.Event()
+        llm_handler.assess_severity.side_effect = lambda *a, **k: release.wait(1) and {}
+        engine = DiagnosisEngine(MagicMock(), llm_handler)
+
+        report = engine.generate_diagnosis_report('Tôi bị ho', ANALYSIS_RESULT, 'Chẩn đoán', timeout=0.05)
+        release.set()
+
+        assert report['incomplete_stages'] == ['severity']
+        assert report['severity']['severity_level'] == 'unknown'
+        assert report['treatment_recommendations'] == 'Nghỉ ngơi'
+        assert report['timings']['total'] < 0.5
+
+    def test_failed_stage_gives_partial_report(self, patched_model):
+        """Test lỗi của mô hình được ghi vào incomplete_stages, các bước khác vẫn có"""
+        def generate_content(prompt, request_options=None):
+            assert request_options == {'timeout': 30.0}
+            if 'khuyến nghị điều trị' in prompt:
+                raise RuntimeError('network')
+            return MagicMock(text='{"severity_level": "mild"}')
+
+        patched_model.generate_content.side_effect = generate_content
+        engine = DiagnosisEngine(MagicMock(), MedicalLLMHandler(response_cache=None))
+
+        report = engine.generate_diagnosis_report('Tôi bị ho', ANALYSIS_RESULT, 'Chẩn đoán')
+
+        assert report['incomplete_stages'] == ['treatment']
+        assert report['treatment_recommendations'] == ''
+        assert report['severity'] == {'severity_level': 'mild'}
+        assert report['top_diagnosis'] == 'Cúm'
+        # Outside reports the placeholders are kept
+        assert engine.get_treatment_recommendations('Cúm', ['Ho']) == ''
+
+    def test_async_failed_stage_gives_partial_report(self, patched_model):
+        """Test bản async: lỗi của mô hình được ghi vào incomplete_stages"""
+        patched_model.generate_content_async = AsyncMock(side_effect=RuntimeError('network'))
+        engine = DiagnosisEngine(MagicMock(), MedicalLLMHandler(response_cache=None))
+
+        report = asyncio.run(engine.generate_diagnosis_report_async('Tôi bị ho', ANALYSIS_RESULT, 'Chẩn đoán'))
+
+        assert report['incomplete_stages'] == ['severity', 'treatment']
+        assert report['severity']['severity_level'] == 'unknown'
+        assert asyncio.run(engine.assess_severity_async(['Ho']))['explanation'] == 'network'
+
+    def test_async_timeout_gives_partial_report(self, llm_handler):
+        """Test bản async: bước quá hạn bị hủy, bước còn lại vẫn có"""
+        async def assess_severity_async(symptoms, knowledge_version=None, raise_errors=False, request_timeout=None):
+            await asyncio.sleep(1)
+
+        async def generate_treatment_recommendations_async(diagnosis, symptoms, knowledge_version=None, raise_errors=False, request_timeout=None):
+            return 'Nghỉ ngơi'
+
+        llm_handler.assess_severity_async = assess_severity_async
+        llm_handler.generate_treatment_recommendations_async = generate_treatment_recommendations_async
+        engine = DiagnosisEngine(MagicMock(), llm_handler)
+
+        report = asyncio.run(
+            engine.generate_diagnosis_report_async('Tôi bị ho', ANALYSIS_RESULT, 'Chẩn đoán', timeout=0.05)
+        )
+
+        assert report['incomplete_stages'] == ['severity']
+        assert report['treatment_recommendations'] == 'Nghỉ ngơi'
+        assert report['timings']['total'] < 0.5
+
+    def test_stage_timings_measured_from_start(self, llm_handler):
+        """Test bước thành công và bước lỗi được đo thời gian như nhau"""
+        def generate_treatment_recommendations(*args, **kwargs):
+            time.sleep(0.1)
+            raise RuntimeError('network')
+
+        llm_handler.assess_severity.side_effect = lambda *a, **k: time.sleep(0.1) or {}
+        llm_handler.generate_treatment_recommendations.side_effect = generate_treatment_recommendations
+        engine = DiagnosisEngine(MagicMock(), llm_handler)
+
+        report = engine.generate_diagnosis_report('Tôi bị ho', ANALYSIS_RESULT, 'Chẩn đoán', timeout=5)
+
+        assert report['incomplete_stages'] == ['treatment']
+        assert 0.1 <= report['timings']['severity'] < 0.2
+        assert 0.1 <= report['timings']['treatment'] < 0.2
+        assert llm_handler.assess_severity.call_args.kwargs['request_timeout'] == 5
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,151 @@
+"""
+Test Disease Index
+Kiểm tra chỉ mục ngược triệu chứng → bệnh dùng để xếp hạng
+"""
+import pytest
+import random
+import shutil
+import sys
+from pathlib import Path
+from unittest.mock import MagicMock
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from config import KNOWLEDGE_BASE_PATH
+from disease_index import DiseaseIndex, RankingState
+from knowledge_manager import KnowledgeManager
+from utils import calculate_symptom_match_score, rank_diseases_by_symptoms
+
+
+@pytest.fixture
+def knowledge_manager(tmp_path):
+    """Knowledge manager on a copy of the knowledge base"""
+    kb_path = tmp_path / 'knowledge_base.json'
+    shutil.copy(KNOWLEDGE_BASE_PATH, kb_path)
+    return KnowledgeManager(kb_path)
+
+
+def brute_force_rank(user_symptoms, diseases, top_k):
+    """Reference ranking: score every disease, then sort"""
+    scored = []
+    for disease in diseases:
+        score = calculate_symptom_match_score(user_symptoms, disease['symptoms'])
+        if score > 0:
+            scored.append((disease['id'], score))
+    scored.sort(key=lambda x: x[1], reverse=True)
+    return scored[:top_k]
+
+
+class TestDiseaseIndex:
+    """Test xếp hạng bệnh qua chỉ mục"""
+
+    def test_rank_matches_brute_force(self, knowledge_manager):
+        """Test kết quả xếp hạng trùng với cách duyệt toàn bộ"""
+        diseases = knowledge_manager.get_all_diseases()
+        symptom_ids = [s['id'] for s in knowledge_manager.get_all_symptoms()]
+        rng = random.Random(42)
+        for _ in range(50):
+            user_symptoms = rng.sample(symptom_ids, rng.randint(1, 6))
+            ranked = knowledge_manager.rank_diseases(user_symptoms, top_k=5)
+            assert [(r['disease']['id'], r['score']) for r in ranked] == \
+                brute_force_rank(user_symptoms, diseases, 5)
+
+    def test_rank_only_candidates(self):
+        """Test chỉ trả về bệnh có triệu chứng trùng"""
+        index = DiseaseIndex([
+            {'id': 'a', 'name': 'A', 'symptoms': ['fever', 'cough']},
+            {'id': 'b', 'name': 'B', 'symptoms': ['rash']}
+        ])
+        ranked = index.rank(['cough', 'unknown'])
+        assert [r['disease']['id'] for r in ranked] == ['a']
+        assert ranked[0]['score'] == pytest.approx(1 / 3)
+        assert ranked[0]['matched_symptoms'] == ['cough']
+
+    def test_ties_in_catalogue_order(self):
+        """Test điểm bằng nhau thì bệnh đứng trước trong danh mục được xếp trước"""
+        index = DiseaseIndex([
+            {'id': 'd0', 'symptoms': ['x']},
+            {'id': 'd1', 'symptoms': ['y']},
+            {'id': 'd2', 'symptoms': ['x']}
+        ])
+        # Counts are first touched in the order d1, d0, d2
+        assert [r['disease']['id'] for r in index.rank(['y', 'x'], top_k=2)] == ['d0', 'd1']
+        assert [r['disease']['id'] for r in index.search(['y', 'x'], top_k=2)] == ['d0', 'd1']
+        assert [r['disease']['id'] for r in index.search(['y', 'x'])] == ['d0', 'd1', 'd2']
+        assert index.rank(['y', 'x'])[1]['matched_symptoms'] == ['y']
+
+    def test_search_order(self, knowledge_manager):
+        """Test tìm kiếm sắp theo tỉ lệ khớp rồi số triệu chứng khớp"""
+        results = knowledge_manager.search_diseases_by_symptoms(['sneezing', 'runny_nose', 'itchy_eyes'])
+        keys = [(r['match_ratio'], r['match_count']) for r in results]
+        assert keys == sorted(keys, reverse=True)
+        assert results[0]['disease']['id'] == 'allergic_rhinitis'
+
+    def test_search_top_k(self, knowledge_manager):
+        """Test giới hạn số kết quả tìm kiếm"""
+        full = knowledge_manager.search_diseases_by_symptoms(['fever', 'cough'])
+        top = knowledge_manager.search_diseases_by_symptoms(['fever', 'cough'], top_k=3)
+        assert top == full[:3]
+
+    def test_index_updated_on_add(self, knowledge_manager):
+        """Test chỉ mục được cập nhật khi thêm bệnh"""
+        assert knowledge_manager.add_disease({'id': 'hiccup_disorder', 'name': 'Nấc kéo dài', 'symptoms': ['hiccups']})
+        ranked = knowledge_manager.rank_diseases(['hiccups'])
+        assert ranked[0]['disease']['id'] == 'hiccup_disorder'
+
+    def test_utils_wrapper(self):
+        """Test hàm rank_diseases_by_symptoms giữ nguyên giao diện"""
+        diseases = [{'id': 'a', 'name': 'A', 'symptoms': ['x', 'y']}]
+        assert rank_diseases_by_symptoms(['x'], diseases)[0]['score'] == 0.5
+
+
+class TestRankingState:
+    """Test trạng thái xếp hạng tăng dần theo phiên"""
+
+    def test_incremental_matches_full_rank(self, knowledge_manager):
+        """Test cập nhật tăng dần cho kết quả như xếp hạng lại từ đầu"""
+        state = knowledge_manager.new_ranking_state()
+        turns = [['fever'], ['cough', 'fever'], ['chills'], ['phlegm', 'chest_pain']]
+        seen = []
+        for turn in turns:
+            new = [s for s in turn if s not in seen]
+            assert state.add_symptoms(turn) == new
+            seen += new
+            assert state.symptoms == seen
+            assert state.rank(5) == knowledge_manager.rank_diseases(seen, top_k=5)
+
+    def test_only_new_symptoms_touch_counts(self):
+        """Test chỉ bệnh liên quan đến triệu chứng mới được cập nhật"""
+        index = DiseaseIndex([
+            {'id': 'a', 'symptoms': ['x', 'y']},
+            {'id': 'b', 'symptoms': ['z']}
+        ])
+        state = RankingState(index)
+        state.add_symptoms(['x'])
+        assert state.counts == {0: 1}
+        assert state.add_symptoms(['x', 'z']) == ['z']
+        assert state.counts == {0: 1, 1: 1}
+
+    def test_refresh_after_knowledge_change(self, knowledge_manager):
+        """Test trạng thái được xây lại khi tri thức thay đổi"""
+        state = knowledge_manager.new_ranking_state(['hiccups'])
+        assert state.rank(5) == []
+        knowledge_manager.add_disease({'id': 'hiccup_disorder', 'name': 'Nấc kéo dài', 'symptoms': ['hiccups']})
+        knowledge_manager.refresh_ranking_state(state)
+        assert state.rank(5)[0]['disease']['id'] == 'hiccup_disorder'
+
+    def test_engine_keeps_session_state(self, knowledge_manager):
+        """Test DiagnosisEngine tích lũy triệu chứng qua nhiều lượt"""
+        from diagnosis_engine import DiagnosisEngine
+        engine = DiagnosisEngine(knowledge_manager, MagicMock())
+        state = engine.create_ranking_state()
+
+        engine.analyze_symptoms("Tôi bị ho", ranking_state=state)
+        result = engine.analyze_symptoms("Giờ thêm đau họng và ho", ranking_state=state)
+        assert result['symptoms'] == ['Ho', 'Đau họng']
+        assert result['new_symptoms'] == ['Đau họng', 'Ho']
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,110 @@
+"""
+Test Id Space
+Kiểm tra ánh xạ khóa chuỗi ↔ id số nguyên và luồng chẩn đoán trên id
+"""
+import pytest
+import shutil
+import sys
+from pathlib import Path
+from unittest.mock import MagicMock
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from config import KNOWLEDGE_BASE_PATH
+from id_space import IdSpace, to_bits, from_bits
+from knowledge_manager import KnowledgeManager
+
+
+@pytest.fixture
+def knowledge_manager(tmp_path):
+    """Knowledge manager on a copy of the knowledge base"""
+    kb_path = tmp_path / 'knowledge_base.json'
+    shutil.copy(KNOWLEDGE_BASE_PATH, kb_path)
+    return KnowledgeManager(kb_path)
+
+
+class TestIdSpace:
+    """Test bảng ánh xạ id"""
+
+    def test_intern_is_dense_and_stable(self):
+        """Test id được cấp liên tục từ 0 và không đổi"""
+        space = IdSpace(['fever', 'cough'])
+        assert space.intern('rash') == 2
+        assert space.intern('fever') == 0
+        assert len(space) == 3
+        assert space.encode(['cough', 'unknown', 'rash']) == [1, 2]
+        assert space.decode([2, 0]) == ['rash', 'fever']
+        assert space.get('unknown') is None
+
+    def test_bits_round_trip(self):
+        """Test đóng gói và giải nén bitset"""
+        assert to_bits([0, 3, 70]) == (1 << 70) | 0b1001
+        assert from_bits(to_bits([70, 3, 0])) == [0, 3, 70]
+        assert from_bits(0) == []
+
+
+class TestKnowledgeManagerIds:
+    """Test lớp chuyển đổi tên ↔ id của KnowledgeManager"""
+
+    def test_catalogue_symptoms_take_low_ids(self, knowledge_manager):
+        """Test triệu chứng trong danh mục có id nhỏ theo thứ tự tệp"""
+        symptoms = knowledge_manager.get_all_symptoms()
+        ids = knowledge_manager.encode_symptoms([s['id'] for s in symptoms])
+        assert ids == list(range(len(symptoms)))
+        assert knowledge_manager.symptom_names(ids) == [s['name'] for s in symptoms]
+
+    def test_encode_names_aliases_and_ids(self, knowledge_manager):
+        """Test mã hóa từ id, tên hiển thị và tên gọi khác"""
+        fever = knowledge_manager.encode_symptoms(['fever'])
+        assert knowledge_manager.encode_symptoms(['Sốt', 'FEVER', 'sot']) == fever
+        assert knowledge_manager.encode_symptoms(['nhức đầu']) == knowledge_manager.encode_symptoms(['headache'])
+        assert knowledge_manager.encode_symptoms(['không có']) == []
+        assert knowledge_manager.decode_symptoms(fever) == ['fever']
+
+    def test_precomputed_emergency_tiers(self, knowledge_manager):
+        """Test phân loại khẩn cấp từ mức tính sẵn theo triệu chứng"""
+        ids = knowledge_manager.encode_symptoms(['Ho', 'Khó thở'])
+        result = knowledge_manager.triage_symptom_ids(ids)
+        assert result['level'] == 'critical'
+        assert result['keywords'] == ['khó thở']
+        assert result['matches'][0]['source'] == 1
+        assert knowledge_manager.triage_symptom_ids(ids[:1])['level'] is None
+
+    def test_disease_only_symptoms_are_interned(self, knowledge_manager):
+        """Test triệu chứng chỉ có trong bệnh mới vẫn được cấp id"""
+        knowledge_manager.add_disease({'id': 'hiccup_disorder', 'name': 'Nấc kéo dài', 'symptoms': ['hiccups']})
+        ids = knowledge_manager.encode_symptoms(['hiccups'])
+        assert knowledge_manager.rank_diseases_by_ids(ids)[0]['disease']['id'] == 'hiccup_disorder'
+
+
+class TestEngineOnIds:
+    """Test DiagnosisEngine xếp hạng bằng id thay vì tên hiển thị"""
+
+    def test_extracted_names_match_diseases(self, knowledge_manager):
+        """Test triệu chứng trích xuất từ văn bản khớp được bệnh"""
+        from diagnosis_engine import DiagnosisEngine
+        engine = DiagnosisEngine(knowledge_manager, MagicMock())
+        result = engine.analyze_symptoms("Tôi bị hắt hơi, sổ mũi và ngứa mắt")
+        assert {'sneezing', 'runny_nose', 'itchy_eyes'} <= set(result['symptom_ids'])
+        assert result['matched_diseases'][0]['disease']['id'] == 'allergic_rhinitis'
+        assert set(result['matched_diseases'][0]['matched_symptoms']) >= {'sneezing', 'runny_nose', 'itchy_eyes'}
+
+    def test_accumulated_names_are_translated(self, knowledge_manager):
+        """Test triệu chứng tích lũy dạng tên được chuyển sang id"""
+        from diagnosis_engine import DiagnosisEngine
+        engine = DiagnosisEngine(knowledge_manager, MagicMock())
+        result = engine.analyze_symptoms("Tôi bị ngứa mắt", accumulated_symptoms=['Hắt hơi', 'Sổ mũi'])
+        assert result['symptoms'][-1] == 'Ngứa mắt'
+        assert result['matched_diseases'][0]['disease']['id'] == 'allergic_rhinitis'
+
+    def test_emergency_from_symptoms(self, knowledge_manager):
+        """Test cảnh báo khẩn cấp từ triệu chứng đã nhận diện"""
+        from diagnosis_engine import DiagnosisEngine
+        engine = DiagnosisEngine(knowledge_manager, MagicMock())
+        result = engine.analyze_symptoms("Tôi bị khó thở")
+        assert "CẢNH BÁO KHẨN CẤP" in result['emergency_warning']
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
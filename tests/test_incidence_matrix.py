@@ -0,0 +1,111 @@
+"""
+Test Incidence Matrix
+Kiểm tra bộ chấm điểm vector hóa trên ma trận bệnh × triệu chứng
+"""
+import pytest
+import random
+import shutil
+import sys
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+np = pytest.importorskip("numpy")
+
+from config import KNOWLEDGE_BASE_PATH
+from disease_index import DiseaseIndex
+from incidence_matrix import IncidenceMatrixScorer
+from knowledge_manager import KnowledgeManager
+
+
+@pytest.fixture
+def knowledge_manager(tmp_path):
+    """Knowledge manager on a copy of the knowledge base"""
+    kb_path = tmp_path / 'knowledge_base.json'
+    shutil.copy(KNOWLEDGE_BASE_PATH, kb_path)
+    return KnowledgeManager(kb_path)
+
+
+class TestIncidenceMatrixScorer:
+    """Test chấm điểm bằng ma trận"""
+
+    def test_scores_all_metrics(self):
+        """Test tính số khớp, Jaccard và tỉ lệ khớp cho mọi bệnh"""
+        scorer = IncidenceMatrixScorer([
+            {'id': 'a', 'symptoms': ['fever', 'cough']},
+            {'id': 'b', 'symptoms': ['rash']}
+        ])
+        scores = scorer.score_batch([['cough', 'unknown']])
+        assert scores['match_count'].tolist() == [[1, 0]]
+        assert scores['jaccard'][0].tolist() == pytest.approx([1 / 3, 0.0])
+        assert scores['match_ratio'][0].tolist() == pytest.approx([0.5, 0.0])
+
+    def test_rank_batch_matches_index(self, knowledge_manager):
+        """Test xếp hạng hàng loạt trùng với chỉ mục ngược"""
+        diseases = knowledge_manager.get_all_diseases()
+        index = DiseaseIndex(diseases)
+        scorer = IncidenceMatrixScorer(diseases)
+        symptom_ids = [s['id'] for s in knowledge_manager.get_all_symptoms()]
+
+        rng = random.Random(7)
+        cases = [rng.sample(symptom_ids, rng.randint(1, 6)) for _ in range(100)]
+        cases.append([])
+
+        for case, ranked in zip(cases, scorer.rank_batch(cases, top_k=5)):
+            assert ranked == index.rank(case, top_k=5)
+
+    def test_chunks_by_gathered_columns(self):
+        """Test chia lô theo số cột được đọc cho kết quả như khi không chia"""
+        rng = random.Random(11)
+        vocabulary = [f's{i}' for i in range(300)]
+        diseases = [{'id': f'd{i}', 'symptoms': rng.sample(vocabulary, rng.randint(1, 40))} for i in range(50)]
+        scorer = IncidenceMatrixScorer(diseases)
+        cases = [rng.sample(vocabulary, rng.randint(0, 30)) for _ in range(40)]
+        expected = [[len({s.lower() for s in case} & set(d['symptoms'])) for d in diseases] for case in cases]
+
+        assert scorer.score_batch(cases)['match_count'].tolist() == expected
+        # Fewer columns than one query holds: every query gets its own chunk
+        with patch('incidence_matrix._CHUNK_BYTES', 50):
+            assert scorer.score_batch(cases)['match_count'].tolist() == expected
+
+    def test_knowledge_manager_batch(self, knowledge_manager):
+        """Test xếp hạng hàng loạt qua KnowledgeManager"""
+        results = knowledge_manager.rank_diseases_batch([['sneezing', 'itchy_eyes'], ['red_eyes']])
+        assert results[0][0]['disease']['id'] == 'allergic_rhinitis'
+        assert results[1][0]['disease']['id'] == 'conjunctivitis'
+
+    def test_engine_matrix_backend(self, knowledge_manager):
+        """Test DiagnosisEngine dùng backend ma trận cho kết quả như chỉ mục"""
+        from diagnosis_engine import DiagnosisEngine
+        index_engine = DiagnosisEngine(knowledge_manager, MagicMock())
+        matrix_engine = DiagnosisEngine(knowledge_manager, MagicMock(), scoring_backend='matrix')
+        symptoms = ['fever', 'cough', 'fatigue']
+        assert matrix_engine.match_diseases(symptoms) == index_engine.match_diseases(symptoms)
+
+        with pytest.raises(ValueError):
+            DiagnosisEngine(knowledge_manager, MagicMock(), scoring_backend='unknown')
+
+    def test_engine_matrix_backend_with_ranking_state(self, knowledge_manager):
+        """Test phiên có ranking_state vẫn xếp hạng bằng backend ma trận"""
+        from diagnosis_engine import DiagnosisEngine
+        index_engine = DiagnosisEngine(knowledge_manager, MagicMock())
+        matrix_engine = DiagnosisEngine(knowledge_manager, MagicMock(), scoring_backend='matrix')
+        index_state, matrix_state = index_engine.create_ranking_state(), matrix_engine.create_ranking_state()
+
+        with patch.object(knowledge_manager, 'rank_diseases_batch_by_ids',
+                          wraps=knowledge_manager.rank_diseases_batch_by_ids) as matrix_rank:
+            for message in ['Tôi bị ho', 'thêm sổ mũi và hắt hơi']:
+                expected = index_engine.analyze_symptoms(message, ranking_state=index_state)
+                result = matrix_engine.analyze_symptoms(message, ranking_state=matrix_state)
+                assert result['matched_diseases'] and result['matched_diseases'] == expected['matched_diseases']
+                assert result['symptoms'] == expected['symptoms']
+        assert matrix_rank.call_count == 2
+        # The matrix session keeps its symptoms but no per-disease counts
+        assert matrix_state.symptoms == index_state.symptoms
+        assert matrix_state.counts == {} and index_state.counts
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
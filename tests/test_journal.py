@@ -0,0 +1,217 @@
+"""
+Test Knowledge Journal
+Kiểm tra nhật ký ghi trước (JSONL) cho các thay đổi cơ sở tri thức
+"""
+import json
+import pytest
+import os
+import shutil
+import sys
+import threading
+from pathlib import Path
+from unittest.mock import patch
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from config import KNOWLEDGE_BASE_PATH
+from journal import KnowledgeJournal, journal_path
+from knowledge_manager import KnowledgeManager
+from utils import save_json_file
+
+
+@pytest.fixture
+def kb_path(tmp_path):
+    """Copy of the knowledge base"""
+    path = tmp_path / 'knowledge_base.json'
+    shutil.copy(KNOWLEDGE_BASE_PATH, path)
+    return path
+
+
+def new_disease(i):
+    return {'id': f'disease_{i}', 'name': f'Bệnh {i}', 'symptoms': ['fever']}
+
+
+class TestKnowledgeJournal:
+    """Test nhật ký ghi nối"""
+
+    def test_append_and_replay(self, tmp_path):
+        """Test ghi nối rồi đọc lại đúng thứ tự"""
+        journal = KnowledgeJournal(tmp_path / 'kb.journal.jsonl')
+        journal.append('add_disease', {'id': 'a'})
+        journal.append('add_symptom', {'id': 'b'})
+        journal.close()
+
+        replayed = KnowledgeJournal(tmp_path / 'kb.journal.jsonl').replay()
+        assert replayed == [
+            {'op': 'add_disease', 'data': {'id': 'a'}},
+            {'op': 'add_symptom', 'data': {'id': 'b'}}
+        ]
+
+    def test_fsync_batching(self, tmp_path):
+        """Test fsync được gộp theo lô"""
+        journal = KnowledgeJournal(tmp_path / 'kb.journal.jsonl', fsync_every=10, fsync_interval=3600)
+        with patch('journal.os.fsync') as fsync:
+            for i in range(25):
+                journal.append('add_disease', {'id': i})
+            assert fsync.call_count == 2
+            journal.close()
+            assert fsync.call_count == 3
+
+    def test_deadline_sync(self, tmp_path):
+        """Test phần cuối của một loạt ghi được fsync khi hết hạn, không cần lần ghi sau"""
+        journal = KnowledgeJournal(tmp_path / 'kb.journal.jsonl', fsync_every=10, fsync_interval=0.05)
+        synced = threading.Event()
+        with patch('journal.os.fsync', side_effect=lambda fd: synced.set()) as fsync:
+            for i in range(3):
+                journal.append('add_disease', {'id': i})
+            assert fsync.call_count == 0
+            assert synced.wait(timeout=1)
+            assert fsync.call_count == 1
+            journal.close()
+            assert fsync.call_count == 1
+
+    def test_torn_tail_is_dropped(self, tmp_path):
+        """Test dòng ghi dở khi sập bị bỏ qua và cắt khỏi tệp"""
+        path = tmp_path / 'kb.journal.jsonl'
+        path.write_text('{"op": "add_disease", "data": {"id": "a"}}\n{"op": "add_dis', encoding='utf-8')
+        journal = KnowledgeJournal(path)
+        assert len(journal.replay()) == 1
+        journal.append('add_disease', {'id': 'b'})
+        journal.close()
+        assert [e['data']['id'] for e in KnowledgeJournal(path).replay()] == ['a', 'b']
+
+
+class TestJournaledKnowledgeManager:
+    """Test KnowledgeManager dùng nhật ký thay vì ghi lại toàn bộ tệp"""
+
+    def test_insert_does_not_rewrite_file(self, kb_path):
+        """Test thêm bệnh chỉ ghi nối, không ghi lại tệp JSON"""
+        original = kb_path.read_bytes()
+        km = KnowledgeManager(kb_path)
+        assert km.add_disease(new_disease(1))
+        km.close()
+        assert kb_path.read_bytes() == original
+        assert journal_path(kb_path).exists()
+
+    def test_replay_on_load(self, kb_path):
+        """Test tải lại áp dụng các thay đổi trong nhật ký"""
+        km = KnowledgeManager(kb_path)
+        km.add_symptom({'id': 'hiccups', 'name': 'Nấc cụt', 'category': 'digestive'})
+        km.add_disease(new_disease(1))
+        km.close()
+
+        reloaded = KnowledgeManager(kb_path)
+        assert reloaded.get_symptom_by_id('hiccups')['name'] == 'Nấc cụt'
+        assert reloaded.get_disease_by_id('disease_1') is not None
+        assert reloaded.get_statistics() == km.get_statistics()
+
+    def test_replay_updates_and_removals(self, kb_path):
+        """Test tải lại áp dụng cả thao tác sửa và xóa, kể cả khi nén bị ngắt"""
+        km = KnowledgeManager(kb_path)
+        km.add_disease(new_disease(1))
+        km.update_disease('disease_1', {'name': 'Bệnh một'})
+        km.remove_disease('flu')
+        km.update_symptom('fever', {'aliases': ['nóng sốt']})
+        with patch.object(km.journal, 'discard_rotated'):
+            km.compact()
+        km.close()
+
+        reloaded = KnowledgeManager(kb_path)
+        assert reloaded.get_disease_by_id('disease_1')['name'] == 'Bệnh một'
+        assert reloaded.get_disease_by_id('flu') is None
+        assert reloaded.get_symptom_by_id('fever')['aliases'] == ('nóng sốt',)
+        assert reloaded.get_all_diseases() == km.get_all_diseases()
+
+    def test_failed_apply_leaves_journal_untouched(self, kb_path):
+        """Test thay đổi áp dụng lỗi không được ghi vào nhật ký"""
+        km = KnowledgeManager(kb_path)
+        with patch('knowledge_manager.KnowledgeState.append', side_effect=RuntimeError('boom')):
+            assert not km.add_disease(new_disease(1))
+            assert not km.add_symptom({'id': 'hiccups', 'name': 'Nấc cụt', 'category': 'digestive'})
+            assert km.add_diseases([new_disease(2), new_disease(3)]) == 0
+        km.close()
+
+        assert len(km.journal) == 0
+        reloaded = KnowledgeManager(kb_path)
+        assert reloaded.get_disease_by_id('disease_1') is None
+        assert reloaded.get_statistics() == km.get_statistics()
+
+    def test_compaction(self, kb_path):
+        """Test nén nhật ký vào tệp JSON"""
+        km = KnowledgeManager(kb_path)
+        km.add_disease(new_disease(1))
+        assert km.compact()
+        assert len(km.journal) == 0
+        assert not journal_path(kb_path).with_name(journal_path(kb_path).name + '.compacting').exists()
+        data = json.loads(kb_path.read_text(encoding='utf-8'))
+        assert data['diseases'][-1]['id'] == 'disease_1'
+        assert KnowledgeManager(kb_path).get_statistics() == km.get_statistics()
+
+    def test_compaction_keeps_external_edit(self, kb_path):
+        """Test không nén đè lên tệp JSON vừa được sửa bên ngoài"""
+        km = KnowledgeManager(kb_path)
+        km.add_disease(new_disease(1))
+        data = json.loads(kb_path.read_text(encoding='utf-8'))
+        data['diseases'].append(new_disease(2))
+        save_json_file(data, kb_path)
+
+        assert not km.compact()
+        assert len(km.journal) == 1
+        assert km.reload()
+        assert km.compact()
+        ids = [d['id'] for d in json.loads(kb_path.read_text(encoding='utf-8'))['diseases']]
+        assert ids[-2:] == ['disease_2', 'disease_1']
+        km.close()
+
+    def test_background_compaction_keeps_new_inserts(self, kb_path):
+        """Test thêm dữ liệu trong lúc nén nền không bị mất"""
+        km = KnowledgeManager(kb_path)
+        with patch('knowledge_manager.JOURNAL_COMPACT_THRESHOLD', 50):
+            for i in range(120):
+                assert km.add_disease(new_disease(i))
+        km.close()
+
+        reloaded = KnowledgeManager(kb_path)
+        assert reloaded.get_statistics() == km.get_statistics()
+        assert len(reloaded.journal) < 50
+
+    def test_interrupted_compaction_replays_idempotently(self, kb_path):
+        """Test nén bị ngắt giữa chừng không nhân đôi bản ghi"""
+        km = KnowledgeManager(kb_path)
+        km.add_disease(new_disease(1))
+        with patch.object(km.journal, 'discard_rotated'):
+            km.compact()
+        km.close()
+
+        reloaded = KnowledgeManager(kb_path)
+        ids = [d['id'] for d in reloaded.get_all_diseases()]
+        assert ids.count('disease_1') == 1
+
+    def test_atomic_save(self, tmp_path):
+        """Test ghi JSON lỗi không làm hỏng tệp cũ"""
+        path = tmp_path / 'data.json'
+        save_json_file({'a': 1}, path)
+        with pytest.raises(IOError):
+            save_json_file({'a': object()}, path)
+        assert json.loads(path.read_text(encoding='utf-8')) == {'a': 1}
+        assert list(tmp_path.iterdir()) == [path]
+
+    def test_save_keeps_file_mode(self, tmp_path):
+        """Test ghi đè giữ nguyên quyền của tệp"""
+        path = tmp_path / 'data.json'
+        save_json_file({'a': 1}, path)
+        os.chmod(path, 0o640)
+        save_json_file({'a': 2}, path)
+        assert path.stat().st_mode & 0o777 == 0o640
+
+    def test_new_file_mode_from_directory(self, tmp_path):
+        """Test tệp mới lấy quyền đọc/ghi của thư mục, không phải 0600 của mkstemp"""
+        os.chmod(tmp_path, 0o750)
+        path = tmp_path / 'data.json'
+        save_json_file({'a': 1}, path)
+        assert path.stat().st_mode & 0o777 == 0o640
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,223 @@
+"""
+Test Knowledge Base Snapshot
+Kiểm tra snapshot nhị phân của cơ sở tri thức và việc nạp bằng mmap
+"""
+import os
+import pytest
+import shutil
+import sys
+from pathlib import Path
+from unittest.mock import patch
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from config import KNOWLEDGE_BASE_PATH
+from kb_snapshot import (
+    Snapshot,
+    SnapshotKnowledgeManager,
+    compile_snapshot,
+    load_snapshot,
+    main,
+    snapshot_is_stale
+)
+from knowledge_manager import KnowledgeManager
+
+
+@pytest.fixture
+def json_manager(tmp_path):
+    """JSON knowledge manager on a copy of the knowledge base"""
+    kb_path = tmp_path / 'knowledge_base.json'
+    shutil.copy(KNOWLEDGE_BASE_PATH, kb_path)
+    return KnowledgeManager(kb_path)
+
+
+@pytest.fixture
+def snapshot_path(json_manager, tmp_path):
+    path = tmp_path / 'knowledge_base.snapshot'
+    compile_snapshot(json_manager, path)
+    return path
+
+
+@pytest.fixture
+def snapshot_manager(snapshot_path):
+    manager = SnapshotKnowledgeManager(snapshot_path)
+    yield manager
+    manager.close()
+
+
+class TestSnapshotFile:
+    """Test định dạng tệp snapshot"""
+
+    def test_header(self, json_manager, snapshot_path):
+        """Test header ghi thống kê và danh mục"""
+        snapshot = Snapshot(snapshot_path)
+        assert snapshot.header['statistics'] == json_manager.get_statistics()
+        assert snapshot.header['categories'] == json_manager.get_symptom_categories()
+        snapshot.close()
+        assert not [p for p in snapshot_path.parent.iterdir() if p.suffix == '.tmp']
+
+    def test_corrupt_payload_detected(self, snapshot_path):
+        """Test phát hiện dữ liệu hỏng qua checksum"""
+        data = bytearray(snapshot_path.read_bytes())
+        data[-1] ^= 0xFF
+        snapshot_path.write_bytes(bytes(data))
+        with pytest.raises(ValueError):
+            Snapshot(snapshot_path, verify=True)
+        # Without verification only the header is checked
+        Snapshot(snapshot_path).close()
+
+    def test_load_does_not_verify_payload(self, snapshot_path):
+        """Test nạp snapshot mặc định không đọc toàn bộ tệp để tính checksum"""
+        with patch.object(Snapshot, 'verify') as verify:
+            SnapshotKnowledgeManager(snapshot_path).close()
+            verify.assert_not_called()
+            SnapshotKnowledgeManager(snapshot_path, verify=True).close()
+            verify.assert_called_once()
+
+    def test_not_a_snapshot(self, tmp_path):
+        """Test từ chối tệp không phải snapshot"""
+        path = tmp_path / 'other.snapshot'
+        path.write_bytes(b'{"diseases": []}' * 4)
+        with pytest.raises(ValueError):
+            Snapshot(path)
+
+
+class TestSnapshotManager:
+    """Test SnapshotKnowledgeManager cho kết quả như bản trong bộ nhớ"""
+
+    def test_lookups(self, json_manager, snapshot_manager):
+        """Test tra cứu theo id, tên và danh mục"""
+        for disease in json_manager.get_all_diseases():
+            assert snapshot_manager.get_disease_by_id(disease['id']) == disease
+            assert snapshot_manager.get_disease_by_name(disease['name'].upper()) == disease
+        for symptom in json_manager.get_all_symptoms():
+            assert snapshot_manager.get_symptom_by_id(symptom['id']) == symptom
+        assert snapshot_manager.get_disease_by_id('unknown') is None
+        assert snapshot_manager.get_symptom_by_id('unknown') is None
+
+        assert snapshot_manager.get_symptom_categories() == json_manager.get_symptom_categories()
+        for category in json_manager.get_symptom_categories():
+            assert (snapshot_manager.get_symptoms_by_category(category) ==
+                    json_manager.get_symptoms_by_category(category))
+        assert snapshot_manager.get_statistics() == json_manager.get_statistics()
+        assert list(snapshot_manager.get_all_diseases()) == json_manager.get_all_diseases()
+
+    def test_ranking(self, json_manager, snapshot_manager):
+        """Test xếp hạng và tìm kiếm giống backend JSON"""
+        symptoms = [s['id'] for s in json_manager.get_all_symptoms()]
+        for start in range(0, len(symptoms), 7):
+            query = symptoms[start:start + 5] + ['unknown']
+            assert snapshot_manager.rank_diseases(query) == json_manager.rank_diseases(query)
+            assert (snapshot_manager.search_diseases_by_symptoms(query) ==
+                    json_manager.search_diseases_by_symptoms(query))
+            ids = json_manager.encode_symptoms(query)
+            assert snapshot_manager.encode_symptoms(query) == ids
+            assert snapshot_manager.rank_diseases_by_ids(ids) == json_manager.rank_diseases_by_ids(ids)
+
+    def test_incidence_matrix(self, json_manager, snapshot_manager):
+        """Test ma trận tỷ lệ mắc được đọc trực tiếp từ snapshot"""
+        pytest.importorskip('numpy')
+        symptoms = [s['id'] for s in json_manager.get_all_symptoms()]
+        id_sets = [json_manager.encode_symptoms(symptoms[i:i + 4]) for i in range(0, 40, 4)]
+        assert (snapshot_manager.rank_diseases_batch_by_ids(id_sets) ==
+                json_manager.rank_diseases_batch_by_ids(id_sets))
+        assert not snapshot_manager.get_incidence_matrix().matrix.flags.writeable
+
+    def test_context_and_triage(self, json_manager, snapshot_manager):
+        """Test ngữ cảnh cho LLM và phân loại khẩn cấp"""
+        assert snapshot_manager.build_knowledge_context() == json_manager.build_knowledge_context()
+        candidates = json_manager.get_all_diseases()[:3]
+        assert (snapshot_manager.build_relevant_context(candidates, ['S001']) ==
+                json_manager.build_relevant_context(candidates, ['S001']))
+        ids = list(range(len(json_manager.symptom_space)))
+        assert snapshot_manager.triage_symptom_ids(ids) == json_manager.triage_symptom_ids(ids)
+
+    def test_read_only(self, snapshot_manager):
+        """Test snapshot không cho phép ghi"""
+        disease = {'id': 'D999', 'name': 'Bệnh thử', 'symptoms': ['S001']}
+        assert snapshot_manager.add_disease(disease) is False
+        assert snapshot_manager.add_diseases([disease]) == 0
+        assert snapshot_manager.add_symptom({'id': 'S999', 'name': 'Thử', 'category': 'Khác'}) is False
+        assert snapshot_manager.get_disease_by_id('D999') is None
+        assert snapshot_manager.remove_disease('flu') is False
+        assert snapshot_manager.apply_patch([{'op': 'add_disease', 'data': disease}]) == 0
+        # No journal of its own, so the JSON backend's journal is never touched
+        assert snapshot_manager.journal is None
+
+
+class TestRecompile:
+    """Test biên dịch lại khi cơ sở tri thức thay đổi"""
+
+    def test_stale_after_insert(self, json_manager, snapshot_path):
+        """Test snapshot cũ được biên dịch lại khi có bản ghi mới"""
+        kb_path = json_manager.knowledge_base_path
+        assert not snapshot_is_stale(snapshot_path, kb_path)
+
+        assert json_manager.add_disease({'id': 'D999', 'name': 'Bệnh thử', 'symptoms': ['S001']})
+        json_manager.close()
+        compiled = snapshot_path.stat().st_mtime
+        os.utime(json_manager.journal.path, (compiled + 1, compiled + 1))
+        assert snapshot_is_stale(snapshot_path, kb_path)
+
+        manager = load_snapshot(kb_path, snapshot_path)
+        assert manager.get_disease_by_id('D999')['name'] == 'Bệnh thử'
+        manager.close()
+
+    def test_change_detected_from_header(self, json_manager, snapshot_path):
+        """Test phát hiện snapshot mới qua revision trong header, không băm cả tệp"""
+        with patch('knowledge_manager.file_fingerprint') as file_fingerprint:
+            manager = SnapshotKnowledgeManager(snapshot_path)
+            assert manager.revision == json_manager.revision
+            os.utime(snapshot_path, ns=(1, 1))
+            assert not manager.has_external_changes()
+
+            assert json_manager.add_disease({'id': 'D999', 'name': 'Bệnh thử', 'symptoms': ['S001']})
+            compile_snapshot(json_manager, snapshot_path)
+            assert manager.reload()
+            assert manager.get_disease_by_id('D999')['name'] == 'Bệnh thử'
+            file_fingerprint.assert_not_called()
+        manager.close()
+
+    def test_reload_recompiles_from_json(self, json_manager, snapshot_path):
+        """Test snapshot được biên dịch lại khi tệp JSON thay đổi lúc đang chạy"""
+        kb_path = json_manager.knowledge_base_path
+        manager = load_snapshot(kb_path, snapshot_path)
+        assert not manager.reload()
+
+        assert json_manager.add_disease({'id': 'D999', 'name': 'Bệnh thử', 'symptoms': ['S001']})
+        assert json_manager.compact()
+        edited = kb_path.stat().st_mtime
+        os.utime(snapshot_path, (edited - 1, edited - 1))
+
+        assert manager.reload()
+        assert manager.get_disease_by_id('D999')['name'] == 'Bệnh thử'
+        assert not snapshot_is_stale(snapshot_path, kb_path)
+        assert not manager.reload()
+        manager.close()
+
+    def test_compile_after_removal(self, json_manager, tmp_path):
+        """Test biên dịch từ một cơ sở tri thức đã xóa bớt bệnh"""
+        assert json_manager.remove_disease('flu')
+        assert json_manager.update_disease('allergic_rhinitis', {'symptoms': ['fever']})
+        path = tmp_path / 'removed.snapshot'
+        compile_snapshot(json_manager, path)
+        manager = SnapshotKnowledgeManager(path)
+        assert list(manager.get_all_diseases()) == json_manager.get_all_diseases()
+        assert manager.rank_diseases(['fever'], 100) == json_manager.rank_diseases(['fever'], 100)
+        manager.close()
+
+    def test_cli(self, json_manager, tmp_path, capsys):
+        """Test lệnh compile và verify"""
+        output = tmp_path / 'cli.snapshot'
+        assert main(['compile', '--knowledge-base', str(json_manager.knowledge_base_path),
+                     '--output', str(output)]) == 0
+        assert main(['verify', str(output)]) == 0
+        data = bytearray(output.read_bytes())
+        data[-1] ^= 0xFF
+        output.write_bytes(bytes(data))
+        assert main(['verify', str(output)]) == 1
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
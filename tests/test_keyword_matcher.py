@@ -0,0 +1,83 @@
+"""
+Test Keyword Matcher
+Kiểm tra bộ so khớp từ khóa Aho-Corasick dùng cho cảnh báo khẩn cấp
+"""
+import pytest
+import sys
+from pathlib import Path
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from config import EMERGENCY_KEYWORDS
+from keyword_matcher import KeywordMatcher
+from utils import normalize_text, fold_diacritics
+
+
+class TestTextFolding:
+    """Test chuẩn hóa và bỏ dấu tiếng Việt"""
+
+    def test_fold_vietnamese(self):
+        """Test bỏ dấu tiếng Việt"""
+        assert fold_diacritics("Khó Thở, ĐAU NGỰC") == "kho tho, dau nguc"
+
+    def test_fold_keeps_length(self):
+        """Test bỏ dấu không làm thay đổi độ dài chuỗi"""
+        text = "Tôi bị đau đầu dữ dội"
+        assert len(fold_diacritics(text)) == len(normalize_text(text))
+
+    def test_normalize_decomposed_input(self):
+        """Test chuẩn hóa NFC cho chuỗi tổ hợp (NFD)"""
+        import unicodedata
+        decomposed = unicodedata.normalize('NFD', "khó thở")
+        assert normalize_text(decomposed) == "khó thở"
+
+
+class TestKeywordMatcher:
+    """Test bộ so khớp nhiều từ khóa"""
+
+    @pytest.fixture
+    def matcher(self):
+        return KeywordMatcher(EMERGENCY_KEYWORDS)
+
+    def test_find_all_keywords_with_offsets(self, matcher):
+        """Test tìm tất cả từ khóa kèm vị trí"""
+        text = "Tôi bị khó thở và đau ngực"
+        matches = matcher.find_all(text)
+        assert [m['keyword'] for m in matches] == ['khó thở', 'đau ngực']
+        for m in matches:
+            assert text[m['start']:m['end']].lower() == m['keyword']
+
+    def test_match_without_diacritics(self, matcher):
+        """Test phát hiện khi người dùng gõ không dấu"""
+        keywords = [m['keyword'] for m in matcher.find_all("toi bi kho tho, dau nguc")]
+        assert 'khó thở' in keywords and 'đau ngực' in keywords
+
+    def test_conflicting_diacritics_rejected(self, matcher):
+        """Test không nhầm 'chăm sóc' thành 'sốc'"""
+        assert matcher.find_all("Tôi cần chăm sóc con nhỏ") == []
+
+    def test_word_boundaries(self):
+        """Test chỉ khớp trọn từ"""
+        matcher = KeywordMatcher(['ho'])
+        assert matcher.find_all("cho tôi hỏi") == []
+        assert len(matcher.find_all("tôi bị ho")) == 1
+
+    def test_overlapping_keywords(self):
+        """Test tìm được các từ khóa chồng lấn nhau"""
+        matcher = KeywordMatcher(['đau đầu', 'đau đầu dữ dội'])
+        keywords = {m['keyword'] for m in matcher.find_all("bị đau đầu dữ dội")}
+        assert keywords == {'đau đầu', 'đau đầu dữ dội'}
+
+    def test_no_match_normal_symptoms(self, matcher):
+        """Test không có cảnh báo với triệu chứng nhẹ"""
+        assert not matcher.contains_any("Tôi bị sổ mũi và hắt hơi")
+
+    def test_duplicate_keywords_compiled_once(self):
+        """Test từ khóa trùng lặp chỉ được biên dịch một lần"""
+        matcher = KeywordMatcher(['khó thở', 'Khó Thở', 'khó thở'])
+        assert len(matcher) == 1
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,395 @@
+"""
+Test Knowledge Manager
+Kiểm tra các chỉ mục tra cứu và thống kê của KnowledgeManager
+"""
+import json
+import os
+import pytest
+import shutil
+import sys
+import threading
+import time
+from pathlib import Path
+from unittest.mock import MagicMock
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from config import KNOWLEDGE_BASE_PATH
+from knowledge_manager import KnowledgeManager
+from utils import estimate_tokens
+
+
+@pytest.fixture
+def knowledge_manager(tmp_path):
+    """Knowledge manager on a copy of the knowledge base"""
+    kb_path = tmp_path / 'knowledge_base.json'
+    shutil.copy(KNOWLEDGE_BASE_PATH, kb_path)
+    return KnowledgeManager(kb_path)
+
+
+class TestLookupIndexes:
+    """Test tra cứu qua chỉ mục băm"""
+
+    def test_lookups_match_linear_scan(self, knowledge_manager):
+        """Test tra cứu theo id và tên trùng với duyệt tuần tự"""
+        for disease in knowledge_manager.get_all_diseases():
+            assert knowledge_manager.get_disease_by_id(disease['id']) is disease
+            assert knowledge_manager.get_disease_by_name(disease['name'].upper()) is disease
+        for symptom in knowledge_manager.get_all_symptoms():
+            assert knowledge_manager.get_symptom_by_id(symptom['id']) is symptom
+
+        assert knowledge_manager.get_disease_by_id('unknown') is None
+        assert knowledge_manager.get_disease_by_name('unknown') is None
+        assert knowledge_manager.get_symptom_by_id('unknown') is None
+
+    def test_categories(self, knowledge_manager):
+        """Test nhóm triệu chứng theo danh mục"""
+        symptoms = knowledge_manager.get_all_symptoms()
+        categories = knowledge_manager.get_symptom_categories()
+        assert categories == sorted({s['category'] for s in symptoms})
+        for category in categories:
+            assert knowledge_manager.get_symptoms_by_category(category) == \
+                [s for s in symptoms if s['category'] == category]
+        assert knowledge_manager.get_symptoms_by_category('unknown') == []
+
+    def test_returned_lists_are_copies(self, knowledge_manager):
+        """Test thay đổi danh sách trả về không làm hỏng chỉ mục"""
+        category = knowledge_manager.get_symptom_categories()[0]
+        knowledge_manager.get_symptoms_by_category(category).clear()
+        knowledge_manager.get_symptom_categories().clear()
+        assert knowledge_manager.get_symptoms_by_category(category)
+        assert knowledge_manager.get_symptom_categories()
+
+    def test_indexes_updated_on_add(self, knowledge_manager):
+        """Test chỉ mục và thống kê được cập nhật khi thêm dữ liệu"""
+        stats = knowledge_manager.get_statistics()
+        assert knowledge_manager.add_symptom({'id': 'hiccups', 'name': 'Nấc cụt', 'category': 'Tiêu hóa mới'})
+        assert knowledge_manager.add_disease({'id': 'hiccup_disorder', 'name': 'Nấc kéo dài', 'symptoms': ['hiccups']})
+
+        assert knowledge_manager.get_symptom_by_id('hiccups')['name'] == 'Nấc cụt'
+        assert knowledge_manager.get_disease_by_name('nấc kéo dài')['id'] == 'hiccup_disorder'
+        assert 'Tiêu hóa mới' in knowledge_manager.get_symptom_categories()
+        assert 'Nấc cụt (hiccups)' in knowledge_manager.build_knowledge_context()
+        assert not knowledge_manager.add_disease({'id': 'hiccup_disorder', 'name': 'X', 'symptoms': []})
+
+        new_stats = knowledge_manager.get_statistics()
+        assert new_stats['total_diseases'] == stats['total_diseases'] + 1
+        assert new_stats['total_symptoms'] == stats['total_symptoms'] + 1
+        assert new_stats['symptom_categories'] == stats['symptom_categories'] + 1
+
+    def test_statistics_match_recomputed(self, knowledge_manager):
+        """Test thống kê duy trì tăng dần trùng với tính lại"""
+        knowledge_manager.add_disease({'id': 'x', 'name': 'X', 'symptoms': ['fever', 'cough', 'rash']})
+        diseases = knowledge_manager.get_all_diseases()
+        stats = knowledge_manager.get_statistics()
+        assert stats['avg_symptoms_per_disease'] == pytest.approx(
+            sum(len(d['symptoms']) for d in diseases) / len(diseases)
+        )
+
+    def test_reload_rebuilds_indexes(self, knowledge_manager):
+        """Test tải lại tri thức xây lại chỉ mục từ đầu"""
+        knowledge_manager.add_symptom({'id': 'hiccups', 'name': 'Nấc cụt', 'category': 'Tiêu hóa mới'})
+        knowledge_manager.load_knowledge_base()
+        assert knowledge_manager.get_symptom_by_id('hiccups') is not None
+        assert knowledge_manager.get_symptom_categories().count('Tiêu hóa mới') == 1
+
+
+class TestKnowledgeContextCache:
+    """Test bộ nhớ đệm ngữ cảnh tri thức theo phiên bản"""
+
+    def test_context_reused_until_change(self, knowledge_manager):
+        """Test ngữ cảnh được dùng lại cho tới khi tri thức thay đổi"""
+        context = knowledge_manager.build_knowledge_context()
+        assert knowledge_manager.build_knowledge_context() is context
+
+        knowledge_manager.add_disease({'id': 'hiccup_disorder', 'name': 'Nấc kéo dài', 'symptoms': ['hiccups']})
+        updated = knowledge_manager.build_knowledge_context()
+        assert updated is not context
+        assert 'Nấc kéo dài (hiccup_disorder)' in updated
+
+    def test_context_invalidated_by_symptom_and_reload(self, knowledge_manager):
+        """Test thêm triệu chứng hoặc tải lại đều làm mới ngữ cảnh"""
+        context = knowledge_manager.build_knowledge_context()
+        knowledge_manager.add_symptom({'id': 'hiccups', 'name': 'Nấc cụt', 'category': 'digestive'})
+        assert 'Nấc cụt (hiccups)' in knowledge_manager.build_knowledge_context()
+
+        context = knowledge_manager.build_knowledge_context()
+        knowledge_manager.load_knowledge_base()
+        assert knowledge_manager.build_knowledge_context() is not context
+
+    def test_disease_snippets(self, knowledge_manager):
+        """Test đoạn mô tả bệnh được lưu đệm và có nội dung đúng"""
+        disease = knowledge_manager.get_all_diseases()[0]
+        snippet = knowledge_manager.get_disease_description(disease)
+        assert snippet == f"   - Mô tả: {disease.get('description', 'N/A')}\n"
+        assert knowledge_manager.get_disease_description(disease) is snippet
+        assert knowledge_manager.get_disease_context(disease).startswith(f"- {disease['name']} ({disease['id']})")
+
+
+class TestRelevantContext:
+    """Test ngữ cảnh rút gọn theo bệnh ứng viên"""
+
+    def test_only_candidates_included(self, knowledge_manager):
+        """Test chỉ bệnh ứng viên và triệu chứng liên quan được đưa vào"""
+        candidates = [knowledge_manager.get_disease_by_id('allergic_rhinitis')]
+        context = knowledge_manager.build_relevant_context(candidates, ['sneezing'])
+        assert knowledge_manager.get_disease_row(candidates[0]) in context
+        assert 'Hắt hơi (sneezing)' in context
+        assert 'covid19|' not in context
+        assert len(context) < len(knowledge_manager.build_knowledge_context())
+
+    def test_token_budget(self, knowledge_manager):
+        """Test ngữ cảnh không vượt ngân sách token"""
+        for budget in (20, 100, 400):
+            context = knowledge_manager.build_relevant_context([], token_budget=budget)
+            assert estimate_tokens(context) <= budget
+
+    def test_engine_uses_pruned_context(self, knowledge_manager):
+        """Test DiagnosisEngine gửi ngữ cảnh rút gọn cho LLM"""
+        from diagnosis_engine import DiagnosisEngine
+        llm_handler = MagicMock()
+        engine = DiagnosisEngine(knowledge_manager, llm_handler)
+        analysis = engine.analyze_symptoms("Tôi bị hắt hơi, sổ mũi và ngứa mắt")
+        engine.generate_diagnosis("Tôi bị hắt hơi", analysis)
+        context = llm_handler.generate_diagnosis.call_args.kwargs['knowledge_context']
+        assert context.startswith("=== BỆNH ỨNG VIÊN")
+        assert 'allergic_rhinitis|' in context
+
+
+class TestHotReload:
+    """Test tải lại nóng khi tệp tri thức thay đổi"""
+
+    def edit(self, knowledge_manager, disease):
+        """Ghi thêm một bệnh trực tiếp vào tệp JSON"""
+        path = knowledge_manager.knowledge_base_path
+        data = json.loads(path.read_text(encoding='utf-8'))
+        data['diseases'].append(disease)
+        path.write_text(json.dumps(data, ensure_ascii=False), encoding='utf-8')
+
+    def test_reload_on_change(self, knowledge_manager):
+        """Test tệp thay đổi được nạp lại thành phiên bản mới"""
+        assert not knowledge_manager.reload()
+        version = knowledge_manager.version
+        old_diseases = knowledge_manager.get_all_diseases()
+        ids = knowledge_manager.encode_symptoms(['sneezing', 'runny_nose'])
+        ranking_state = knowledge_manager.new_ranking_state(['sneezing'])
+
+        self.edit(knowledge_manager, {'id': 'new_disease', 'name': 'Bệnh mới', 'symptoms': ['sneezing']})
+        assert knowledge_manager.has_external_changes()
+        assert knowledge_manager.reload()
+        assert knowledge_manager.version > version
+        assert knowledge_manager.get_disease_by_id('new_disease')['name'] == 'Bệnh mới'
+
+        # Readers holding the old version keep a consistent view
+        assert len(old_diseases) == len(knowledge_manager.get_all_diseases()) - 1
+        assert ranking_state.rank(50) and 'new_disease' not in [r['disease']['id'] for r in ranking_state.rank(50)]
+        knowledge_manager.refresh_ranking_state(ranking_state)
+        assert 'new_disease' in [r['disease']['id'] for r in ranking_state.rank(50)]
+        # Symptom ids survive the reload
+        assert knowledge_manager.encode_symptoms(['sneezing', 'runny_nose']) == ids
+
+    def test_touch_does_not_reload(self, knowledge_manager):
+        """Test chỉ đổi thời gian sửa tệp không gây tải lại"""
+        path = knowledge_manager.knowledge_base_path
+        stat = path.stat()
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        assert not knowledge_manager.has_external_changes()
+
+    def test_invalid_file_keeps_state(self, knowledge_manager):
+        """Test tệp hỏng không thay thế phiên bản đang phục vụ"""
+        version = knowledge_manager.version
+        knowledge_manager.knowledge_base_path.write_text('{"diseases": [', encoding='utf-8')
+        assert not knowledge_manager.reload()
+        assert knowledge_manager.version == version
+        assert knowledge_manager.get_disease_by_id('allergic_rhinitis') is not None
+        # Not retried until the file changes again
+        assert not knowledge_manager.has_external_changes()
+
+    def test_own_compaction_not_reloaded(self, knowledge_manager):
+        """Test việc nén nhật ký của chính tiến trình không bị coi là thay đổi"""
+        knowledge_manager.add_disease({'id': 'x', 'name': 'X', 'symptoms': ['fever']})
+        assert knowledge_manager.compact()
+        assert not knowledge_manager.has_external_changes()
+
+    def test_watcher(self, knowledge_manager):
+        """Test luồng theo dõi tự nạp lại khi tệp thay đổi"""
+        knowledge_manager.start_watching(interval=0.01)
+        self.edit(knowledge_manager, {'id': 'watched', 'name': 'Theo dõi', 'symptoms': ['fever']})
+        deadline = time.monotonic() + 5
+        while knowledge_manager.get_disease_by_id('watched') is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        knowledge_manager.close()
+        assert knowledge_manager.get_disease_by_id('watched') is not None
+
+
+class TestConcurrentAccess:
+    """Test ghi chép-khi-ghi: người đọc không bao giờ thấy trạng thái dở dang"""
+
+    def test_published_state_not_mutated(self, knowledge_manager):
+        """Test phiên bản đã công bố không bị thay đổi khi thêm bản ghi"""
+        state = knowledge_manager.state
+        n_diseases, n_symptoms = len(state.diseases), len(state.symptoms)
+        context = knowledge_manager.build_knowledge_context()
+
+        assert knowledge_manager.add_symptom({'id': 'cow_symptom', 'name': 'Thử', 'category': 'Khác'})
+        assert knowledge_manager.add_disease({'id': 'cow', 'name': 'Bệnh thử', 'symptoms': ['fever', 'cow_symptom']})
+
+        assert (len(state.diseases), len(state.symptoms)) == (n_diseases, n_symptoms)
+        assert len(state.disease_index) == n_diseases
+        assert 'cow' not in state.diseases_by_id and 'cow_symptom' not in state.symptoms_by_id
+        assert 'cow' not in [r['disease']['id'] for r in state.disease_index.rank(['fever'], 100)]
+        assert state.knowledge_context == context
+        assert knowledge_manager.version == state.version + 2
+        assert 'cow' in [r['disease']['id'] for r in knowledge_manager.rank_diseases(['fever'], 100)]
+
+    def test_readers_during_writes(self, knowledge_manager):
+        """Test đọc song song với nhiều luồng ghi"""
+        total = len(knowledge_manager.get_all_diseases()) + 60
+        errors = []
+        stop = threading.Event()
+
+        def read():
+            try:
+                while not stop.is_set():
+                    state = knowledge_manager.state
+                    assert len(state.disease_index) == len(state.diseases)
+                    assert len(state.diseases_by_id) == len(state.diseases)
+                    knowledge_manager.rank_diseases(['fever', 'cough'])
+                    knowledge_manager.build_knowledge_context()
+                    knowledge_manager.get_statistics()
+            except Exception as e:
+                errors.append(e)
+
+        def write(worker):
+            for i in range(20):
+                knowledge_manager.add_disease({'id': f'w{worker}_{i}', 'name': f'W{worker} {i}', 'symptoms': ['fever']})
+
+        readers = [threading.Thread(target=read) for _ in range(4)]
+        writers = [threading.Thread(target=write, args=(worker,)) for worker in range(3)]
+        for thread in readers + writers:
+            thread.start()
+        for thread in writers:
+            thread.join()
+        stop.set()
+        for thread in readers:
+            thread.join()
+        knowledge_manager.close()
+
+        assert not errors
+        assert knowledge_manager.get_statistics()['total_diseases'] == total
+        assert len(knowledge_manager.disease_index) == total
+
+
+def assert_same_state(manager, rebuilt):
+    """Trạng thái cập nhật tăng dần phải giống bản dựng lại từ đầu"""
+    assert manager.get_all_diseases() == rebuilt.get_all_diseases()
+    assert manager.get_all_symptoms() == rebuilt.get_all_symptoms()
+    assert manager.get_symptom_categories() == rebuilt.get_symptom_categories()
+    for category in rebuilt.get_symptom_categories():
+        assert manager.get_symptoms_by_category(category) == rebuilt.get_symptoms_by_category(category)
+    assert manager.get_statistics() == rebuilt.get_statistics()
+    assert manager.build_knowledge_context() == rebuilt.build_knowledge_context()
+    for disease in rebuilt.get_all_diseases():
+        assert manager.get_disease_by_name(disease['name']) == disease
+    symptoms = [s['id'] for s in rebuilt.get_all_symptoms()]
+    for start in range(0, len(symptoms), 5):
+        query = symptoms[start:start + 6]
+        assert manager.rank_diseases(query, 100) == rebuilt.rank_diseases(query, 100)
+        assert manager.search_diseases_by_symptoms(query) == rebuilt.search_diseases_by_symptoms(query)
+        ids = manager.encode_symptoms(query)
+        assert manager.triage_symptom_ids(ids) == rebuilt.triage_symptom_ids(rebuilt.encode_symptoms(query))
+    assert len(manager.disease_index) == len(manager.get_all_diseases())
+
+
+class TestIncrementalUpdates:
+    """Test cập nhật, xóa và vá cơ sở tri thức cập nhật chỉ mục tăng dần"""
+
+    def test_update_disease(self, knowledge_manager):
+        """Test sửa bệnh cập nhật danh sách đăng, tên và thống kê"""
+        old = knowledge_manager.get_disease_by_id('allergic_rhinitis')
+        version = knowledge_manager.version
+        assert knowledge_manager.update_disease('allergic_rhinitis', {
+            'name': 'Viêm mũi dị ứng (sửa)', 'symptoms': ['fever', 'cough']
+        })
+        assert knowledge_manager.version == version + 1
+        disease = knowledge_manager.get_disease_by_id('allergic_rhinitis')
+        assert disease['symptoms'] == ('fever', 'cough') and disease['treatment'] == old['treatment']
+        assert knowledge_manager.get_disease_by_name(old['name']) is None
+        assert knowledge_manager.get_disease_by_name('viêm mũi dị ứng (sửa)') is disease
+        ranked = [r['disease']['id'] for r in knowledge_manager.rank_diseases(['sneezing'], 100)]
+        assert 'allergic_rhinitis' not in ranked
+        assert 'Viêm mũi dị ứng (sửa)' in knowledge_manager.build_knowledge_context()
+
+    def test_remove_disease(self, knowledge_manager):
+        """Test xóa bệnh khỏi mọi chỉ mục"""
+        total = knowledge_manager.get_statistics()['total_diseases']
+        assert knowledge_manager.remove_disease('allergic_rhinitis')
+        assert not knowledge_manager.remove_disease('allergic_rhinitis')
+        assert knowledge_manager.get_disease_by_id('allergic_rhinitis') is None
+        assert knowledge_manager.get_statistics()['total_diseases'] == total - 1
+        ranked = [r['disease']['id'] for r in knowledge_manager.rank_diseases(['sneezing', 'runny_nose'], 100)]
+        assert 'allergic_rhinitis' not in ranked
+        assert knowledge_manager.add_disease({'id': 'allergic_rhinitis', 'name': 'Lại', 'symptoms': ['sneezing']})
+        assert knowledge_manager.rank_diseases(['sneezing'], 1)[0]['disease']['name'] == 'Lại'
+
+    def test_update_symptom(self, knowledge_manager):
+        """Test sửa triệu chứng cập nhật danh mục, phân loại khẩn cấp và trích xuất"""
+        symptom = knowledge_manager.get_symptom_by_id('fever')
+        assert knowledge_manager.update_symptom('fever', {'name': 'Khó thở dữ dội', 'category': 'Mới'})
+        assert 'Mới' in knowledge_manager.get_symptom_categories()
+        assert knowledge_manager.get_symptoms_by_category('Mới')[0]['id'] == 'fever'
+        assert symptom not in knowledge_manager.get_symptoms_by_category(symptom['category'])
+        ids = knowledge_manager.encode_symptoms(['fever'])
+        assert knowledge_manager.triage_symptom_ids(ids)['level'] == 'critical'
+        assert knowledge_manager.lookup_symptom('khó thở dữ dội')['id'] == 'fever'
+
+    def test_invalid_changes_skipped(self, knowledge_manager):
+        """Test thay đổi không hợp lệ bị bỏ qua, phần còn lại vẫn được áp dụng"""
+        version = knowledge_manager.version
+        assert not knowledge_manager.update_disease('unknown', {'name': 'X'})
+        assert not knowledge_manager.update_disease('allergic_rhinitis', {'symptoms': 'fever'})
+        assert knowledge_manager.version == version
+        assert knowledge_manager.apply_patch([
+            {'op': 'drop_table', 'data': {'id': 'x'}},
+            {'op': 'add_disease', 'data': {'id': 'x', 'name': 'X', 'symptoms': ['fever']}},
+            {'op': 'update_disease', 'data': {'id': 'x', 'description': 'Mô tả'}},
+            {'op': 'add_disease', 'data': {'id': 'x', 'name': 'X', 'symptoms': []}},
+            'not a change'
+        ]) == 2
+        assert knowledge_manager.get_disease_by_id('x')['description'] == 'Mô tả'
+        assert knowledge_manager.version == version + 1
+
+    def test_patch_matches_rebuild(self, knowledge_manager):
+        """Test sau một loạt thay đổi, chỉ mục giống hệt bản nạp lại từ nhật ký"""
+        diseases = knowledge_manager.get_all_diseases()
+        symptoms = knowledge_manager.get_all_symptoms()
+        old_state = knowledge_manager.state
+        changes = [
+            {'op': 'update_disease', 'data': {'id': diseases[0]['id'], 'symptoms': [symptoms[0]['id'], 'new_symptom']}},
+            {'op': 'remove_disease', 'data': {'id': diseases[1]['id']}},
+            {'op': 'update_disease', 'data': {'id': diseases[2]['id'], 'name': diseases[3]['name']}},
+            {'op': 'remove_disease', 'data': {'id': diseases[3]['id']}},
+            {'op': 'add_symptom', 'data': {'id': 'new_symptom', 'name': 'Triệu chứng mới', 'category': 'Khác'}},
+            {'op': 'update_symptom', 'data': {'id': symptoms[1]['id'], 'category': symptoms[20]['category']}},
+            {'op': 'update_symptom', 'data': {'id': symptoms[2]['id'], 'aliases': ['bí danh']}},
+            {'op': 'add_disease', 'data': {'id': 'patched', 'name': 'Bệnh vá', 'symptoms': ['new_symptom']}},
+            {'op': 'remove_disease', 'data': {'id': 'patched'}},
+            {'op': 'add_disease', 'data': {'id': 'patched', 'name': 'Bệnh vá 2', 'symptoms': ['fever']}}
+        ]
+        assert knowledge_manager.apply_patch(changes) == len(changes)
+        # The published state before the patch is untouched
+        assert old_state.diseases == diseases and len(old_state.disease_index) == len(diseases)
+
+        knowledge_manager.close()
+        rebuilt = KnowledgeManager(knowledge_manager.knowledge_base_path)
+        assert_same_state(knowledge_manager, rebuilt)
+
+        # And after folding the journal into the file
+        assert rebuilt.compact()
+        rebuilt.close()
+        assert_same_state(knowledge_manager, KnowledgeManager(knowledge_manager.knowledge_base_path))
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
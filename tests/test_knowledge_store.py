@@ -0,0 +1,215 @@
+"""
+Test Knowledge Store
+Kiểm tra backend SQLite của KnowledgeManager và công cụ chuyển đổi từ JSON
+"""
+import pytest
+import random
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from config import KNOWLEDGE_BASE_PATH
+from knowledge_manager import KnowledgeManager
+from knowledge_store import (
+    SQLiteKnowledgeManager,
+    create_knowledge_manager,
+    main,
+    migrate_json_to_sqlite
+)
+
+
+@pytest.fixture
+def json_manager(tmp_path):
+    """JSON knowledge manager on a copy of the knowledge base"""
+    kb_path = tmp_path / 'knowledge_base.json'
+    shutil.copy(KNOWLEDGE_BASE_PATH, kb_path)
+    return KnowledgeManager(kb_path)
+
+
+@pytest.fixture
+def db_path(json_manager, tmp_path):
+    """SQLite store migrated from the same knowledge base"""
+    path = tmp_path / 'knowledge_base.sqlite3'
+    migrate_json_to_sqlite(json_manager.knowledge_base_path, path)
+    return path
+
+
+@pytest.fixture
+def sqlite_manager(db_path):
+    manager = SQLiteKnowledgeManager(db_path)
+    yield manager
+    manager.close()
+
+
+class TestSQLiteQueries:
+    """Test truy vấn SQL cho kết quả như bản trong bộ nhớ"""
+
+    def test_lookups(self, json_manager, sqlite_manager):
+        """Test tra cứu theo id, tên và danh mục"""
+        for disease in json_manager.get_all_diseases():
+            assert sqlite_manager.get_disease_by_id(disease['id']) == disease
+            assert sqlite_manager.get_disease_by_name(disease['name'].upper()) == disease
+        for symptom in json_manager.get_all_symptoms():
+            assert sqlite_manager.get_symptom_by_id(symptom['id']) == symptom
+        assert sqlite_manager.get_disease_by_id('unknown') is None
+
+        assert sqlite_manager.get_symptom_categories() == json_manager.get_symptom_categories()
+        for category in json_manager.get_symptom_categories():
+            assert sqlite_manager.get_symptoms_by_category(category) == \
+                json_manager.get_symptoms_by_category(category)
+
+    def test_search_and_rank(self, json_manager, sqlite_manager):
+        """Test tìm kiếm và xếp hạng bằng SQL trùng với chỉ mục"""
+        symptom_ids = [s['id'] for s in json_manager.get_all_symptoms()]
+        rng = random.Random(3)
+        for _ in range(40):
+            case = rng.sample(symptom_ids, rng.randint(1, 6))
+            assert sqlite_manager.search_diseases_by_symptoms(case) == \
+                json_manager.search_diseases_by_symptoms(case)
+            assert sqlite_manager.search_diseases_by_symptoms(case, top_k=3) == \
+                json_manager.search_diseases_by_symptoms(case, top_k=3)
+            assert sqlite_manager.rank_diseases(case + ['unknown']) == \
+                json_manager.rank_diseases(case + ['unknown'])
+        assert sqlite_manager.search_diseases_by_symptoms([]) == []
+
+    def test_statistics(self, json_manager, sqlite_manager):
+        """Test thống kê tính bằng SQL"""
+        assert sqlite_manager.get_statistics() == json_manager.get_statistics()
+
+
+class TestSQLiteWrites:
+    """Test ghi vào kho SQLite"""
+
+    def test_add_and_duplicate(self, sqlite_manager, db_path):
+        """Test thêm bản ghi, từ chối trùng id và lưu bền"""
+        disease = {'id': 'hiccup_disorder', 'name': 'Nấc kéo dài', 'symptoms': ['hiccups']}
+        assert sqlite_manager.add_symptom({'id': 'hiccups', 'name': 'Nấc cụt', 'category': 'digestive'})
+        assert sqlite_manager.add_disease(disease)
+        assert not sqlite_manager.add_disease(disease)
+        assert not sqlite_manager.add_disease({'id': 'x', 'name': 'X'})
+        assert sqlite_manager.rank_diseases_by_ids(sqlite_manager.encode_symptoms(['Nấc cụt']))[0]['disease'] == disease
+
+        reopened = SQLiteKnowledgeManager(db_path)
+        assert reopened.get_disease_by_id('hiccup_disorder') == disease
+        assert reopened.get_statistics()['total_diseases'] == 26
+        reopened.close()
+
+    def test_batch_skips_duplicates(self, sqlite_manager):
+        """Test thêm theo lô bỏ qua id đã có"""
+        added = sqlite_manager.add_diseases([
+            {'id': 'd1', 'name': 'Bệnh 1', 'symptoms': ['fever']},
+            {'id': 'flu', 'name': 'Cúm', 'symptoms': ['fever']},
+            {'id': 'd2', 'name': 'Bệnh 2', 'symptoms': ['cough']}
+        ])
+        assert added == 2
+        assert len(sqlite_manager.get_all_diseases()) == 27
+        assert sqlite_manager.get_statistics()['total_diseases'] == 27
+
+    def test_shared_store_between_connections(self, sqlite_manager, db_path):
+        """Test tiến trình khác thấy dữ liệu mới và nạp lại bản sao"""
+        other = SQLiteKnowledgeManager(db_path)
+        assert not sqlite_manager.has_external_changes()
+        other.add_disease({'id': 'd1', 'name': 'Bệnh 1', 'symptoms': ['fever']})
+        other.close()
+
+        assert sqlite_manager.get_disease_by_id('d1') is not None
+        assert sqlite_manager.reload()
+        assert sqlite_manager.get_all_diseases()[-1]['id'] == 'd1'
+        assert not sqlite_manager.reload()
+
+    def test_reads_do_not_wait_for_writer(self, sqlite_manager):
+        """Test truy vấn đọc không chờ khóa ghi"""
+        locked, release = threading.Event(), threading.Event()
+
+        def hold_write_lock():
+            with sqlite_manager._write_lock:
+                locked.set()
+                release.wait(5)
+
+        writer = threading.Thread(target=hold_write_lock)
+        writer.start()
+        try:
+            assert locked.wait(1)
+            started = time.perf_counter()
+            assert sqlite_manager.get_disease_by_id('flu')['id'] == 'flu'
+            assert sqlite_manager.get_statistics()['total_diseases'] == 25
+            assert time.perf_counter() - started < 1
+        finally:
+            release.set()
+            writer.join()
+
+    def test_reload_error_keeps_mirror(self, sqlite_manager):
+        """Test lỗi SQLite khi nạp lại không làm dừng luồng theo dõi"""
+        with patch.object(sqlite_manager, 'has_external_changes',
+                          side_effect=sqlite3.OperationalError('database is locked')):
+            assert sqlite_manager.reload() is False
+        assert len(sqlite_manager.get_all_diseases()) == 25
+
+    def test_no_journal(self, json_manager, sqlite_manager):
+        """Test kho SQLite không dùng chung nhật ký của tệp JSON"""
+        assert sqlite_manager.journal is None
+        assert json_manager.journal is not None
+
+    def test_patch(self, sqlite_manager, db_path):
+        """Test sửa và xóa được ghi vào kho và bản sao trong bộ nhớ"""
+        assert sqlite_manager.update_disease('flu', {'symptoms': ['fever', 'cough']})
+        assert sqlite_manager.remove_disease('allergic_rhinitis')
+        assert sqlite_manager.update_symptom('fever', {'name': 'Sốt rất cao'})
+        assert not sqlite_manager.remove_disease('allergic_rhinitis')
+
+        for manager in (sqlite_manager, SQLiteKnowledgeManager(db_path)):
+            assert manager.get_disease_by_id('flu')['symptoms'] == ('fever', 'cough')
+            assert manager.get_disease_by_id('allergic_rhinitis') is None
+            assert manager.get_symptom_by_id('fever')['name'] == 'Sốt rất cao'
+            assert manager.get_statistics()['total_diseases'] == 24
+            assert len(manager.get_all_diseases()) == 24
+            ranked = manager.rank_diseases(['sneezing', 'runny_nose'], 100)
+            assert 'allergic_rhinitis' not in [r['disease']['id'] for r in ranked]
+            assert ranked == manager.rank_diseases_by_ids(manager.encode_symptoms(['sneezing', 'runny_nose']), 100)
+
+
+class TestMigrationAndFactory:
+    """Test công cụ chuyển đổi và hàm tạo theo backend"""
+
+    def test_migrate_includes_journal(self, json_manager, tmp_path):
+        """Test chuyển đổi gồm cả thay đổi còn trong nhật ký"""
+        json_manager.add_disease({'id': 'd1', 'name': 'Bệnh 1', 'symptoms': ['fever']})
+        json_manager.close()
+        stats = migrate_json_to_sqlite(json_manager.knowledge_base_path, tmp_path / 'kb.sqlite3')
+        assert stats['total_diseases'] == 26
+
+        with pytest.raises(FileExistsError):
+            migrate_json_to_sqlite(json_manager.knowledge_base_path, tmp_path / 'kb.sqlite3')
+
+    def test_cli(self, json_manager, tmp_path, capsys):
+        """Test dòng lệnh chuyển đổi"""
+        db = tmp_path / 'cli.sqlite3'
+        assert main(['migrate', '--json', str(json_manager.knowledge_base_path), '--db', str(db)]) == 0
+        assert "Migrated 25 diseases and 70 symptoms" in capsys.readouterr().out
+
+    def test_factory(self, db_path):
+        """Test chọn backend theo cấu hình"""
+        manager = create_knowledge_manager('sqlite', db_path)
+        assert isinstance(manager, SQLiteKnowledgeManager)
+        manager.close()
+        assert type(create_knowledge_manager('json')) is KnowledgeManager
+        with pytest.raises(ValueError):
+            create_knowledge_manager('mongo')
+
+    def test_engine_on_sqlite(self, sqlite_manager):
+        """Test DiagnosisEngine chạy trên backend SQLite"""
+        from diagnosis_engine import DiagnosisEngine
+        engine = DiagnosisEngine(sqlite_manager, MagicMock())
+        result = engine.analyze_symptoms("Tôi bị hắt hơi, sổ mũi và ngứa mắt")
+        assert result['matched_diseases'][0]['disease']['id'] == 'allergic_rhinitis'
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -233,5 +233,110 @@ class TestErrorHandling:
             assert len(result) > 0, "Phải có thông báo lỗi khi response rỗng"
 
 
+class TestStreaming:
+    """Test cases for streamed diagnosis"""
+    
+    @staticmethod
+    def chunks(*texts):
+        return [MagicMock(text=text) for text in texts]
+    
+    @patch('google.generativeai.configure')
+    @patch('google.generativeai.GenerativeModel')
+    def test_diagnose_stream_yields_chunks(self, mock_model_class, mock_configure):
+        """Test diagnose_stream trả về từng đoạn theo thứ tự"""
+        with patch.dict('os.environ', {'GEMINI_API_KEY': 'test-api-key'}):
+            mock_model = MagicMock()
+            mock_chat = MagicMock()
+            mock_chat.send_message.return_value = self.chunks("Bạn có thể ", "bị cảm lạnh.")
+            mock_model.start_chat.return_value = mock_chat
+            mock_model_class.return_value = mock_model
+            
+            from medical_ai_handler import MedicalAIHandler
+            handler = MedicalAIHandler()
+            
+            result = list(handler.diagnose_stream("Tôi bị sổ mũi và hắt hơi"))
+            
+            assert result == ["Bạn có thể ", "bị cảm lạnh."]
+            mock_chat.send_message.assert_called_once_with("Tôi bị sổ mũi và hắt hơi", stream=True)
+    
+    @patch('google.generativeai.configure')
+    @patch('google.generativeai.GenerativeModel')
+    def test_diagnose_stream_emergency_first(self, mock_model_class, mock_configure):
+        """Test cảnh báo khẩn cấp được trả về trước, không gọi AI"""
+        with patch.dict('os.environ', {'GEMINI_API_KEY': 'test-api-key'}):
+            mock_model = MagicMock()
+            mock_chat = MagicMock()
+            mock_model.start_chat.return_value = mock_chat
+            mock_model_class.return_value = mock_model
+            
+            from medical_ai_handler import MedicalAIHandler
+            handler = MedicalAIHandler()
+            
+            result = list(handler.diagnose_stream("Tôi bị đau ngực dữ dội"))
+            
+            assert len(result) == 1
+            assert "CẢNH BÁO" in result[0] or "KHẨN CẤP" in result[0]
+            mock_chat.send_message.assert_not_called()
+    
+    @patch('google.generativeai.configure')
+    @patch('google.generativeai.GenerativeModel')
+    def test_diagnose_stream_error_mid_stream(self, mock_model_class, mock_configure):
+        """Test lỗi giữa chừng: giữ phần đã nhận, báo lỗi và bỏ lượt hỏng"""
+        with patch.dict('os.environ', {'GEMINI_API_KEY': 'test-api-key'}):
+            def broken_stream():
+                yield MagicMock(text="Bạn có thể ")
+                raise Exception("Stream Error")
+            
+            mock_model = MagicMock()
+            mock_chat = MagicMock()
+            mock_chat.send_message.return_value = broken_stream()
+            mock_model.start_chat.return_value = mock_chat
+            mock_model_class.return_value = mock_model
+            
+            from medical_ai_handler import MedicalAIHandler
+            handler = MedicalAIHandler()
+            
+            result = list(handler.diagnose_stream("Tôi bị sốt"))
+            
+            assert result[0] == "Bạn có thể "
+            assert "Lỗi" in result[-1]
+            mock_chat.rewind.assert_called_once()
+    
+    @patch('google.generativeai.configure')
+    @patch('google.generativeai.GenerativeModel')
+    def test_generate_diagnosis_stream(self, mock_model_class, mock_configure):
+        """Test generate_diagnosis_stream dùng chế độ stream của mô hình"""
+        with patch.dict('os.environ', {'GEMINI_API_KEY': 'test-api-key'}):
+            mock_model = MagicMock()
+            mock_model.generate_content.return_value = self.chunks("Cảm ", "", "lạnh")
+            mock_model_class.return_value = mock_model
+            
+            from medical_llm_handler import MedicalLLMHandler
+            from response_cache import ResponseCache
+            handler = MedicalLLMHandler(response_cache=ResponseCache(path=None))
+            
+            result = list(handler.generate_diagnosis_stream("Tôi bị ho", "ctx"))
+            
+            assert result == ["Cảm ", "lạnh"]
+            assert mock_model.generate_content.call_args.kwargs == {'stream': True}
+    
+    def test_engine_stream(self):
+        """Test DiagnosisEngine stream: cảnh báo trước, sau đó nội dung và phần độ tin cậy"""
+        from diagnosis_engine import DiagnosisEngine
+        llm_handler = MagicMock()
+        llm_handler.generate_diagnosis_stream.return_value = iter(["Cảm ", "lạnh"])
+        llm_handler.format_medical_response.return_value = "\n\n**Độ tin cậy:** 80.0%"
+        engine = DiagnosisEngine(MagicMock(), llm_handler)
+        
+        emergency = list(engine.generate_diagnosis_stream("x", {'emergency_warning': "🚨 CẤP CỨU"}))
+        assert emergency == ["🚨 CẤP CỨU"]
+        llm_handler.generate_diagnosis_stream.assert_not_called()
+        
+        with patch('diagnosis_engine.KNOWLEDGE_CONTEXT_MODE', 'full'):
+            result = list(engine.generate_diagnosis_stream("Tôi bị ho", {'symptoms': ['Ho'], 'top_confidence': 0.8}))
+        assert result == ["Cảm ", "lạnh", "\n\n**Độ tin cậy:** 80.0%"]
+        assert llm_handler.format_medical_response.call_args.kwargs['diagnosis_text'] == ""
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
@@ -0,0 +1,114 @@
+"""
+Test Records
+Kiểm tra kiểu bản ghi gọn (__slots__) thay cho dict
+"""
+import dataclasses
+import json
+import pytest
+import shutil
+import sys
+from pathlib import Path
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from config import KNOWLEDGE_BASE_PATH
+from knowledge_manager import KnowledgeManager
+from records import AnalysisResult, Disease, DiseaseMatch, Symptom, to_plain
+from utils import validate_disease_record, validate_symptom_record
+
+
+DISEASE = {
+    'id': 'D999',
+    'name': 'Bệnh thử',
+    'description': 'Mô tả',
+    'symptoms': ['S001', 'S002'],
+    'treatment': 'Nghỉ ngơi',
+    'severity': 'mild'
+}
+
+
+class TestRecordInterface:
+    """Test giao diện dict chỉ đọc của bản ghi"""
+
+    def test_dict_access(self):
+        """Test truy cập như dict"""
+        disease = Disease.from_dict(DISEASE)
+        assert disease['id'] == 'D999'
+        assert disease.name == 'Bệnh thử'
+        assert disease.get('treatment') == 'Nghỉ ngơi'
+        assert 'severity' in disease
+        assert list(disease['symptoms']) == ['S001', 'S002']
+        assert disease == DISEASE
+        assert dict(disease) == {**DISEASE, 'symptoms': ('S001', 'S002')}
+
+    def test_optional_and_extra_fields(self):
+        """Test trường tùy chọn vắng mặt và trường ngoài lược đồ"""
+        symptom = Symptom.from_dict({'id': 'S999', 'name': 'Thử', 'category': 'Khác', 'note': 'x'})
+        assert 'aliases' not in symptom
+        assert symptom.get('aliases', []) == []
+        assert symptom['note'] == 'x'
+        assert symptom.to_dict() == {'id': 'S999', 'name': 'Thử', 'category': 'Khác', 'note': 'x'}
+        with pytest.raises(KeyError):
+            symptom['aliases']
+
+    def test_immutable_and_compact(self):
+        """Test bản ghi bất biến và nhỏ hơn dict"""
+        disease = Disease.from_dict(DISEASE)
+        with pytest.raises(dataclasses.FrozenInstanceError):
+            disease.name = 'Khác'
+        assert not hasattr(disease, '__dict__')
+        assert sys.getsizeof(disease) < sys.getsizeof(dict(DISEASE))
+        assert Disease.from_dict(disease) is disease
+
+    def test_json_round_trip(self):
+        """Test chuyển sang JSON và ngược lại"""
+        match = DiseaseMatch(disease=Disease.from_dict(DISEASE), score=0.5, matched_symptoms=['S001'])
+        result = AnalysisResult(matched_diseases=[match], top_confidence=0.5)
+        plain = json.loads(json.dumps(to_plain(result)))
+        assert plain['matched_diseases'][0] == {
+            'disease': DISEASE, 'matched_symptoms': ['S001'], 'score': 0.5
+        }
+        assert 'emergency_warning' in plain and plain['has_enough_info'] is False
+        assert Disease.from_dict(plain['matched_diseases'][0]['disease']) == DISEASE
+
+
+class TestKnowledgeManagerRecords:
+    """Test KnowledgeManager lưu bản ghi gọn"""
+
+    def test_loaded_and_added_records(self, tmp_path):
+        """Test bản ghi nạp, thêm và nén lại đều đúng"""
+        kb_path = tmp_path / 'knowledge_base.json'
+        shutil.copy(KNOWLEDGE_BASE_PATH, kb_path)
+        manager = KnowledgeManager(kb_path)
+        assert all(isinstance(d, Disease) for d in manager.get_all_diseases())
+        assert all(isinstance(s, Symptom) for s in manager.get_all_symptoms())
+
+        assert manager.add_disease(dict(DISEASE))
+        assert isinstance(manager.get_disease_by_id('D999'), Disease)
+        assert manager.compact()
+        manager.close()
+
+        with open(kb_path, encoding='utf-8') as f:
+            data = json.load(f)
+        assert data['diseases'][-1] == DISEASE
+        assert KnowledgeManager(kb_path).get_disease_by_id('D999') == DISEASE
+
+    def test_loaded_records_validate(self, tmp_path):
+        """Test bản ghi đã nạp (danh sách là tuple) vẫn hợp lệ"""
+        kb_path = tmp_path / 'knowledge_base.json'
+        shutil.copy(KNOWLEDGE_BASE_PATH, kb_path)
+        manager = KnowledgeManager(kb_path)
+        assert manager.validate_knowledge_base()
+
+        disease = manager.get_disease_by_id(manager.get_all_diseases()[0]['id'])
+        assert isinstance(disease['symptoms'], tuple)
+        assert validate_disease_record(disease) is None
+        assert validate_symptom_record(Symptom.from_dict({
+            'id': 'S999', 'name': 'Thử', 'category': 'other', 'aliases': ['a']
+        })) is None
+        assert validate_disease_record(dict(DISEASE, symptoms='S001')) is not None
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
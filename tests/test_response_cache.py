@@ -0,0 +1,164 @@
+"""
+Test Response Cache
+Kiểm tra bộ đệm phản hồi LLM (LRU trong bộ nhớ + SQLite, có TTL)
+"""
+import pytest
+import shutil
+import sys
+import unicodedata
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from config import KNOWLEDGE_BASE_PATH
+from knowledge_manager import KnowledgeManager
+from response_cache import ResponseCache, cache_key
+
+
+class TestCacheKey:
+    """Test khóa bộ đệm"""
+
+    def test_normalised_prompt(self):
+        """Test khoảng trắng và dạng Unicode không làm đổi khóa"""
+        decomposed = unicodedata.normalize('NFD', 'Sốt cao, ho')
+        assert cache_key('Sốt cao,  ho\n', 'm') == cache_key(decomposed, 'm')
+        assert cache_key('sốt', 'm') != cache_key('ho', 'm')
+
+    def test_model_config_and_version(self):
+        """Test khóa phụ thuộc mô hình, cấu hình sinh và phiên bản tri thức"""
+        base = cache_key('sốt', 'm', {'temperature': 0.7}, 'v1')
+        assert base == cache_key('sốt', 'm', {'temperature': 0.7}, 'v1')
+        assert base != cache_key('sốt', 'other', {'temperature': 0.7}, 'v1')
+        assert base != cache_key('sốt', 'm', {'temperature': 0.2}, 'v1')
+        assert base != cache_key('sốt', 'm', {'temperature': 0.7}, 'v2')
+
+
+class TestResponseCache:
+    """Test hai tầng bộ nhớ và đĩa"""
+
+    def test_lru_eviction(self):
+        """Test mục ít dùng nhất bị loại khỏi bộ nhớ"""
+        cache = ResponseCache(path=None, max_entries=2)
+        cache.put('a', '1')
+        cache.put('b', '2')
+        assert cache.get('a') == '1'
+        cache.put('c', '3')
+        assert cache.get('b') is None
+        assert cache.get('a') == '1' and cache.get('c') == '3'
+        assert len(cache) == 2
+        assert cache.get_statistics()['hits'] == 3
+        assert cache.get_statistics()['misses'] == 1
+
+    def test_ttl(self, tmp_path):
+        """Test mục hết hạn không được trả về ở cả hai tầng"""
+        cache = ResponseCache(path=tmp_path / 'cache.sqlite3', ttl=60)
+        with patch('response_cache.time.time', return_value=1000.0):
+            cache.put('a', '1')
+        with patch('response_cache.time.time', return_value=1059.0):
+            assert cache.get('a') == '1'
+        with patch('response_cache.time.time', return_value=1061.0):
+            assert cache.get('a') is None
+        cache.close()
+
+    def test_disk_tier_shared(self, tmp_path):
+        """Test tầng đĩa dùng chung giữa các phiên bản và được đưa lên bộ nhớ"""
+        path = tmp_path / 'cache' / 'cache.sqlite3'
+        cache = ResponseCache(path=path)
+        cache.put('a', 'phản hồi')
+        cache.close()
+
+        other = ResponseCache(path=path)
+        assert other.get('a') == 'phản hồi'
+        assert other.get('a') == 'phản hồi'
+        assert other.get_statistics() == {
+            'hits': 2, 'disk_hits': 1, 'misses': 0, 'hit_rate': 1.0, 'memory_entries': 1
+        }
+        other.clear()
+        other.close()
+        assert ResponseCache(path=path).get('a') is None
+
+    def test_unusable_disk_falls_back_to_memory(self, tmp_path):
+        """Test không mở được tệp thì vẫn đệm trong bộ nhớ"""
+        blocker = tmp_path / 'file'
+        blocker.write_text('x')
+        cache = ResponseCache(path=blocker / 'cache.sqlite3')
+        cache.put('a', '1')
+        assert cache.get('a') == '1'
+        assert cache.path is None
+
+
+class TestHandlerCaching:
+    """Test MedicalLLMHandler dùng bộ đệm"""
+
+    @pytest.fixture
+    def handler(self, tmp_path):
+        with patch('google.generativeai.configure'), \
+             patch('google.generativeai.GenerativeModel') as model_class, \
+             patch.dict('os.environ', {'GEMINI_API_KEY': 'test-api-key'}):
+            model_class.return_value = MagicMock()
+            from medical_llm_handler import MedicalLLMHandler
+            handler = MedicalLLMHandler(response_cache=ResponseCache(path=tmp_path / 'cache.sqlite3'))
+        handler.model.generate_content.return_value = MagicMock(text='{"severity_level": "mild"}')
+        yield handler
+        handler.response_cache.close()
+
+    def test_repeat_calls_hit_cache(self, handler):
+        """Test lời gọi lặp lại không gọi mô hình"""
+        assert handler.assess_severity(['Ho', 'Sốt'], knowledge_version='v1') == {'severity_level': 'mild'}
+        assert handler.assess_severity(['Ho', 'Sốt'], knowledge_version='v1') == {'severity_level': 'mild'}
+        assert handler.model.generate_content.call_count == 1
+
+        handler.assess_severity(['Ho', 'Sốt'], knowledge_version='v2')
+        handler.generate_treatment_recommendations('Cúm', ['Ho'], knowledge_version='v1')
+        handler.generate_treatment_recommendations('Cúm', ['Ho'], knowledge_version='v1')
+        assert handler.model.generate_content.call_count == 3
+
+    def test_empty_and_failed_responses_not_cached(self, handler):
+        """Test phản hồi rỗng hoặc lỗi không được lưu"""
+        handler.model.generate_content.return_value = MagicMock(text='')
+        assert handler.generate_follow_up_questions(['Ho'], [{'name': 'Cúm'}]) == ''
+        handler.model.generate_content.side_effect = RuntimeError('network')
+        assert handler.generate_follow_up_questions(['Ho'], [{'name': 'Cúm'}]) == ''
+        assert len(handler.response_cache) == 0
+
+    def test_none_disables_cache(self):
+        """Test response_cache=None tắt bộ đệm, mặc định dùng bộ đệm trong cấu hình"""
+        with patch('google.generativeai.configure'), \
+             patch('google.generativeai.GenerativeModel') as model_class, \
+             patch('medical_llm_handler.ResponseCache') as default_cache, \
+             patch.dict('os.environ', {'GEMINI_API_KEY': 'test-api-key'}):
+            model_class.return_value = MagicMock()
+            from medical_llm_handler import MedicalLLMHandler
+            handler = MedicalLLMHandler(response_cache=None)
+            assert handler.response_cache is None
+            default_cache.assert_not_called()
+            assert MedicalLLMHandler().response_cache is default_cache.return_value
+
+        handler.model.generate_content.return_value = MagicMock(text='Nghỉ ngơi')
+        handler.generate_treatment_recommendations('Cúm', ['Ho'])
+        handler.generate_treatment_recommendations('Cúm', ['Ho'])
+        assert handler.model.generate_content.call_count == 2
+
+
+class TestKnowledgeRevision:
+    """Test mã phiên bản nội dung của cơ sở tri thức"""
+
+    def test_revision_stable_and_changes(self, tmp_path):
+        """Test cùng nội dung cho cùng mã, thay đổi cho mã mới"""
+        kb_path = tmp_path / 'knowledge_base.json'
+        shutil.copy(KNOWLEDGE_BASE_PATH, kb_path)
+        first, second = KnowledgeManager(kb_path), KnowledgeManager(kb_path)
+        assert first.revision and first.revision == second.revision
+
+        revision = first.revision
+        assert first.add_disease({'id': 'x', 'name': 'X', 'symptoms': ['fever']})
+        assert second.add_disease({'id': 'x', 'name': 'X', 'symptoms': ['fever']})
+        assert first.revision != revision and first.revision == second.revision
+        assert first.update_disease('x', {'name': 'Y'})
+        assert first.revision != second.revision
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,239 @@
+"""
+Test Semantic Cache
+Kiểm tra bộ đệm ngữ nghĩa cho các tin nhắn gần trùng lặp
+"""
+import json
+import pytest
+import sys
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from config import KNOWLEDGE_BASE_PATH
+from response_cache import ResponseCache
+from semantic_cache import SemanticCache, reusable_message, text_vector
+from symptom_extractor import SymptomExtractor
+
+# Same symptoms and nearly the same words, but another patient or situation
+BASE_MESSAGE = 'tôi bị sốt, ho, đau họng'
+OTHER_PATIENTS = [
+    'tôi không bị sốt nhưng ho, đau họng',
+    'con tôi 2 tuổi bị sốt, ho, đau họng',
+    'tôi đang mang thai và bị sốt, ho, đau họng'
+]
+
+
+class TestTextVector:
+    """Test vector n-gram băm"""
+
+    def test_normalised(self):
+        """Test vector có độ dài 1 và không phụ thuộc dấu"""
+        vector = text_vector('sốt, ho, đau họng')
+        assert float(vector @ vector) == pytest.approx(1.0)
+        assert float(vector @ text_vector('sot ho dau hong')) == pytest.approx(1.0)
+        assert not text_vector('').any()
+
+    def test_paraphrase_closer_than_unrelated(self):
+        """Test câu diễn đạt lại gần hơn câu khác nghĩa"""
+        base = text_vector('sốt, ho, đau họng')
+        assert float(base @ text_vector('bị ho và sốt, rát họng')) >= 0.6
+        assert float(base @ text_vector('đau bụng, tiêu chảy')) < 0.6
+
+
+class TestSemanticCache:
+    """Test tra cứu theo tập triệu chứng và độ tương đồng"""
+
+    def test_paraphrase_hits(self):
+        """Test câu diễn đạt khác với cùng triệu chứng dùng lại câu trả lời"""
+        cache = SemanticCache(threshold=0.6, max_entries=8)
+        cache.store('sốt, ho, đau họng', 'trả lời', ['cough', 'sore_throat'], 'v1')
+        assert cache.lookup('bị ho và sốt, rát họng', ['sore_throat', 'cough'], 'v1') == 'trả lời'
+        assert cache.get_statistics()['hits'] == 1
+
+    def test_partitioned_by_symptoms_and_namespace(self):
+        """Test tập triệu chứng hoặc không gian tên khác thì không dùng lại"""
+        cache = SemanticCache(threshold=0.6, max_entries=8)
+        cache.store('sốt, ho, đau họng', 'trả lời', ['cough', 'sore_throat'], 'v1')
+        assert cache.lookup('sốt, ho, đau họng', ['cough'], 'v1') is None
+        assert cache.lookup('sốt, ho, đau họng', ['cough', 'sore_throat'], 'v2') is None
+        assert cache.get_statistics()['misses'] == 2
+
+    def test_threshold(self):
+        """Test độ tương đồng dưới ngưỡng thì không dùng lại"""
+        cache = SemanticCache(threshold=0.95, max_entries=8)
+        cache.store('sốt, ho, đau họng', 'trả lời', ['cough', 'sore_throat'])
+        assert cache.lookup('bị ho và sốt, rát họng', ['cough', 'sore_throat']) is None
+        assert cache.lookup('Sốt,  ho, đau họng', ['cough', 'sore_throat']) == 'trả lời'
+
+    def test_no_symptoms_not_cached(self):
+        """Test tin nhắn không có triệu chứng không được lưu"""
+        cache = SemanticCache(max_entries=8)
+        cache.store('xin chào', 'chào bạn', [])
+        assert len(cache) == 0
+        assert cache.lookup('xin chào', []) is None
+
+    def test_oldest_entry_replaced(self):
+        """Test mục cũ nhất bị thay khi đầy"""
+        cache = SemanticCache(threshold=0.9, max_entries=2)
+        cache.store('ho', '1', ['cough'])
+        cache.store('sốt', '2', ['fever'])
+        cache.store('đau đầu', '3', ['headache'])
+        assert len(cache) == 2
+        assert cache.lookup('ho', ['cough']) is None
+        assert cache.lookup('sốt', ['fever']) == '2'
+        assert cache.lookup('đau đầu', ['headache']) == '3'
+        cache.clear()
+        assert len(cache) == 0
+
+
+class TestReuseGuard:
+    """Test không dùng lại câu trả lời của bệnh nhân khác"""
+
+    @pytest.fixture
+    def extractor(self):
+        with open(KNOWLEDGE_BASE_PATH, encoding='utf-8') as f:
+            return SymptomExtractor(json.load(f)['symptoms'])
+
+    def test_similarity_alone_is_not_enough(self):
+        """Test phủ định, tuổi, mang thai gần như không làm giảm độ tương đồng"""
+        base = text_vector(BASE_MESSAGE)
+        scores = [float(base @ text_vector(text)) for text in OTHER_PATIENTS]
+        assert min(scores) >= 0.6
+
+    def test_risk_words_never_cached(self):
+        """Test tin nhắn có phủ định, tuổi hoặc mang thai không tra cứu và không được lưu"""
+        cache = SemanticCache(threshold=0.6, max_entries=8)
+        cache.store(BASE_MESSAGE, 'trả lời', ['cough', 'sore_throat'])
+        for text in OTHER_PATIENTS:
+            assert cache.lookup(text, ['cough', 'sore_throat']) is None
+            cache.store(text, 'khác', ['cough', 'sore_throat'])
+        assert len(cache) == 1
+
+    def test_reusable_message(self, extractor):
+        """Test chỉ tin nhắn gồm triệu chứng và từ đệm mới được dùng lại"""
+        def reusable(text):
+            return reusable_message(text, extractor.extract(text))
+
+        assert reusable('tôi bị ho và đau họng')
+        assert reusable('Tôi bị sổ mũi, hắt hơi')
+        assert reusable(BASE_MESSAGE)
+        assert not any(reusable(text) for text in OTHER_PATIENTS)
+        assert not reusable('tôi bị ho, đau họng từ tuần trước')
+        assert not reusable('xin chào')
+
+
+class TestHandlersUseSemanticCache:
+    """Test các handler dùng bộ đệm ngữ nghĩa ở lượt đầu"""
+
+    @pytest.fixture
+    def patched_genai(self):
+        with patch('google.generativeai.configure'), \
+             patch('google.generativeai.GenerativeModel') as model_class, \
+             patch.dict('os.environ', {'GEMINI_API_KEY': 'test-api-key'}):
+            model_class.return_value = MagicMock()
+            yield
+
+    def test_llm_handler(self, patched_genai):
+        """Test generate_diagnosis dùng lại câu trả lời khi chưa có lịch sử"""
+        from medical_llm_handler import MedicalLLMHandler
+        handler = MedicalLLMHandler(response_cache=ResponseCache(path=None), semantic_cache=SemanticCache(max_entries=8))
+        handler.model.generate_content.return_value = MagicMock(text='Có thể là cảm lạnh')
+        ids = ['cough', 'sore_throat']
+
+        first = handler.generate_diagnosis('sốt, ho, đau họng', 'ctx', symptom_ids=ids, knowledge_version='v1')
+        again = handler.generate_diagnosis('bị ho và sốt, rát họng', 'ctx', symptom_ids=ids, knowledge_version='v1')
+        assert first == again == 'Có thể là cảm lạnh'
+        assert handler.model.generate_content.call_count == 1
+
+        handler.generate_diagnosis('bị ho và sốt, rát họng', 'ctx', chat_history='User: chào', symptom_ids=ids)
+        handler.generate_diagnosis('bị ho và sốt, rát họng', 'ctx', symptom_ids=ids, knowledge_version='v2')
+        assert handler.model.generate_content.call_count == 3
+
+    def test_ai_handler_first_turn(self, patched_genai):
+        """Test diagnose dùng lại câu trả lời cho tin nhắn mở đầu"""
+        from medical_ai_handler import MedicalAIHandler
+        handler = MedicalAIHandler(semantic_cache=SemanticCache(max_entries=8))
+        session = handler.model.start_chat.return_value
+        session.send_message.return_value = MagicMock(text='Có thể là viêm họng')
+
+        assert handler.diagnose('tôi bị ho, đau họng') == 'Có thể là viêm họng'
+        handler.diagnose('tôi ho và bị đau họng')
+        assert session.send_message.call_count == 2
+
+        handler.reset_conversation()
+        assert handler.diagnose('tôi ho và bị đau họng') == 'Có thể là viêm họng'
+        assert session.send_message.call_count == 2
+        assert session.history[-1] == {'role': 'model', 'parts': ['Có thể là viêm họng']}
+
+    def test_ai_handler_other_patients(self, patched_genai):
+        """Test tin nhắn của bệnh nhân khác với cùng triệu chứng luôn gọi mô hình"""
+        from medical_ai_handler import MedicalAIHandler
+        handler = MedicalAIHandler(semantic_cache=SemanticCache(max_entries=8))
+        session = handler.model.start_chat.return_value
+        session.send_message.return_value = MagicMock(text='Có thể là viêm họng')
+
+        handler.diagnose('tôi bị ho, đau họng')
+        for text in ['tôi không bị ho nhưng đau họng',
+                     'con tôi 2 tuổi bị ho, đau họng',
+                     'tôi đang mang thai và bị ho, đau họng']:
+            handler.reset_conversation()
+            handler.diagnose(text)
+        assert session.send_message.call_count == 4
+        assert len(handler.semantic_cache) == 1
+
+    def test_engine_passes_ids_only_for_reusable_messages(self, patched_genai, tmp_path):
+        """Test DiagnosisEngine chỉ truyền mã triệu chứng cho bộ đệm khi tin nhắn dùng lại được"""
+        import shutil
+        from diagnosis_engine import DiagnosisEngine
+        from knowledge_manager import KnowledgeManager
+        from medical_llm_handler import MedicalLLMHandler
+        kb_path = tmp_path / 'knowledge_base.json'
+        shutil.copy(KNOWLEDGE_BASE_PATH, kb_path)
+        llm_handler = MedicalLLMHandler(response_cache=None, semantic_cache=SemanticCache(max_entries=8))
+        engine = DiagnosisEngine(KnowledgeManager(kb_path), llm_handler)
+
+        def cache_ids(text, chat_history=''):
+            analysis = engine.analyze_symptoms(text)
+            return engine._diagnosis_request(text, analysis, chat_history)['symptom_ids']
+
+        assert set(cache_ids('tôi bị ho và đau họng')) == {'cough', 'sore_throat'}
+        assert cache_ids('tôi bị ho và đau họng', chat_history='User: chào') == []
+        for text in OTHER_PATIENTS:
+            assert cache_ids(text) == []
+
+    def test_request_phrasings_reused(self, patched_genai, tmp_path):
+        """Test hai cách diễn đạt 'sốt, ho, đau họng' dùng chung một câu trả lời"""
+        import shutil
+        from diagnosis_engine import DiagnosisEngine
+        from knowledge_manager import KnowledgeManager
+        from medical_llm_handler import MedicalLLMHandler
+        kb_path = tmp_path / 'knowledge_base.json'
+        shutil.copy(KNOWLEDGE_BASE_PATH, kb_path)
+        llm_handler = MedicalLLMHandler(response_cache=None, semantic_cache=SemanticCache(max_entries=8))
+        llm_handler.model.generate_content.return_value = MagicMock(text='Có thể là cảm cúm')
+        knowledge_manager = KnowledgeManager(kb_path)
+        extractor = knowledge_manager.get_symptom_extractor()
+        engine = DiagnosisEngine(knowledge_manager, llm_handler)
+
+        answers = []
+        for text in ['sốt, ho, đau họng', 'bị ho và sốt, rát họng']:
+            assert reusable_message(text, extractor.extract(text))
+            request = engine._diagnosis_request(text, engine.analyze_symptoms(text), '')
+            assert set(request['symptom_ids']) == {'fever', 'cough', 'sore_throat'}
+            answers.append(llm_handler.generate_diagnosis(text, 'ctx', symptom_ids=request['symptom_ids']))
+        assert answers == ['Có thể là cảm cúm'] * 2
+        assert llm_handler.model.generate_content.call_count == 1
+
+    def test_emergency_not_cached(self, patched_genai):
+        """Test cảnh báo cấp cứu luôn được kiểm tra trước bộ đệm"""
+        from medical_ai_handler import MedicalAIHandler
+        handler = MedicalAIHandler(semantic_cache=SemanticCache(max_entries=8))
+        result = handler.diagnose('đau ngực dữ dội, khó thở')
+        assert 'CẤP CỨU' in result.upper() or '115' in result
+        assert len(handler.semantic_cache) == 0
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,192 @@
+"""
+Test Symptom Extractor
+Kiểm tra bộ trích xuất triệu chứng dùng cây tiền tố theo từ
+"""
+import pytest
+import shutil
+import sys
+from pathlib import Path
+from unittest.mock import patch
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from config import KNOWLEDGE_BASE_PATH
+from knowledge_manager import KnowledgeManager
+from symptom_extractor import SymptomExtractor, FuzzyPhraseIndex, bounded_edit_distance, surface_distance
+from utils import extract_symptoms_from_text
+
+
+@pytest.fixture
+def knowledge_manager(tmp_path):
+    """Knowledge manager on a copy of the knowledge base"""
+    kb_path = tmp_path / 'knowledge_base.json'
+    shutil.copy(KNOWLEDGE_BASE_PATH, kb_path)
+    return KnowledgeManager(kb_path)
+
+
+class TestSymptomExtractor:
+    """Test trích xuất triệu chứng"""
+
+    def test_extract_multi_word_phrases(self):
+        """Test trích xuất cụm nhiều từ và cụm lồng nhau"""
+        extractor = SymptomExtractor([
+            {'id': 'headache', 'name': 'Đau đầu'},
+            {'id': 'severe_headache', 'name': 'Đau đầu dữ dội'},
+            {'id': 'cough', 'name': 'Ho'}
+        ])
+        matches = extractor.extract("Tôi bị ĐAU ĐẦU DỮ DỘI và ho")
+        assert [m['symptom_id'] for m in matches] == ['headache', 'severe_headache', 'cough']
+
+    def test_whole_words_only(self):
+        """Test không khớp một phần của từ khác"""
+        extractor = SymptomExtractor([{'id': 'cough', 'name': 'Ho'}])
+        assert extractor.extract_names("cho tôi hỏi") == []
+
+    def test_punctuation_in_names(self):
+        """Test tên triệu chứng có dấu câu"""
+        extractor = SymptomExtractor([{'id': 'fever', 'name': 'Sốt cao (>38°C)'}])
+        assert extractor.extract_names("tôi bị sốt cao (>38°C) từ hôm qua") == ['Sốt cao (>38°C)']
+
+    def test_offsets(self):
+        """Test vị trí cụm triệu chứng trong câu"""
+        extractor = SymptomExtractor([{'id': 'sore_throat', 'name': 'Đau họng'}])
+        text = "Hôm nay bị đau họng"
+        match = extractor.extract(text)[0]
+        assert text[match['start']:match['end']] == 'đau họng'
+
+    def test_utils_wrapper(self):
+        """Test hàm extract_symptoms_from_text giữ nguyên giao diện"""
+        found = extract_symptoms_from_text("tôi bị ho và đau họng", ['Ho', 'Đau họng', 'Sốt'])
+        assert found == ['Ho', 'Đau họng']
+
+    def test_utils_wrapper_uses_manager_extractor(self, knowledge_manager):
+        """Test hàm tiện ích dùng bộ trích xuất đã biên dịch của KnowledgeManager"""
+        with patch('symptom_extractor.compile_symptom_names') as compile_symptom_names:
+            found = extract_symptoms_from_text("tôi bị ho và đau họng", knowledge_manager)
+            compile_symptom_names.assert_not_called()
+        assert found == ['Ho', 'Đau họng']
+
+
+class TestKnowledgeManagerExtractor:
+    """Test bộ trích xuất được gắn với phiên bản tri thức"""
+
+    def test_extractor_cached_per_version(self, knowledge_manager):
+        """Test bộ trích xuất chỉ được xây lại khi tri thức thay đổi"""
+        extractor = knowledge_manager.get_symptom_extractor()
+        assert knowledge_manager.get_symptom_extractor() is extractor
+
+        assert knowledge_manager.add_symptom({'id': 'hiccups', 'name': 'Nấc cụt', 'category': 'digestive'})
+        rebuilt = knowledge_manager.get_symptom_extractor()
+        assert rebuilt is not extractor
+        assert rebuilt.extract_names("bé bị nấc cụt") == ['Nấc cụt']
+
+
+class TestAliasIndex:
+    """Test chỉ mục bí danh và so khớp không dấu"""
+
+    def test_match_without_diacritics(self, knowledge_manager):
+        """Test người dùng gõ không dấu"""
+        extractor = knowledge_manager.get_symptom_extractor()
+        ids = [m['symptom_id'] for m in extractor.extract("toi bi dau hong va ngat mui")]
+        assert ids == ['sore_throat', 'nasal_congestion']
+
+    def test_conflicting_diacritics_rejected(self):
+        """Test 'họ' không bị hiểu nhầm thành 'ho'"""
+        extractor = SymptomExtractor([{'id': 'cough', 'name': 'Ho'}])
+        assert extractor.extract_names("họ nói vậy") == []
+        assert extractor.extract_names("tôi bị ho") == ['Ho']
+
+    def test_aliases_map_to_symptom(self, knowledge_manager):
+        """Test bí danh dân gian được quy về cùng một triệu chứng"""
+        extractor = knowledge_manager.get_symptom_extractor()
+        matches = extractor.extract("bị rát họng, nhức đầu")
+        assert [(m['symptom_id'], m['name']) for m in matches] == [
+            ('sore_throat', 'Đau họng'),
+            ('headache', 'Đau đầu')
+        ]
+
+    def test_ambiguous_phrases_not_aliases(self, knowledge_manager):
+        """Test cụm từ đa nghĩa hoặc tên bệnh không bị nhận là triệu chứng"""
+        extractor = knowledge_manager.get_symptom_extractor()
+        assert extractor.extract("hôm qua đi ngoài trời mưa") == []
+        assert extractor.extract("đang ăn kiêng để giảm cân") == []
+        assert extractor.extract("tôi bị viêm họng") == []
+        assert [m['symptom_id'] for m in extractor.extract("đi ngoài nhiều lần")] == ['diarrhea']
+        assert [m['symptom_id'] for m in extractor.extract("tôi bị sốt")] == ['fever']
+
+    def test_name_without_qualifier(self, knowledge_manager):
+        """Test tên bỏ phần chú thích trong ngoặc"""
+        assert knowledge_manager.lookup_symptom("sot cao")['id'] == 'fever'
+        assert knowledge_manager.lookup_symptom("Sốt nhẹ")['id'] == 'mild_fever'
+
+    def test_lookup_symptom(self, knowledge_manager):
+        """Test tra cứu triệu chứng theo tên, bí danh"""
+        assert knowledge_manager.lookup_symptom("Rát họng")['id'] == 'sore_throat'
+        assert knowledge_manager.lookup_symptom("không tồn tại") is None
+
+    def test_add_symptom_with_aliases(self, knowledge_manager):
+        """Test thêm triệu chứng kèm bí danh"""
+        assert not knowledge_manager.add_symptom(
+            {'id': 'hiccups', 'name': 'Nấc cụt', 'category': 'digestive', 'aliases': 'nấc'}
+        )
+        assert knowledge_manager.add_symptom(
+            {'id': 'hiccups', 'name': 'Nấc cụt', 'category': 'digestive', 'aliases': ['nấc']}
+        )
+        assert knowledge_manager.lookup_symptom("nac")['id'] == 'hiccups'
+
+
+class TestFuzzyMatching:
+    """Test so khớp gần đúng khi người dùng gõ sai chính tả"""
+
+    def test_bounded_edit_distance(self):
+        """Test khoảng cách chỉnh sửa có giới hạn"""
+        assert bounded_edit_distance("dau hong", "dau hongg", 2) == 1
+        assert bounded_edit_distance("dau hong", "tieu chay", 2) is None
+
+    def test_index_search(self):
+        """Test tìm cụm gần đúng qua chỉ mục trigram"""
+        index = FuzzyPhraseIndex(["dau hong", "nghet mui", "tieu chay"])
+        results = index.search("nghett mui")
+        assert results[0][0] == "nghet mui"
+        assert results[0][1] == 1
+        assert 0 < results[0][2] < 1
+
+    def test_short_query_ignored(self):
+        """Test không so khớp gần đúng với từ quá ngắn"""
+        index = FuzzyPhraseIndex(["ho"])
+        assert index.search("hoo") == []
+
+    def test_fuzzy_extract(self, knowledge_manager):
+        """Test trích xuất triệu chứng gõ sai chính tả"""
+        extractor = knowledge_manager.get_symptom_extractor()
+        assert extractor.extract("toi bi dau hongg") == []
+
+        matches = extractor.extract("toi bi dau hongg va nghet mui", fuzzy=True)
+        assert [m['symptom_id'] for m in matches] == ['sore_throat', 'nasal_congestion']
+        assert matches[0]['confidence'] < 1.0
+        assert matches[1]['confidence'] == 1.0
+
+    def test_fuzzy_lookup_confidence_threshold(self, knowledge_manager):
+        """Test ngưỡng độ tin cậy khi tra cứu gần đúng"""
+        extractor = knowledge_manager.get_symptom_extractor()
+        assert extractor.fuzzy_lookup("tieu chayy")[0]['symptom_id'] == 'diarrhea'
+        assert extractor.fuzzy_lookup("tieu chayy", min_confidence=0.95) == []
+
+    def test_surface_distance(self):
+        """Test bỏ dấu không bị tính, đổi dấu bị tính là một lỗi"""
+        assert surface_distance("ngua", "ngứa") == 0
+        assert surface_distance("ngừa", "ngứa") == 1
+        assert surface_distance("dau hongg", "đau họng") == 1
+
+    def test_fuzzy_rejects_conflicting_diacritics(self, knowledge_manager):
+        """Test 'phòng ngừa' không bị nhận nhầm là 'Ngứa'"""
+        extractor = knowledge_manager.get_symptom_extractor()
+        matches = extractor.extract("tôi muốn phòng ngừa bệnh", fuzzy=True)
+        assert 'itching' not in [m['symptom_id'] for m in matches]
+        assert all(entry['symptom_id'] != 'itching' for entry in extractor.fuzzy_lookup("ngừa"))
+        assert extractor.fuzzy_lookup("ngua")[0]['confidence'] == 1.0
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,140 @@
+"""
+Test Triage
+Kiểm tra bộ phân loại mức độ khẩn cấp dùng chung
+"""
+import pytest
+import sys
+from pathlib import Path
+from unittest.mock import patch, MagicMock
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from config import EMERGENCY_KEYWORDS, EMERGENCY_KEYWORD_TIERS
+from triage import TriageEngine, triage, triage_batch, format_emergency_warning
+
+
+class TestTriageEngine:
+    """Test phân loại theo mức độ"""
+
+    def test_critical_level(self):
+        """Test phát hiện mức nguy kịch"""
+        result = triage("Tôi bị đau ngực và khó thở")
+        assert result['level'] == 'critical'
+        assert result['is_emergency']
+        assert result['keywords'] == ['đau ngực', 'khó thở']
+
+    def test_most_severe_tier_wins(self):
+        """Test chọn mức nghiêm trọng nhất khi có nhiều từ khóa"""
+        result = triage("sốt kéo dài, tê bì tay, rồi co giật")
+        assert result['level'] == 'critical'
+        assert {m['tier'] for m in result['matches']} == {'watch', 'urgent', 'critical'}
+
+    def test_watch_level_is_not_emergency(self):
+        """Test mức theo dõi không kích hoạt cảnh báo"""
+        result = triage("Con tôi bị sốt kéo dài 3 ngày")
+        assert result['level'] == 'watch'
+        assert not result['is_emergency']
+        assert format_emergency_warning(result) is None
+
+    def test_high_fever_is_not_emergency(self):
+        """Test sốt cao (tên triệu chứng sốt thông thường) chỉ ở mức theo dõi"""
+        result = triage("Tôi bị sốt cao (>38°C)")
+        assert result['level'] == 'watch'
+        assert not result['is_emergency']
+
+    def test_no_match(self):
+        """Test tin nhắn bình thường"""
+        result = triage("Tôi bị sổ mũi")
+        assert result['level'] is None
+        assert result['matches'] == []
+
+    def test_custom_tiers(self):
+        """Test khởi tạo với danh sách từ khóa riêng"""
+        engine = TriageEngine({'critical': ['ngừng thở'], 'urgent': [], 'watch': ['ho']})
+        assert engine.triage("bé bị ngừng thở")['level'] == 'critical'
+        assert engine.triage("bé bị ho")['level'] == 'watch'
+
+    def test_emergency_keywords_match_tiers(self):
+        """Test EMERGENCY_KEYWORDS gồm các mức critical và urgent"""
+        expected = EMERGENCY_KEYWORD_TIERS['critical'] + EMERGENCY_KEYWORD_TIERS['urgent']
+        assert EMERGENCY_KEYWORDS == expected
+
+
+class TestTriageBatch:
+    """Test phân loại hàng loạt"""
+
+    def test_batch_matches_single(self):
+        """Test kết quả hàng loạt giống kết quả từng tin nhắn"""
+        texts = ["Tôi bị khó thở", "", "Tôi bị sổ mũi", "bi dot quy, te bi nua nguoi"]
+        assert triage_batch(texts) == [triage(t) for t in texts]
+
+    def test_batch_offsets_relative_to_text(self):
+        """Test vị trí từ khóa tính theo từng tin nhắn"""
+        texts = ["abc", "xyz đau ngực"]
+        match = triage_batch(texts)[1]['matches'][0]
+        assert texts[1][match['start']:match['end']] == 'đau ngực'
+
+    def test_symptoms_are_not_joined(self):
+        """Test không ghép nhầm từ khóa qua ranh giới hai triệu chứng"""
+        engine = TriageEngine({'critical': ['đau ngực'], 'urgent': [], 'watch': []})
+        assert not engine.triage_symptoms(['Đau', 'Ngực trái'])['is_emergency']
+        assert engine.triage_symptoms(['Ho', 'Đau ngực'])['matches'][0]['source'] == 1
+
+
+class TestHandlersShareTriage:
+    """Test hai handler dùng chung bộ phân loại"""
+
+    @patch('google.generativeai.configure')
+    @patch('google.generativeai.GenerativeModel')
+    def test_llm_handler_uses_shared_keywords(self, mock_model_class, mock_configure):
+        """Test MedicalLLMHandler nhận diện cùng danh sách từ khóa"""
+        with patch.dict('os.environ', {'GEMINI_API_KEY': 'test-api-key'}):
+            mock_model_class.return_value = MagicMock()
+
+            from medical_llm_handler import MedicalLLMHandler
+            handler = MedicalLLMHandler()
+
+            # 'đột quỵ' was missing from the old hard-coded list
+            warning = handler.check_emergency_symptoms(['Đột quỵ'])
+            assert warning is not None and "115" in warning
+            assert handler.triage_symptoms(['Ho'])['level'] is None
+
+
+class TestEngineTriage:
+    """Test DiagnosisEngine chỉ dừng chẩn đoán khi thực sự khẩn cấp"""
+
+    @pytest.fixture
+    def knowledge_manager(self, tmp_path):
+        import shutil
+        from config import KNOWLEDGE_BASE_PATH
+        from knowledge_manager import KnowledgeManager
+        kb_path = tmp_path / 'knowledge_base.json'
+        shutil.copy(KNOWLEDGE_BASE_PATH, kb_path)
+        return KnowledgeManager(kb_path)
+
+    def test_high_fever_gets_diagnosis(self, knowledge_manager):
+        """Test sốt cao thông thường vẫn được chẩn đoán"""
+        from diagnosis_engine import DiagnosisEngine
+        llm_handler = MagicMock()
+        engine = DiagnosisEngine(knowledge_manager, llm_handler)
+
+        analysis = engine.analyze_symptoms("tôi bị sốt cao, ho và đau họng")
+        assert 'fever' in analysis['symptom_ids']
+        assert analysis['emergency_warning'] is None
+        engine.generate_diagnosis("tôi bị sốt cao, ho và đau họng", analysis)
+        llm_handler.generate_diagnosis.assert_called_once()
+
+    def test_critical_symptom_still_stops(self, knowledge_manager):
+        """Test triệu chứng nguy kịch vẫn trả về cảnh báo khẩn cấp"""
+        from diagnosis_engine import DiagnosisEngine
+        llm_handler = MagicMock()
+        engine = DiagnosisEngine(knowledge_manager, llm_handler)
+
+        analysis = engine.analyze_symptoms("tôi bị sốt cao và khó thở")
+        assert '115' in engine.generate_diagnosis("tôi bị sốt cao và khó thở", analysis)
+        llm_handler.generate_diagnosis.assert_not_called()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])